@@ -0,0 +1,291 @@
+import curses
+import random
+
+from endcord import defaults
+
+DISCORD_EPOCH_MS = 1420070400000
+START_TIME_MS = 1735689600000  # 2025-01-01
+WORDS = (
+    "hello", "there", "endcord", "message", "test", "the", "a", "of", "terminal",
+    "**bold**", "*italic*", "__underline__", "`code`", "||spoiler||", "😀", "👍",
+    "<:custom:123456789012345678>", "https://example.com/some/path", "<t:1735689600:f>",
+)
+CODE_BLOCK = "```\ndef main():\n    return 0\n```"
+
+
+def snowflake(time_ms, increment=0):
+    """Generate snowflake from unix time in ms"""
+    return str(((time_ms - DISCORD_EPOCH_MS) << 22) + increment)
+
+
+def iso_time(time_ms):
+    """Generate discord-like timestamp string from unix time in ms"""
+    seconds = time_ms // 1000
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    day = min(days - 20089, 27) + 1   # days since 2025-01-01, fixtures dont span more than a month
+    return f"2025-01-{day:02d}T{hours:02d}:{minutes:02d}:{seconds:02d}.000000+00:00"
+
+
+def get_config():
+    """Get default config with theme"""
+    return {**defaults.settings, **defaults.theme}
+
+
+def get_colors():
+    """Get color pair ids in same shape as app passes them to formatter"""
+    colors = list(range(1, 9))
+    colors_formatted = []
+    for num in range(16):
+        colors_formatted.append([[21 + num], [40 + num, 0, 5]])
+    colors_formatted[4] = [[30]]
+    colors_formatted[5] = [[31]]
+    colors_formatted[6] = [[32]]
+    colors_formatted[12] = [[33]]
+    colors_formatted[13] = [[34]]
+    colors_formatted[14] = [[35]]
+    return colors, colors_formatted
+
+
+def make_users(count, seed=0):
+    """Generate users as they are in mentions and member list"""
+    rng = random.Random(seed)
+    users = []
+    for num in range(count):
+        users.append({
+            "id": snowflake(START_TIME_MS - 10**9, num),
+            "username": f"user_{num}",
+            "global_name": f"User {num}" if rng.random() > 0.3 else None,
+            "nick": f"Nick {num}" if rng.random() > 0.7 else None,
+        })
+    return users
+
+
+def make_roles(count, seed=0):
+    """Generate guild roles with color ids"""
+    rng = random.Random(seed)
+    roles = []
+    for num in range(count):
+        roles.append({
+            "id": snowflake(START_TIME_MS - 2 * 10**9, num),
+            "name": f"role_{num}",
+            "color": rng.randint(0, 0xFFFFFF),
+            "color_id": 100 + num,
+            "alt_color_id": 150 + num,
+        })
+    return roles
+
+
+def make_content(rng, users, roles, channels):
+    """Generate message content with markdown, mentions, emoji and urls"""
+    words = []
+    for _ in range(rng.choice((1, 3, 8, 20, 60))):
+        roll = rng.random()
+        if roll < 0.04:
+            words.append(f"<@{rng.choice(users)['id']}>")
+        elif roll < 0.06:
+            words.append(f"<@&{rng.choice(roles)['id']}>")
+        elif roll < 0.08:
+            words.append(f"<#{rng.choice(channels)['id']}>")
+        else:
+            words.append(rng.choice(WORDS))
+    content = " ".join(words)
+    roll = rng.random()
+    if roll < 0.1:
+        content = "> " + content
+    elif roll < 0.15:
+        content += "\n" + CODE_BLOCK
+    elif roll < 0.25:
+        content += "\nsecond line\nthird line"
+    return content
+
+
+def make_messages(count, users, roles, channels, seed=0):
+    """Generate messages, newest first, as they are in app message buffer"""
+    rng = random.Random(seed)
+    messages = []
+    time_ms = START_TIME_MS
+    for num in range(count):
+        time_ms += rng.randint(1000, 600000)
+        author = rng.choice(users)
+        message = {
+            "id": snowflake(time_ms, num),
+            "channel_id": channels[0]["id"],
+            "guild_id": None,
+            "timestamp": iso_time(time_ms),
+            "edited": rng.random() < 0.05,
+            "content": make_content(rng, users, roles, channels),
+            "mentions": rng.sample(users, 2),
+            "mention_roles": [],
+            "mention_everyone": False,
+            "user_id": author["id"],
+            "username": author["username"],
+            "global_name": author["global_name"],
+            "nick": None,
+            "referenced_message": None,
+            "reactions": [],
+            "embeds": [],
+            "stickers": [],
+            "interaction": None,
+        }
+        if messages and rng.random() < 0.15:
+            reference = rng.choice(messages[-20:])
+            message["referenced_message"] = {
+                "id": reference["id"],
+                "timestamp": reference["timestamp"],
+                "content": reference["content"],
+                "mentions": reference["mentions"],
+                "user_id": reference["user_id"],
+                "username": reference["username"],
+                "global_name": reference["global_name"],
+                "nick": None,
+                "embeds": [],
+            }
+        if rng.random() < 0.2:
+            message["reactions"].append({"emoji": "👍", "emoji_id": None, "count": rng.randint(1, 9), "me": rng.random() < 0.5})
+        if rng.random() < 0.1:
+            message["embeds"].append({"type": "image/png", "url": f"https://cdn.example.com/attachments/{num}/image.png", "hidden": False})
+        messages.append(message)
+    messages.reverse()
+    return messages
+
+
+def make_guilds(guild_count, channel_count, seed=0):
+    """Generate guilds in the same shape as debug.anonymize_guilds, with permissions computed"""
+    rng = random.Random(seed)
+    guilds = []
+    for num in range(guild_count):
+        channels = []
+        category_id = None
+        for num_ch in range(channel_count):
+            channel_id = snowflake(START_TIME_MS - 3 * 10**9, num * channel_count + num_ch)
+            if num_ch % 10 == 0:
+                category_id = channel_id
+                channel_type = 4
+                name = f"category_{num_ch}"
+                parent_id = None
+            else:
+                channel_type = rng.choice((0, 0, 0, 2, 5, 15))
+                name = f"channel_{num_ch}"
+                parent_id = category_id
+            channels.append({
+                "id": channel_id,
+                "type": channel_type,
+                "name": name,
+                "topic": "",
+                "parent_id": parent_id,
+                "position": num_ch,
+                "message_notifications": 0,
+                "muted": rng.random() < 0.1,
+                "hidden": False,
+                "collapsed": False,
+                "permitted": True,
+            })
+        guilds.append({
+            "guild_id": snowflake(START_TIME_MS - 4 * 10**9, num),
+            "owned": False,
+            "name": f"guild_{num}",
+            "description": "",
+            "suppress_everyone": False,
+            "suppress_roles": False,
+            "message_notifications": 0,
+            "muted": rng.random() < 0.1,
+            "channels": channels,
+        })
+    return guilds
+
+
+def make_dms(users):
+    """Generate one-on-one DMs with each user"""
+    dms = []
+    for num, user in enumerate(users):
+        dms.append({
+            "id": snowflake(START_TIME_MS - 5 * 10**9, num),
+            "type": 1,
+            "name": user["global_name"] or user["username"],
+            "recipients": [{"id": user["id"]}],
+            "muted": False,
+        })
+    return dms
+
+
+def make_read_state(guilds, dms, seed=0):
+    """Generate read state where some channels are unseen or mentioned"""
+    rng = random.Random(seed)
+    read_state = {}
+    channel_ids = [dm["id"] for dm in dms]
+    for guild in guilds:
+        channel_ids.extend(channel["id"] for channel in guild["channels"])
+    for channel_id in channel_ids:
+        last_message_id = snowflake(START_TIME_MS, rng.randint(0, 1000))
+        unseen = rng.random() < 0.3
+        read_state[channel_id] = {
+            "last_message_id": last_message_id,
+            "last_acked_message_id": snowflake(START_TIME_MS - 1000) if unseen else last_message_id,
+            "mentions": ["0"] if unseen and rng.random() < 0.3 else [],
+        }
+    return read_state
+
+
+def make_member_list(users, roles, seed=0):
+    """Generate member list with groups, as it is stored in gateway"""
+    rng = random.Random(seed)
+    member_list = [{"group": "online"}]
+    for user in users:
+        member_list.append({
+            **user,
+            "status": rng.choice(("online", "idle", "dnd", "offline")),
+            "roles": [role["id"] for role in rng.sample(roles, 3)],
+        })
+    member_list.append({"group": "offline"})
+    return member_list
+
+
+def make_emojis(guild_count, emoji_count):
+    """Generate guild emojis as they are used in assist"""
+    all_emojis = []
+    for num in range(guild_count):
+        all_emojis.append({
+            "guild_id": str(num),
+            "guild_name": f"guild_{num}",
+            "emojis": [{"id": str(num * emoji_count + i), "name": f"emoji_{num}_{i}"} for i in range(emoji_count)],
+        })
+    return all_emojis
+
+
+class FakeWindow:
+    """Curses window that only counts draw calls, used to time draw functions without terminal"""
+
+    def __init__(self, h, w):
+        self.h = h
+        self.w = w
+        self.calls = 0
+
+    def getmaxyx(self):
+        """Curses getmaxyx clone"""
+        return (self.h, self.w)
+
+    def insstr(self, _y, _x, _text, _attr=0):
+        """Curses insstr clone"""
+        self.calls += 1
+
+    def insch(self, _y, _x, _ch, _attr=0):
+        """Curses insch clone"""
+        self.calls += 1
+
+    def addstr(self, _y, _x, _text, _attr=0):
+        """Curses addstr clone"""
+        self.calls += 1
+
+    def addch(self, _y, _x, _ch, _attr=0):
+        """Curses addch clone"""
+        self.calls += 1
+
+
+def fake_color_pair(pair_id):
+    """Curses color_pair without initialized terminal"""
+    return pair_id << 8
+
+
+curses.color_pair = fake_color_pair
@@ -0,0 +1,244 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+MODES = ("python", "cython")
+THRESHOLD = 10  # percent slower than baseline that is reported as regression
+MIN_RUN_TIME = 0.2  # seconds, each benchmark is repeated until this time is reached
+
+
+def disable_cython():
+    """Make all endcord modules use pure python code"""
+    sys.modules["endcord_cython"] = None
+
+
+def have_cython():
+    """Check if cython extensions are built"""
+    return bool(importlib.util.find_spec("endcord_cython") and importlib.util.find_spec("endcord_cython.tui"))
+
+
+def measure(function, repeat):
+    """Call function until MIN_RUN_TIME is reached, repeat that, and return best time per call in ms"""
+    function()   # warmup
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_TIME or number >= 10000:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000 / number
+
+
+def setup_benchmarks(size):
+    """Prepare data and return dict of benchmark names and functions to be timed"""
+    from benchmarks import fixtures
+    from endcord import formatter, search, tui
+
+    config = fixtures.get_config()
+    colors, colors_formatted = fixtures.get_colors()
+    users = fixtures.make_users(50 * size)
+    roles = fixtures.make_roles(20 * size)
+    guilds = fixtures.make_guilds(10 * size, 50)
+    channels = guilds[0]["channels"]
+    messages = fixtures.make_messages(100 * size, users, roles, channels)
+    dms = fixtures.make_dms(users)
+    read_state = fixtures.make_read_state(guilds, dms)
+    member_list = fixtures.make_member_list(users, roles)
+    all_emojis = fixtures.make_emojis(10 * size, 50)
+    query_results = [{"id": user["id"], "username": user["username"], "name": user["global_name"]} for user in users]
+    member_roles = [{"user_id": user["id"], "primary_role_color": 100, "primary_role_alt_color": 150, "nick": user["nick"]} for user in users]
+    h, w = 50, 120
+
+    def generate_chat(render_cache=None):
+        return formatter.generate_chat(
+            messages, roles, channels, w, users[0]["id"], [], member_roles,
+            colors, colors_formatted, [], None, False, config, render_cache=render_cache,
+        )
+
+    render_cache = {}
+    generate_chat(render_cache)
+    chat, chat_format, _, _ = generate_chat()
+    attrib_map = [0] * 256
+
+    def draw_chat(drawn=None):
+        tui.draw_chat(fixtures.FakeWindow(h, w), h, w, chat, chat_format, 0, 5, attrib_map, 1, drawn)
+
+    drawn = [None] * h
+    draw_chat(drawn)
+
+    benchmarks = {
+        "formatter.generate_chat": generate_chat,
+        "formatter.generate_chat (cached)": lambda: generate_chat(render_cache),
+        "formatter.generate_tree": lambda: formatter.generate_tree(
+            dms, guilds, [], read_state, [], [], [], [], channels[1]["id"], config, max_w=40,
+        ),
+        "formatter.generate_member_list": lambda: formatter.generate_member_list(member_list, roles, 30, True, "▮"),
+        "search.search_channels_all": lambda: search.search_channels_all(guilds, dms, "chan 1", "goto chan 1"),
+        "search.search_usernames_roles": lambda: search.search_usernames_roles(roles, query_results, None, None, "user 1"),
+        "search.search_emojis": lambda: search.search_emojis(all_emojis, True, None, "emo 3"),
+        "tui.draw_chat": draw_chat,
+        "tui.draw_chat (unchanged)": lambda: draw_chat(drawn),
+    }
+
+    if importlib.util.find_spec("PIL") and importlib.util.find_spec("av"):
+        from PIL import Image
+
+        from endcord import media
+        img = Image.effect_mandelbrot((w, h), (-2, -1.5, 1, 1.5), 100).convert("RGB")
+        img_gray = img.convert("L")
+        img = img.quantize(colors=240)
+        benchmarks["media.img_to_term"] = lambda: media.img_to_term(img, img_gray, 0, " .,:;+*?%#@", 10, w, h, w, h)
+    return benchmarks
+
+
+def run_mode(mode, size, repeat, selected):
+    """Run all benchmarks in this process and return results in ms"""
+    if mode == "python":
+        disable_cython()
+    results = {}
+    for name, function in setup_benchmarks(size).items():
+        if selected and not any(text in name for text in selected):
+            continue
+        results[name] = measure(function, repeat)
+        print(f"  {name:<36} {results[name]:>10.3f} ms", file=sys.stderr)
+    return results
+
+
+def run_all(modes, size, repeat, selected):
+    """Run each mode in separate process so imported modules dont mix"""
+    results = {}
+    for mode in modes:
+        if mode == "cython" and not have_cython():
+            print("Cython extensions are not built, skipping cython benchmarks", file=sys.stderr)
+            continue
+        print(f"Running {mode} benchmarks", file=sys.stderr)
+        command = [sys.executable, "-m", "benchmarks.run", "--mode", mode, "--size", str(size), "--repeat", str(repeat), "--json"]
+        for text in selected:
+            command += ["--only", text]
+        output = subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results[mode] = json.loads(output)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print comparison with baseline and return list of regressions"""
+    regressions = []
+    for mode, mode_results in results.items():
+        base = baseline.get("results", {}).get(mode, {})
+        print(f"\n{mode}:")
+        for name, value in mode_results.items():
+            if name not in base:
+                print(f"  {name:<36} {value:>10.3f} ms")
+                continue
+            diff = (value - base[name]) / base[name] * 100
+            mark = ""
+            if diff > threshold:
+                mark = "  REGRESSION"
+                regressions.append(f"{mode}: {name}")
+            print(f"  {name:<36} {value:>10.3f} ms  {base[name]:>10.3f} ms  {diff:>+7.1f}%{mark}")
+    return regressions
+
+
+def parser():
+    """Setup argument parser for CLI"""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="benchmark endcord formatter, search, tui and media render paths",
+    )
+    parser._positionals.title = "arguments"
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        help="run only pure python or only cython benchmarks, default is both",
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=3,
+        help="scale of synthetic data, 1 is 100 messages and 10 guilds",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="number of repeats, best one is used",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        default=[],
+        help="run only benchmarks whose name contains this text, can be used multiple times",
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="save results as new baseline",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_PATH,
+        help="path to baseline json file",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="percent slower than baseline that is reported as regression",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print results as json, used internally",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parser()
+    sys.path.insert(0, ROOT)
+
+    if args.json:
+        print(json.dumps(run_mode(args.mode or "cython", args.size, args.repeat, args.only)))
+        sys.exit(0)
+
+    results = run_all((args.mode,) if args.mode else MODES, args.size, args.repeat, args.only)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("size") != args.size:
+            print(f"Baseline was made with size {baseline.get('size')}, not comparing", file=sys.stderr)
+            baseline = {}
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "size": args.size,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": results,
+            }, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmarks are more than {args.threshold}% slower than baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
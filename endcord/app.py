@@ -16,6 +16,7 @@ from datetime import datetime
 import emoji
 
 from endcord import (
+    channel_cache,
     client_properties,
     color,
     debug,
@@ -25,6 +26,7 @@ from endcord import (
     game_detection,
     gateway,
     log_queue,
+    message_store,
     parser,
     peripherals,
     perms,
@@ -68,6 +70,13 @@ INTERACTION_THROTTLING = 3  # delay between sending app interactions
 APP_COMMAND_AUTOCOMPLETE_DELAY = (
     0.3  # delay for requesting app command autocompletions after stop typing
 )
+MAIN_LOOP_TIMEOUT = 1  # max time main loop sleeps waiting for changes
+MAIN_LOOP_TIMEOUT_FAST = 0.1  # used when there are unsignaled changes (voice gateway, assist delay)
+MAIN_LOOP_MIN_INTERVAL = 0.05  # min interval between loop runs caused only by state changes (presence floods)
+PREFETCH_INTERVAL = 2  # min delay between background chat downloads, in seconds
+PREFETCH_CHANNEL_TYPES = (0, 1, 3, 11, 12)  # text, DM, group DM, threads
+ACK_BULK_SIZE = 200  # max number of channels acked in one bulk ack request
+DOWNLOAD_PROGRESS_INTERVAL = 1  # delay between download progress updates, in seconds
 MB = 1024 * 1024
 USER_UPLOAD_LIMITS = (
     10 * MB,
@@ -282,6 +291,16 @@ class Endcord:
             self.user_agent,
             proxy=config["proxy"],
         )
+        # persistent message cache
+        if config["message_store"]:
+            self.message_store = message_store.MessageStore(
+                os.path.join(
+                    peripherals.config_path, f"messages_{self.profiles['selected']}.db"
+                ),
+                max(config["limit_message_store"], 100),
+            )
+        else:
+            self.message_store = None
         # preload chat for faster startup
         self.preloaded = False
         self.need_preload = True
@@ -296,8 +315,11 @@ class Endcord:
         )
         # this takes some time, so let other things init in parallel
         threading.Thread(target=self.gateway.connect, daemon=True).start()
-        self.downloader = downloader.Downloader(config["proxy"])
+        self.downloader = downloader.Downloader(
+            config["proxy"], config["limit_downloads"]
+        )
         self.tui = tui.TUI(self.screen, self.config, keybindings, command_bindings)
+        self.tui.set_wakeup(self.gateway.mark_changed)
         if self.fun:
             today = (time.localtime().tm_mon, time.localtime().tm_mday)
             self.fun = 2 if (10, 25) <= today <= (11, 8) else self.fun
@@ -312,7 +334,20 @@ class Endcord:
         self.my_id = None  # will be taken from gateway in main()
         self.premium = None  # same
         self.my_user_data = None  # same
-        self.channel_cache = []
+        self.channel_cache = channel_cache.ChannelCache(
+            self.limit_channel_cache,
+            max(config["limit_channel_cache_memory"], 0) * 1024 * 1024,
+        )
+        self.prefetch = config["prefetch_channels"] and self.limit_channel_cache
+        self.prefetch_queue = queue.Queue()
+        self.prefetched = queue.Queue()
+        self.prefetch_pending = None
+        self.prefetch_time = 0
+        self.assist_jobs = queue.Queue()
+        self.assist_results = queue.Queue()
+        self.assist_cancel = None  # threading.Event of newest assist search
+        self.assist_streaming = None
+        self.download_progress_time = 0
         self.voice_gateway = None
         self.reset()
         self.chat.insert(0, f"Connecting to {self.config['custom_host'] or 'Discord'}")
@@ -331,6 +366,7 @@ class Endcord:
         self.tree = []
         self.tree_format = []
         self.tree_metadata = []
+        self.tree_index = {}  # object_id: tree_pos
         self.uncollapsed_threads = []
         self.my_roles = []
         self.deleted_cache = []
@@ -379,6 +415,7 @@ class Endcord:
         """Handling Ctrl-C event"""
         if self.terminal_media:
             self.terminal_media.stop_playback()
+        self.flush_acks()
         self.gateway.disconnect_ws()
         self.run = False
         try:
@@ -599,12 +636,13 @@ class Endcord:
         self.new_unreads = False
         self.this_unread = False
         self.chat_map = []
+        self.chat_render_cache = {}
         if self.my_user_data:
             self.update_prompt()
         self.typing = []
         self.typing_sent = int(time.time())
         self.sent_ack_time = time.time() - self.ack_throttling
-        self.pending_acks = []
+        self.pending_acks = {}  # channel_id: message_id
         self.last_message_id = 0
         self.my_activities = []
         self.chat_end = False
@@ -619,6 +657,7 @@ class Endcord:
         self.member_roles = []
         self.current_member_roles = []
         self.threads = []
+        self.threads_index = {}  # thread_id: thread
         self.activities = []
         self.search_messages = []
         self.members = []
@@ -632,6 +671,7 @@ class Endcord:
         self.guild_commands_permitted = []
         self.pinned = []
         self.missing_members_nonce = None
+        self.prefetch_skip = set()
         self.forum = False
         self.disable_sending = False
         self.extra_line = None
@@ -665,19 +705,14 @@ class Endcord:
                 "afk": False,
                 "client_state": "OFFLINE",
             }
-        for num, _ in enumerate(self.channel_cache):
-            if self.channel_cache[num][2]:
-                if len(self.channel_cache[num]) < 4:
-                    self.channel_cache[num].append(True)
-                else:
-                    self.channel_cache[num][3] = True  # mark as invalid
-            else:
-                _ = self.channel_cache.pop(num)
+        self.channel_cache.invalidate()
 
     def reconnect(self):
         """Fetch updated data from gateway and rebuild chat after reconnecting"""
         self.add_running_task(_("reconnecting"), 1)
         self.reset(online=True)
+        if self.message_store:
+            self.message_store.reset_live()  # some new messages might have been missed
         self.premium = self.gateway.get_premium()
         guilds = self.gateway.get_guilds()
         if guilds:
@@ -735,10 +770,9 @@ class Endcord:
         """Load dms and remove spam"""
         self.dms, self.dms_vis_id = self.gateway.get_dms()
         if self.hide_spam:
-            for dm in self.dms:
-                if dm["is_spam"]:
-                    self.dms_vis_id.remove(dm["id"])
-                    self.dms.remove(dm)
+            for dm in [dm for dm in self.dms if dm["is_spam"]]:
+                self.dms_vis_id.remove(dm["id"])
+                self.gateway.remove_dm(dm["id"])
 
     def switch_channel(
         self,
@@ -917,9 +951,7 @@ class Endcord:
         self.selected_attachment = 0
         self.gateway.subscribe(channel_id, guild_id)
         self.tui.reset_chat_scrolled_top()
-        self.gateway.set_subscribed_channels(
-            [x[0] for x in self.channel_cache] + [channel_id]
-        )
+        self.gateway.set_subscribed_channels(self.channel_cache.ids() + [channel_id])
         if self.recording:
             self.recording = False
             _ = recorder.stop()
@@ -1041,6 +1073,7 @@ class Endcord:
 
         self.remove_running_task("Switching channel", 1)
         logger.debug("Channel switching complete")
+        logger.debug(self.channel_cache.get_stats())
 
     def blank_chat(self):
         """Switch to None mode, no open channel, no chat displayed"""
@@ -1201,34 +1234,19 @@ class Endcord:
         if refresh:
             parent_hint = self.current_channel.get("parent_id")
 
-        for this_guild in self.guilds:
-            if this_guild["guild_id"] == guild_id:
-                self.current_channels = this_guild["channels"]
-                break
+        this_guild = self.gateway.get_guild(guild_id)
+        if this_guild:
+            self.current_channels = this_guild["channels"]
         else:
             self.current_channels = []
             this_guild = {}
 
         # update channel
-        self.current_channel = {}
-        for channel in self.current_channels:
-            if channel["id"] == channel_id:
-                self.current_channel = channel
-                break
+        self.current_channel = self.gateway.get_channel(channel_id, guild_id) or {}
 
         # check threads if no channel
-        else:
-            if parent_hint:  # thread will have parent_hint
-                for guild in self.threads:
-                    if guild["guild_id"] == guild_id:
-                        for channel in guild["channels"]:
-                            if channel["channel_id"] == parent_hint:
-                                for thread in channel["threads"]:
-                                    if thread["id"] == channel_id:
-                                        self.current_channel = thread
-                                        break
-                                break
-                        break
+        if not self.current_channel and parent_hint:  # thread will have parent_hint
+            self.current_channel = self.threads_index.get(channel_id, {})
 
         # update current guild properties
         if this_guild:
@@ -1255,38 +1273,30 @@ class Endcord:
 
     def select_current_member_roles(self):
         """Select member roles for currently active guild and check for missing primary role colors"""
-        if not self.active_channel["guild_id"]:
+        guild_id = self.active_channel["guild_id"]
+        if not guild_id:
             self.current_member_roles = []
             return
-        for guild in self.member_roles:
-            if guild["guild_id"] == self.active_channel["guild_id"]:
-                if self.username_role_colors:
-                    # add my roles if missing
-                    for member in guild["members"]:
-                        if member["user_id"] == self.my_id:
-                            break
-                    else:
-                        guild["members"].append(
-                            {
-                                "user_id": self.my_id,
-                                "roles": self.current_my_roles,
-                            }
-                        )
-                    # select colors
-                    for member in guild["members"]:
-                        if "primary_role_color" not in member:
-                            member_roles = member["roles"]
-                            for role in self.current_roles:
-                                if role["id"] in member_roles:
-                                    member["primary_role_color"] = role.get("color_id")
-                                    member["primary_role_alt_color"] = role.get(
-                                        "alt_color_id"
-                                    )
-                                    break
-                self.current_member_roles = guild["members"]
-                break
-        else:
+        members = self.gateway.get_guild_members(guild_id)
+        if members is None:
             self.current_member_roles = []
+            return
+        if self.username_role_colors:
+            # add my roles if missing
+            if not self.gateway.get_member(guild_id, self.my_id):
+                self.gateway.add_member_roles(
+                    guild_id, self.my_id, self.current_my_roles
+                )
+            # select colors
+            for member in members:
+                if "primary_role_color" not in member:
+                    member_roles = member["roles"]
+                    for role in self.current_roles:
+                        if role["id"] in member_roles:
+                            member["primary_role_color"] = role.get("color_id")
+                            member["primary_role_alt_color"] = role.get("alt_color_id")
+                            break
+        self.current_member_roles = members
 
     def add_to_store(self, channel_id, text):
         """Adds entry to input line store"""
@@ -1317,15 +1327,12 @@ class Endcord:
 
     def add_to_channel_cache(self, channel_id, messages, set_pinned):
         """Add messages to channel cache"""
-        # format: channel_cache = [[channel_id, messages, pinned, *invalid], ...]
         # skipping deleted because they are separately cached
         if self.limit_channel_cache:
-            pinned = 0
-            for channel in self.channel_cache:
-                if channel[2]:
-                    pinned += 1
-            if pinned >= self.limit_channel_cache:  # skip if all are pinned
-                return
+            if self.channel_cache.is_full() and channel_id not in self.channel_cache:
+                return  # skip if all are pinned
+            # chat shorter than one chunk is whole channel history
+            complete = bool(messages) and len(messages) < self.msg_num
             messages = [x for x in messages if not x.get("deleted")]
             if (
                 self.get_chat_last_message_id() == self.last_message_id
@@ -1333,39 +1340,27 @@ class Endcord:
                 messages = messages[: self.msg_num]
             else:
                 messages = []
-            for num, channel in enumerate(self.channel_cache):
-                if channel[0] == channel_id:
-                    self.channel_cache[num] = [channel_id, messages, set_pinned]
-                    break
-            else:
-                self.channel_cache.append([channel_id, messages, set_pinned])
-                if len(self.channel_cache) > self.limit_channel_cache:
-                    for num, channel in enumerate(self.channel_cache):
-                        if not channel[2]:  # dont remove pinned
-                            self.channel_cache.pop(num)
-                            break
+                complete = False
+            self.channel_cache.put(channel_id, messages, set_pinned, complete)
 
     def load_from_channel_cache(self, channel_id):
         """Load messages from channel cache"""
         if not self.limit_channel_cache:
             return False
-        for num, channel in enumerate(self.channel_cache):
-            if channel[0] == channel_id and not (len(channel) > 3 and channel[3]):
-                break
-        else:
+        cached = self.channel_cache.get(channel_id)
+        if not cached:
             return False
-        if self.channel_cache[num][2]:
-            cached = self.channel_cache[num]
-        else:
-            cached = self.channel_cache.pop(num)
-        if cached[1] and len(cached[1]) >= self.msg_num - 10:
-            self.messages = cached[1]
+        # unpinned are taken out, they are added again when switching away
+        if not cached[1]:
+            self.channel_cache.pop(channel_id)
+        if cached[0] and (len(cached[0]) >= self.msg_num - 10 or cached[3]):
+            self.messages = cached[0]
         else:
             new_messages = self.get_messages_with_members(num=self.msg_num)
             if new_messages is None:
                 return True
             self.messages = new_messages
-        self.active_channel["pinned"] = cached[2]
+        self.active_channel["pinned"] = cached[1]
 
         if self.messages:
             self.last_message_id = self.get_chat_last_message_id()
@@ -1382,18 +1377,12 @@ class Endcord:
         )
         return True
 
-    def remove_channel_cache(self, num=None, active=False):
+    def remove_channel_cache(self, channel_id=None, active=False):
         """Remove cached channel"""
-        if active and num is None:
-            for num_cache, channel in enumerate(self.channel_cache):
-                if channel[0] == self.active_channel["channel_id"]:
-                    num = num_cache
-                    break
-        if num is not None:
-            try:
-                self.channel_cache.pop(num)
-            except IndexError:
-                pass
+        if active and channel_id is None:
+            channel_id = self.active_channel["channel_id"]
+        if channel_id is not None:
+            self.channel_cache.pop(channel_id)
 
     def toggle_tab(self):
         """Toggle tabbed state of currently active channel"""
@@ -1401,21 +1390,12 @@ class Endcord:
             if self.active_channel.get("pinned"):
                 self.active_channel["pinned"] = False
                 self.remove_channel_cache(active=True)
+            elif self.channel_cache.is_full():  # if all are pinned
+                self.update_extra_line("Can't add tab: channel cache limit reached.")
             else:
-                pinned = 0
-                for channel in self.channel_cache:
-                    if channel[2]:
-                        pinned += 1
-                if pinned >= self.limit_channel_cache:  # if all are pinned
-                    self.update_extra_line(
-                        "Can't add tab: channel cache limit reached."
-                    )
-                else:
-                    self.active_channel["pinned"] = True
+                self.active_channel["pinned"] = True
             if self.config["remember_tabs"]:
-                tabbed_channels = [
-                    channel[0] for channel in self.channel_cache if channel[2]
-                ]
+                tabbed_channels = self.channel_cache.tabs.copy()
                 if self.active_channel["pinned"]:
                     tabbed_channels.append(self.active_channel["channel_id"])
                 self.state["tabbed_channels"] = tabbed_channels
@@ -1490,16 +1470,16 @@ class Endcord:
 
     def channel_name_from_id(self, channel_id):
         """Get channel name from its id"""
-        for channel in self.current_channels:
-            if channel["id"] == channel_id:
+        guild_id = self.active_channel["guild_id"]
+        if guild_id:
+            channel = self.gateway.get_channel(channel_id, guild_id)
+            if channel:
                 return channel["name"]
         return None
 
     def tree_pos_from_id(self, object_id):
         """Get object position in tree from its id"""
-        for tree_pos, obj in enumerate(self.tree_metadata):
-            if obj and obj["id"] == object_id:
-                return tree_pos
+        return self.tree_index.get(object_id)
 
     def wait_input(self, forced_binding=None):
         """Thread that handles: getting input, formatting, sending, replying, editing, deleting message and switching channel"""
@@ -1507,6 +1487,8 @@ class Endcord:
         ephemeral = False
 
         while self.run and not ephemeral:
+            # previous action is processed, wake main loop so it can react to it
+            self.gateway.mark_changed("state")
             if self.reacting["id"]:
                 self.restore_input_text = (self.restore_input_text[0], "react")
             if forced_binding:  # externally forced binding
@@ -4189,13 +4171,9 @@ class Endcord:
             peripherals.save_json(self.state, f"state_{self.profiles['selected']}.json")
 
         elif cmd_type == 68:  # REMOVE_ALL_TABS
-            for channel in reversed(self.channel_cache):
-                if channel[2] is True:
-                    self.channel_cache.remove(channel)
+            self.channel_cache.remove_pinned()
             if self.config["remember_tabs"]:
-                tabbed_channels = [
-                    channel[0] for channel in self.channel_cache if channel[2]
-                ]
+                tabbed_channels = self.channel_cache.tabs.copy()
                 if self.active_channel["pinned"]:
                     tabbed_channels.append(self.active_channel["channel_id"])
                 self.state["tabbed_channels"] = tabbed_channels
@@ -4429,21 +4407,20 @@ class Endcord:
 
     def find_parents_from_id(self, channel_id):
         """Find channel parents from its id"""
-        for guild in self.guilds:
-            for channel in guild["channels"]:
-                if channel["id"] == channel_id:
-                    return (
-                        channel_id,
-                        channel["name"],
-                        guild["guild_id"],
-                        guild["name"],
-                        channel["parent_id"],
-                    )
+        guild = self.gateway.get_channel_guild(channel_id)
+        if guild:
+            channel = self.gateway.get_channel(channel_id)
+            return (
+                channel_id,
+                channel["name"],
+                guild["guild_id"],
+                guild["name"],
+                channel["parent_id"],
+            )
         # check dms
-        for dm in self.dms:
-            if dm["id"] == channel_id:
-                name = dm["name"]
-                return channel_id, name, None, None, None
+        dm = self.gateway.get_dm(channel_id)
+        if dm:
+            return channel_id, dm["name"], None, None, None
         return None, None, None, None, None
 
     def go_bottom(self):
@@ -4482,14 +4459,9 @@ class Endcord:
 
     def switch_tab(self, select_num):
         """Switch to specified tab number if it is available"""
-        num = 0
         channel_id = None
-        for channel in self.channel_cache:
-            if channel[2]:
-                if num == select_num:
-                    channel_id = channel[0]
-                    break
-                num += 1
+        if 0 <= select_num < len(self.channel_cache.tabs):
+            channel_id = self.channel_cache.tabs[select_num]
         if channel_id:
             channel_id, channel_name, guild_id, guild_name, parent_hint = (
                 self.find_parents_from_id(channel_id)
@@ -4883,7 +4855,8 @@ class Endcord:
                                 os.path.dirname(self.downloads_path), exist_ok=True
                             )
                         destination = os.path.join(self.downloads_path, filename)
-                        shutil.move(path, destination)
+                        if os.path.exists(path):  # same download requested twice
+                            shutil.move(path, destination)
                     else:
                         destination = path
                 else:
@@ -5043,7 +5016,15 @@ class Endcord:
     def get_messages_with_members(self, num=50, before=None, after=None, around=None):
         """Get messages, check for missing members, request and wait for member chunk, and update local member list"""
         channel_id = self.active_channel["channel_id"]
-        messages = self.discord.get_messages(channel_id, num, before, after, around)
+        read_state = self.read_state.get(channel_id)
+        messages = self.get_messages_stored(
+            channel_id,
+            num,
+            before,
+            after,
+            around,
+            last_message_id=read_state["last_message_id"] if read_state else None,
+        )
         if messages is None:  # network error
             self.gateway.set_offline()
             self.update_extra_line("Network error.")
@@ -5066,6 +5047,90 @@ class Endcord:
         self.request_missing_members(current_guild, messages)
         return messages
 
+    def get_messages_stored(
+        self, channel_id, num, before=None, after=None, around=None, last_message_id=None
+    ):
+        """
+        Get messages from message store if they are all stored, otherwise download and store them.
+        Newest messages are downloaded once per session for each channel, then only newer messages are downloaded.
+        """
+        store = self.message_store
+        if not store:
+            return self.discord.get_messages(channel_id, num, before, after, around)
+
+        if before and not (after or around):
+            messages = store.get_before(channel_id, before, num)
+            if messages is not None:
+                return messages
+
+        elif not (before or after or around):
+            messages = store.get_latest(channel_id, num, last_message_id)
+            if messages is not None:
+                return messages
+            newest_id = store.get_newest_id(channel_id)
+            if newest_id and channel_id in store.live:  # only missed some new messages
+                new_messages = self.discord.get_messages(channel_id, 100, after=newest_id)
+                if new_messages is None:  # network error
+                    return None
+                store.save(channel_id, new_messages, 100, after=newest_id)
+                if len(new_messages) < 100:  # no gap between stored and new messages
+                    messages = store.get_latest(
+                        channel_id,
+                        num,
+                        new_messages[0]["id"] if new_messages else newest_id,
+                    )
+                    if messages is not None:
+                        return messages
+
+        messages = self.discord.get_messages(channel_id, num, before, after, around)
+        if messages:
+            store.save(channel_id, messages, num, before, after, around)
+        elif messages is not None and before:
+            store.save(channel_id, messages, num, before)  # reached channel start
+        return messages
+
+    def store_message_event(self, new_message):
+        """Apply message event to message store"""
+        data = new_message["d"]
+        op = new_message["op"]
+        channel_id = data["channel_id"]
+        if op == "MESSAGE_CREATE":
+            self.message_store.add_new(channel_id, data)
+        elif op == "MESSAGE_DELETE":
+            self.message_store.delete(channel_id, data["id"])
+        elif op in ("MESSAGE_UPDATE", "MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE"):
+            stored = self.message_store.get_message(channel_id, data["id"])
+            if not stored:
+                return
+            if op == "MESSAGE_UPDATE":
+                for element in MESSAGE_UPDATE_ELEMENTS:
+                    stored[element] = data[element]
+            else:
+                add = op == "MESSAGE_REACTION_ADD"
+                for reaction in stored["reactions"]:
+                    if (
+                        data["emoji_id"] == reaction["emoji_id"]
+                        and data["emoji"] == reaction["emoji"]
+                    ):
+                        reaction["count"] += 1 if add else -1
+                        if data["user_id"] == self.my_id:
+                            reaction["me"] = add
+                        if reaction["count"] <= 0:
+                            stored["reactions"].remove(reaction)
+                        break
+                else:
+                    if not add:
+                        return
+                    stored["reactions"].append(
+                        {
+                            "emoji": data["emoji"],
+                            "emoji_id": data["emoji_id"],
+                            "count": 1,
+                            "me": data["user_id"] == self.my_id,
+                        }
+                    )
+            self.message_store.update(channel_id, stored)
+
     def request_missing_members(self, current_guild, messages):
         """Loop through all messages and download missing members"""
         if not current_guild:
@@ -5078,10 +5143,7 @@ class Endcord:
             message_user_id = message["user_id"]
             if message_user_id in missing_members:
                 continue
-            for member in self.current_member_roles:
-                if member["user_id"] == message_user_id:
-                    break
-            else:
+            if not self.gateway.get_member(current_guild, message_user_id):
                 missing_members.append(message_user_id)
 
         # request missing members
@@ -5263,11 +5325,127 @@ class Endcord:
                 self.chat_end = True
         self.remove_running_task("Downloading forum", 4)
 
+    def prefetch_worker(self):
+        """Download chats requested by schedule_prefetch, should be run in a thread"""
+        while self.run:
+            channel_id = self.prefetch_queue.get()
+            try:
+                messages = self.get_messages_stored(channel_id, self.msg_num)
+            except Exception as e:
+                logger.error(f"Failed prefetching channel {channel_id}: {e}")
+                messages = None  # so prefetching is not stuck as pending
+            self.prefetched.put((channel_id, messages))
+
+    def needs_prefetch(self, channel_id):
+        """Check if channel chat should be downloaded in background"""
+        return (
+            channel_id != self.active_channel["channel_id"]
+            and channel_id not in self.prefetch_skip
+            and self.channel_cache.needs_fetch(channel_id)
+        )
+
+    def get_prefetch_candidate(self):
+        """Get channel that is likely to be opened next and is not cached"""
+        # tabs that are not loaded yet
+        for channel_id in self.channel_cache.tabs:
+            if self.needs_prefetch(channel_id):
+                return channel_id
+        if not self.channel_cache.has_free_slot():
+            return None
+        # channels with unread mentions
+        for channel_id, channel in self.read_state.items():
+            if channel.get("mentions") and self.needs_prefetch(channel_id):
+                return channel_id
+        # channels next to tree selection
+        tree_sel = self.tui.get_tree_selected()
+        if tree_sel is None:
+            return None
+        for num in (tree_sel + 1, tree_sel - 1):
+            if 0 <= num < len(self.tree_metadata):
+                channel = self.tree_metadata[num]
+                if (
+                    channel
+                    and channel["type"] in PREFETCH_CHANNEL_TYPES
+                    and self.needs_prefetch(channel["id"])
+                ):
+                    return channel["id"]
+        return None
+
+    def schedule_prefetch(self):
+        """Send next likely to be opened channel to prefetch worker, only when idle and not rate limited"""
+        now = time.time()
+        if (
+            self.prefetch_pending
+            or now - self.prefetch_time < PREFETCH_INTERVAL
+            or now < self.discord.ratelimit_until
+            or self.my_status["client_state"] != "online"
+            or self.tui.get_my_typing()
+        ):
+            return
+        channel_id = self.get_prefetch_candidate()
+        if channel_id:
+            self.prefetch_pending = channel_id
+            self.prefetch_time = now
+            self.prefetch_queue.put(channel_id)
+
+    def process_prefetched(self):
+        """Add chat downloaded by prefetch worker to channel cache and request its missing members"""
+        try:
+            channel_id, messages = self.prefetched.get_nowait()
+        except queue.Empty:
+            return
+        self.prefetch_pending = None
+        if messages is None:  # network error, will be tried again
+            return
+        # skip channels that cant be cached or that got new messages while downloading
+        read_state = self.read_state.get(channel_id)
+        if (
+            not messages
+            or channel_id == self.active_channel["channel_id"]
+            or (
+                read_state
+                and read_state["last_message_id"]
+                and int(read_state["last_message_id"]) > int(messages[0]["id"])
+            )
+            or (
+                channel_id not in self.channel_cache
+                and not self.channel_cache.has_free_slot()
+            )
+        ):
+            self.prefetch_skip.add(channel_id)
+            return
+        if self.emoji_as_text:
+            for num, message in enumerate(messages):
+                messages[num] = formatter.demojize_message(message)
+        self.channel_cache.put(
+            channel_id,
+            messages,
+            channel_id in self.channel_cache.tabs,
+            complete=len(messages) < self.msg_num,
+            recent=False,
+        )
+        self.gateway.set_subscribed_channels(
+            self.channel_cache.ids() + [self.active_channel["channel_id"]]
+        )
+        logger.debug(f"Prefetched chat for channel {channel_id}")
+
+        # request missing members so roles are ready when switching
+        guild = self.gateway.get_channel_guild(channel_id)
+        if guild:
+            missing_members = []
+            for message in messages:
+                user_id = message["user_id"]
+                if user_id not in missing_members and not self.gateway.get_member(
+                    guild["guild_id"], user_id
+                ):
+                    missing_members.append(user_id)
+            self.gateway.request_members(guild["guild_id"], missing_members)
+
     def preload_chat(self):
         """Download chat before switching channel to allow faster switching, used for initial chat when starting up"""
         self.state = peripherals.load_json(f"state_{self.profiles['selected']}.json")
         if self.state and self.state["last_channel_id"]:
-            messages = self.discord.get_messages(
+            messages = self.get_messages_stored(
                 self.state["last_channel_id"], self.msg_num
             )
             if messages is None:  # network error
@@ -5830,27 +6008,14 @@ class Endcord:
     def assist(self, assist_word, assist_type, query_results=None):
         """Assist when typing: channel, username, role, emoji and sticker"""
         self.assist_type = assist_type
-        self.assist_found = []
 
-        if assist_type == 1:  # channels
-            if not self.command:  # current guild channels
-                self.assist_found = search.search_channels_guild(
-                    self.current_channels,
-                    assist_word,
-                    limit=self.assist_limit,
-                    score_cutoff=self.assist_score_cutoff,
-                )
-            else:  # all guilds, channels, and dms
-                self.assist_found = search.search_channels_all(
-                    self.guilds,
-                    self.dms,
-                    assist_word,
-                    self.tui.input_buffer,
-                    limit=self.assist_limit,
-                    score_cutoff=self.assist_score_cutoff,
-                )
+        if assist_type in (1, 3):  # channels and emoji are searched in worker
+            self.set_assist_word(assist_word)
+            self.submit_assist(assist_word, assist_type)
+            return
 
-        elif assist_type == 2:  # username/role
+        self.assist_found = []
+        if assist_type == 2:  # username/role
             self.assist_found = search.search_usernames_roles(
                 self.current_roles,
                 query_results,
@@ -5862,17 +6027,6 @@ class Endcord:
                 score_cutoff=self.assist_score_cutoff,
             )
 
-        elif assist_type == 3:  # emoji
-            self.assist_found = search.search_emojis(
-                self.gateway.get_emojis(),
-                self.premium,
-                self.active_channel["guild_id"],
-                assist_word,
-                safe_emoji=self.emoji_as_text,
-                limit=self.assist_limit,
-                score_cutoff=self.assist_score_cutoff,
-            )
-
         elif assist_type == 4:  # sticker
             if self.config["default_stickers"]:
                 default_stickers = self.discord.get_stickers()
@@ -6035,18 +6189,109 @@ class Endcord:
             else:
                 self.assist_found.append(("Provided path is invalid", True))
 
-        max_w = self.tui.get_dimensions()[2][1]
-        extra_title, extra_body = formatter.generate_extra_window_assist(
-            self.assist_found, assist_type, max_w
-        )
-        self.extra_window_open = True
+        self.set_assist_word(assist_word)
+        self.draw_assist(assist_type)
+
+    def set_assist_word(self, assist_word):
+        """Set word being assisted, backup extra window if assist is opened over it"""
         if (self.search or self.search_gif or self.command) and not (
             self.assist_word or self.assist_word == " "
         ):
             self.extra_bkp = (self.tui.extra_window_title, self.tui.extra_window_body)
         self.assist_word = assist_word
+
+    def draw_assist(self, assist_type):
+        """Draw found assist results in extra window"""
+        max_w = self.tui.get_dimensions()[2][1]
+        extra_title, extra_body = formatter.generate_extra_window_assist(
+            self.assist_found, assist_type, max_w
+        )
+        self.extra_window_open = True
         self.tui.draw_extra_window(extra_title, extra_body, select=True)
 
+    def submit_assist(self, assist_word, assist_type):
+        """Cancel running assist search and send new one to assist worker"""
+        if self.assist_cancel:
+            self.assist_cancel.set()
+        self.assist_cancel = threading.Event()
+        self.assist_jobs.put(
+            (assist_word, assist_type, self.tui.input_buffer, self.assist_cancel)
+        )
+
+    def assist_worker(self):
+        """Run assist searches sent by submit_assist, should be run in a thread"""
+        while self.run:
+            job = self.assist_jobs.get()
+            while not self.assist_jobs.empty():  # only newest search is needed
+                job = self.assist_jobs.get()
+            assist_word, assist_type, full_input, cancel = job
+            if cancel.is_set():
+                continue
+            self.assist_streaming = (cancel, assist_type)
+            found = self.search_assist(assist_word, assist_type, full_input, cancel)
+            if not cancel.is_set():
+                self.assist_results.put((cancel, assist_type, found))
+                self.gateway.mark_changed("state")
+
+    def stream_assist(self, results):
+        """Send partial results of search running in assist worker, when best results stopped changing"""
+        cancel, assist_type = self.assist_streaming
+        if not cancel.is_set():
+            found = sorted(results, key=lambda x: x[2], reverse=True)
+            self.assist_results.put((cancel, assist_type, found))
+            self.gateway.mark_changed("state")
+
+    def search_assist(self, assist_word, assist_type, full_input, cancel):
+        """Search for channels or emoji in assist worker"""
+        if assist_type == 1:  # channels
+            if not self.command:  # current guild channels
+                return search.search_channels_guild(
+                    self.current_channels,
+                    assist_word,
+                    limit=self.assist_limit,
+                    score_cutoff=self.assist_score_cutoff,
+                    cancel=cancel,
+                    stream=self.stream_assist,
+                )
+            # all guilds, channels, and dms
+            return search.search_channels_all(
+                self.guilds,
+                self.dms,
+                assist_word,
+                full_input,
+                limit=self.assist_limit,
+                score_cutoff=self.assist_score_cutoff,
+                cancel=cancel,
+                stream=self.stream_assist,
+            )
+        # emoji
+        return search.search_emojis(
+            self.gateway.get_emojis(),
+            self.premium,
+            self.active_channel["guild_id"],
+            assist_word,
+            safe_emoji=self.emoji_as_text,
+            limit=self.assist_limit,
+            score_cutoff=self.assist_score_cutoff,
+            cancel=cancel,
+            stream=self.stream_assist,
+        )
+
+    def process_assist_results(self):
+        """Draw newest results from assist worker, if they are for current assist"""
+        found = None
+        while not self.assist_results.empty():
+            cancel, assist_type, results = self.assist_results.get()
+            if (
+                cancel is self.assist_cancel
+                and not cancel.is_set()
+                and assist_type == self.assist_type
+            ):
+                found = results
+        if found is not None:
+            self.assist_found = found
+            self.draw_assist(self.assist_type)
+
     def stop_assist(self, close=True):
         """Stop assisting and hide assist UI"""
         self.tui.instant_assist = False
@@ -6057,6 +6302,10 @@ class Endcord:
             self.assist_type = None
             self.assist_found = []
             self.tui.assist_start = -1
+            if self.assist_cancel:
+                self.assist_cancel.set()
+                self.assist_cancel = None
+            search.clear_indexes()
             # if search was open, restore it
             if (self.search or self.search_gif or self.command) and self.extra_bkp:
                 self.extra_window_open = True
@@ -6329,6 +6578,7 @@ class Endcord:
             last_seen_msg,
             self.show_blocked_messages,
             self.config,
+            render_cache=self.chat_render_cache,
         )
         self.tui.set_wide_map(wide_map)
 
@@ -6398,10 +6648,7 @@ class Endcord:
 
     def update_tabs(self, no_redraw=False, add_current=False):
         """Generate tab string and update status line"""
-        tabs = []
-        for channel in self.channel_cache:
-            if channel[2]:
-                tabs.append(channel[0])
+        tabs = self.channel_cache.tabs.copy()
 
         # add active channel if needed
         active_channel_id = self.active_channel["channel_id"]
@@ -6701,6 +6948,10 @@ class Endcord:
             safe_emoji=self.emoji_as_text,
             max_w=self.tui.get_dimensions()[1][1],
         )
+        self.tree_index = {}
+        for tree_pos, obj in enumerate(self.tree_metadata):
+            if obj and obj["id"] not in self.tree_index:
+                self.tree_index[obj["id"]] = tree_pos
         # debug_guilds_tree
         # debug.save_json(self.tree, "tree.json", False)
         # debug.save_json(self.tree_format, "tree_format.json", False)
@@ -6860,10 +7111,9 @@ class Endcord:
                             )
 
             if channels:
-                success = self.discord.send_ack_bulk(channels)
-                if success is None:
-                    self.gateway.set_offline()
-                    self.update_extra_line("Network error.")
+                for channel in channels:
+                    self.queue_ack(channel["channel_id"], channel["message_id"])
+                if self.flush_acks() is None:
                     return
                 for channel in channels:
                     channel_id = channel["channel_id"]
@@ -6982,46 +7232,73 @@ class Endcord:
             }
         self.update_tree()
 
-    def send_ack(self, channel_id=None, message_id=None, manual=False):
-        """Send ack, if throttled - add to queue, if queue is larger than 1, then send bulk ack"""
-        # add to queue
-        if channel_id:
-            for ack in self.pending_acks:
-                if ack[0] == channel_id:
-                    break
-            else:
-                self.pending_acks.append((channel_id, message_id))
+    def queue_ack(self, channel_id, message_id):
+        """Add ack to pending acks, only newest message is kept for each channel"""
+        pending = self.pending_acks.get(channel_id)
+        if not pending or int(message_id) > int(pending):
+            self.pending_acks[channel_id] = message_id
 
-        # try to send
-        if self.pending_acks and time.time() - self.sent_ack_time > self.ack_throttling:
-            success = self.discord.send_ack(*self.pending_acks.pop(0), manual=manual)
+    def send_ack(self, channel_id=None, message_id=None, manual=False):
+        """Send ack, if throttled - add to pending acks, they are all sent together when throttling expires"""
+        if manual:
+            # manual ack can move read state back, so its sent alone and overrides pending one
+            self.pending_acks.pop(channel_id, None)
+            success = self.discord.send_ack(channel_id, message_id, manual=True)
             if success is None:
                 self.gateway.set_offline()
                 self.update_extra_line("Network error.")
             self.sent_ack_time = time.time()
+            return
+
+        if channel_id:
+            self.queue_ack(channel_id, message_id)
+        if self.pending_acks and time.time() - self.sent_ack_time > self.ack_throttling:
+            self.flush_acks()
+
+    def flush_acks(self):
+        """
+        Send all pending acks now, single ack is sent normally, multiple are sent in bulk.
+        Return None on network error, acks that were not sent are kept pending.
+        """
+        self.sent_ack_time = time.time()
+        if not self.pending_acks:
+            return True
+        acks = list(self.pending_acks.items())
+        self.pending_acks = {}
+        if len(acks) == 1:
+            success = self.discord.send_ack(*acks[0])
+            if success is None:
+                self.pending_acks.update(acks)
+        else:
+            for num in range(0, len(acks), ACK_BULK_SIZE):
+                chunk = acks[num : num + ACK_BULK_SIZE]
+                success = self.discord.send_ack_bulk(
+                    [
+                        {"channel_id": channel_id, "message_id": message_id}
+                        for channel_id, message_id in chunk
+                    ]
+                )
+                if success is None:
+                    for channel_id, message_id in acks[num:]:
+                        self.queue_ack(channel_id, message_id)
+                    break
+            logger.debug(f"Sent {len(acks)} acks in bulk")
+        if success is None:
+            self.gateway.set_offline()
+            self.update_extra_line("Network error.")
+        return success
 
     def compute_permissions(self):
         """Compute permissions for all guilds. Run after roles have been obtained"""
         for guild in self.guilds:
             guild_id = guild["guild_id"]
-            # get my roles
-            my_roles = None
-            for roles in self.my_roles:
-                if roles["guild_id"] == guild_id:
-                    my_roles = roles["roles"]
-                    break
+            my_roles = self.gateway.get_my_guild_roles(guild_id)
             if my_roles is None:
                 continue
-            # get guild roles
-            this_guild_roles = []
-            for roles in self.all_roles:
-                if roles["guild_id"] == guild_id:
-                    this_guild_roles = roles["roles"]
-                    break
-            # get permissions
-            self.guilds = perms.compute_permissions(
-                self.guilds,
-                this_guild_roles,
+            # get permissions, guild is modified in place
+            perms.compute_permissions(
+                [guild],
+                self.gateway.get_guild_roles(guild_id),
                 guild_id,
                 my_roles,
                 self.my_id,
@@ -7029,9 +7306,9 @@ class Endcord:
 
     def clean_permissions(self, guild_id):
         """Remove all computed permissions for specified guild"""
-        for guild in self.guilds:
-            if guild["guild_id"] == guild_id:
-                break
+        guild = self.gateway.get_guild(guild_id)
+        if not guild:
+            return
         for num, channel in enumerate(guild["channels"]):
             guild["channels"][num].pop("perms_computed", None)
             guild["channels"][num].pop("allow_manage", None)
@@ -7041,13 +7318,9 @@ class Endcord:
 
     def hide_channel(self, channel_id, guild_id):
         """Locally hide this channel, for this session"""
-        for guild in self.guilds:
-            if guild["guild_id"] == guild_id:
-                for channel in guild["channels"]:
-                    if channel["id"] == channel_id:
-                        channel["hidden"] = True
-                        break
-                break
+        channel = self.gateway.get_channel(channel_id, guild_id)
+        if channel:
+            channel["hidden"] = True
 
     def load_threads(self, event):
         """
@@ -7084,6 +7357,7 @@ class Endcord:
                     else:
                         to_sort = True
                         channel["threads"].append(new_thread)
+                        self.threads_index[new_thread["id"]] = new_thread
                     break
             else:
                 new_thread.pop("parent_id")
@@ -7093,6 +7367,7 @@ class Endcord:
                         "threads": [new_thread],
                     }
                 )
+                self.threads_index[new_thread["id"]] = new_thread
         if to_sort:
             for guild in self.threads:
                 if guild["guild_id"] == guild_id or guild_id is None:
@@ -7123,6 +7398,7 @@ class Endcord:
                     for tnum, thread in enumerate(channel["threads"]):
                         if thread["id"] == new_thread["id"]:
                             channel["threads"].pop(tnum)
+                            self.threads_index.pop(thread["id"], None)
                     break
         self.update_tree()
         if self.forum:
@@ -7166,20 +7442,17 @@ class Endcord:
                     self.update_tree()
                     return dm.get("muted")
         elif guild_id:  # channel/category
-            for guild in self.guilds:
-                if guild["guild_id"] == guild_id:
-                    for channel in guild["channels"]:
-                        if channel["id"] == channel_id:
-                            channel["muted"] = not channel.get("muted")
-                            self.update_tree()
-                            return channel["muted"]
-                    break
+            channel = self.gateway.get_channel(channel_id, guild_id)
+            if channel:
+                channel["muted"] = not channel.get("muted")
+                self.update_tree()
+                return channel["muted"]
         else:  # guild
-            for guild in self.guilds:
-                if guild["guild_id"] == channel_id:
-                    guild["muted"] = not guild.get("muted")
-                    self.update_tree()
-                    return guild["muted"]
+            guild = self.gateway.get_guild(channel_id)
+            if guild:
+                guild["muted"] = not guild.get("muted")
+                self.update_tree()
+                return guild["muted"]
 
     def check_tree_format(self):
         """Check tree format for collapsed guilds, categories, channels (with threads) and forums and save it"""
@@ -7337,7 +7610,7 @@ class Endcord:
                                     break
                         self.update_chat(scroll=False)
 
-    def process_msg_events_cached_channel(self, new_message, ch_num):
+    def process_msg_events_cached_channel(self, new_message, cached_messages):
         """Process message events for currently active channel"""
         data = new_message["d"]
         op = new_message["op"]
@@ -7355,12 +7628,12 @@ class Endcord:
                     ):
                         self.messages.pop(num)
                         break
-            self.channel_cache[ch_num][1].insert(0, data)
-            if len(self.channel_cache[ch_num][1]) > self.msg_num:
-                self.channel_cache[ch_num][1].pop(-1)
+            cached_messages.insert(0, data)
+            if len(cached_messages) > self.msg_num:
+                cached_messages.pop(-1)
         else:
             my_message = data.get("user_id") == self.my_id
-            for num, loaded_message in enumerate(self.channel_cache[ch_num][1]):
+            for num, loaded_message in enumerate(cached_messages):
                 if data["id"] == loaded_message["id"]:
                     if op == "MESSAGE_UPDATE":
                         if self.emoji_as_text:
@@ -7370,9 +7643,9 @@ class Endcord:
                         loaded_message["edited"] = True
                     elif op == "MESSAGE_DELETE":
                         if self.keep_deleted:
-                            self.channel_cache[ch_num][1][num]["deleted"] = True
+                            cached_messages[num]["deleted"] = True
                         else:
-                            self.channel_cache[ch_num][1].pop(num)
+                            cached_messages.pop(num)
                     elif op == "MESSAGE_REACTION_ADD":
                         for num2, reaction in enumerate(loaded_message["reactions"]):
                             if (
@@ -7554,14 +7827,12 @@ class Endcord:
                     if roles["guild_id"] == changed_guild:
                         self.current_my_roles = roles["roles"]
                         break
-                for guild in self.member_roles:
-                    if guild["guild_id"] == self.active_channel["guild_id"]:
-                        for member in guild["members"]:
-                            if member["user_id"] == self.my_id:
-                                member["roles"] = self.current_my_roles
-                                member.pop("primary_role_color", None)
-                                break
-                        break
+                member = self.gateway.get_member(
+                    self.active_channel["guild_id"], self.my_id
+                )
+                if member:
+                    member["roles"] = self.current_my_roles
+                    member.pop("primary_role_color", None)
                 self.select_current_member_roles()
                 self.update_tree()
                 self.update_chat()
@@ -7600,11 +7871,8 @@ class Endcord:
                 if roles["guild_id"] == guild_id:
                     self.current_roles = roles["roles"]
                     break
-            for guild in self.member_roles:
-                if guild["guild_id"] == guild_id:
-                    for member in guild["members"]:
-                        member.pop("primary_role_color", None)
-                    break
+            for member in self.gateway.get_guild_members(guild_id) or []:
+                member.pop("primary_role_color", None)
             self.select_current_member_roles()
 
             # update perms and redraw
@@ -7612,6 +7880,7 @@ class Endcord:
                 self.clean_permissions(guild_id)
                 self.compute_permissions()
                 self.update_tree()
+            self.chat_render_cache.clear()  # role names could be changed
             self.update_chat(scroll=False)
 
     def process_call_gateway_events(self, event):
@@ -8323,6 +8592,9 @@ class Endcord:
         # start input and sender threads
         threading.Thread(target=self.wait_input, daemon=True, args=()).start()
         threading.Thread(target=self.message_sender, daemon=True).start()
+        if self.prefetch:
+            threading.Thread(target=self.prefetch_worker, daemon=True).start()
+        threading.Thread(target=self.assist_worker, daemon=True).start()
 
         # start RPC server
         if self.enable_rpc:
@@ -8365,18 +8637,23 @@ class Endcord:
         )
         del self.init_time
 
+        # first run processes everything
+        changed = {"messages", "typing", "summaries", "msg_ack", "threads", "calls", "state"}
+        loop_time = 0
         while self.run:
             selected_line, text_index = self.tui.get_chat_selected()
 
             self.execute_extensions_methods("on_main_loop", cache=True)
 
             # get new messages
-            while self.run:
+            while self.run and "messages" in changed:
                 new_message = self.gateway.get_messages()
                 if new_message:
                     new_message = self.execute_extensions_methods(
                         "on_message_event", new_message, cache=True
                     )[0]
+                    if self.message_store:
+                        self.store_message_event(new_message)
                     new_message_channel_id = new_message["d"]["channel_id"]
                     this_channel = (
                         new_message_channel_id == self.active_channel["channel_id"]
@@ -8388,15 +8665,18 @@ class Endcord:
                         self.process_msg_events_active_channel(
                             new_message, selected_line
                         )
+                        # open pinned chat is the same list as its cache entry
+                        self.channel_cache.update_size(new_message_channel_id)
                     # handle cached channels
                     elif self.limit_channel_cache:
-                        in_cache = False
-                        for ch_num, channel in enumerate(self.channel_cache):
-                            if channel[0] == new_message_channel_id:
-                                in_cache = True
-                                break
-                        if in_cache:
-                            self.process_msg_events_cached_channel(new_message, ch_num)
+                        cached_messages = self.channel_cache.get_messages(
+                            new_message_channel_id
+                        )
+                        if cached_messages is not None:
+                            self.process_msg_events_cached_channel(
+                                new_message, cached_messages
+                            )
+                            self.channel_cache.update_size(new_message_channel_id)
                         if this_channel:
                             # still have to do this when scrolled far up, only to handle message delete/edit/react/poll
                             self.process_msg_events_active_channel(
@@ -8422,7 +8702,7 @@ class Endcord:
                     break
 
             # get new typing
-            while self.run:
+            while self.run and "typing" in changed:
                 new_typing = self.gateway.get_typing()
                 if new_typing:
                     if (
@@ -8452,7 +8732,7 @@ class Endcord:
 
             # get new summaries
             if self.save_summaries:
-                while self.run:
+                while self.run and "summaries" in changed:
                     new_summary = self.gateway.get_summaries()
                     if new_summary:
                         self.update_summary(new_summary)
@@ -8460,7 +8740,7 @@ class Endcord:
                         break
 
             # get new message_ack
-            while self.run:
+            while self.run and "msg_ack" in changed:
                 new_message_ack = self.gateway.get_message_ack()
                 if new_message_ack:
                     self.set_channel_seen(
@@ -8472,7 +8752,7 @@ class Endcord:
                     break
 
             # get thread updates
-            while self.run:
+            while self.run and "threads" in changed:
                 thread_event = self.gateway.get_threads()
                 if thread_event:
                     if thread_event["op"] == "THREAD_UPDATE":
@@ -8483,7 +8763,7 @@ class Endcord:
                     break
 
             # get new call events
-            while self.run:
+            while self.run and "calls" in changed:
                 new_call_event = self.gateway.get_call_events()
                 if new_call_event:
                     self.process_call_gateway_events(new_call_event)
@@ -8512,8 +8792,8 @@ class Endcord:
 
             # send new rpc activities
             if self.enable_rpc:
-                rpc_activities, changed = self.rpc.get_activities()
-                if changed and self.gateway_state == 1:
+                rpc_activities, rpc_changed = self.rpc.get_activities()
+                if rpc_changed and self.gateway_state == 1:
                     if self.enable_game_detection:
                         game_activities, _ = self.game_detection.get_activities()
                         rpc_apps_ids = [d["application_id"] for d in rpc_activities]
@@ -8534,8 +8814,8 @@ class Endcord:
 
             # send new detectable games activities
             if self.enable_game_detection:
-                game_activities, changed = self.game_detection.get_activities()
-                if changed and self.gateway_state == 1:
+                game_activities, games_changed = self.game_detection.get_activities()
+                if games_changed and self.gateway_state == 1:
                     if self.enable_rpc:
                         rpc_activities, _ = self.rpc.get_activities()
                         rpc_apps_ids = [d["application_id"] for d in rpc_activities]
@@ -8595,6 +8875,11 @@ class Endcord:
                             )
                             self.slowmode_thread.start()
 
+            # download chats that are likely to be opened next
+            if self.prefetch:
+                self.process_prefetched()
+                self.schedule_prefetch()
+
             # remove unseen after scrolled to bottom on unseen channel
             if self.new_unreads or self.this_unread:
                 if text_index == 0:
@@ -8613,6 +8898,23 @@ class Endcord:
             ):
                 self.send_ack()
 
+            # show download progress, without replacing other extra line messages
+            if (
+                self.downloader.get_active()
+                and not self.extra_window_open
+                and time.time() - self.download_progress_time
+                > DOWNLOAD_PROGRESS_INTERVAL
+            ):
+                self.download_progress_time = time.time()
+                progress = self.downloader.get_progress_text()
+                if progress and (
+                    not self.extra_line
+                    or self.extra_line == "File download started."
+                    or self.extra_line.startswith("Downloading: ")
+                ):
+                    if progress != self.extra_line:
+                        self.update_extra_line(progress)
+
             # check gateway state
             gateway_state = self.gateway.get_state()
             if gateway_state != self.gateway_state:
@@ -8630,6 +8932,7 @@ class Endcord:
             guilds = self.gateway.get_guilds()
             if guilds:
                 self.guilds = guilds
+                self.chat_render_cache.clear()  # channel names could be changed
                 self.load_dms()
                 self.compute_permissions()
                 self.select_current_channels(refresh=True)
@@ -8854,6 +9157,10 @@ class Endcord:
                 paths = peripherals.complete_path(assist_word, separator=True)
                 self.assist(assist_word, assist_type, query_results=paths)
 
+            # check results from assist worker
+            if self.assist_type in (1, 3):
+                self.process_assist_results()
+
             # check member assist query results
             if self.assist_type == 2:
                 query_results = self.gateway.get_member_query_results()
@@ -8867,4 +9174,20 @@ class Endcord:
                 logger.fatal(f"Gateway error: \n {self.gateway.error}")
                 sys.exit(self.gateway.error + ERROR_TEXT)
 
-            time.sleep(0.1)  # some reasonable delay
+            # sleep until gateway or input marks something as changed
+            # still run periodically for timed things: typing, acks, rpc, game detection
+            if self.voice_gateway or self.assist_type:
+                timeout = MAIN_LOOP_TIMEOUT_FAST
+            else:
+                timeout = MAIN_LOOP_TIMEOUT
+            changed = self.gateway.wait_changes(timeout)
+            # coalesce floods of state-only changes (presences, member list)
+            if changed == {"state"}:
+                delay = MAIN_LOOP_MIN_INTERVAL - (time.time() - loop_time)
+                if delay > 0:
+                    time.sleep(delay)
+                    changed |= self.gateway.wait_changes(0)
+            loop_time = time.time()
+
+        # dont lose read state that is still throttled
+        self.flush_acks()
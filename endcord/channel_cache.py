@@ -0,0 +1,171 @@
+import sys
+from collections import OrderedDict
+
+MESSAGE_OVERHEAD = 600   # approximate size of message record with its small fields, in bytes
+EMBED_OVERHEAD = 300
+
+
+def estimate_size(messages):
+    """Approximate memory used by list of messages, in bytes"""
+    size = sys.getsizeof(messages)
+    for message in messages:
+        size += MESSAGE_OVERHEAD + len(message["content"])
+        embeds = message.get("embeds")
+        if embeds:
+            size += EMBED_OVERHEAD * len(embeds)
+        referenced = message.get("referenced_message")
+        if referenced:
+            size += MESSAGE_OVERHEAD + len(referenced.get("content") or "")
+    return size
+
+
+class ChannelCache:
+    """
+    LRU cache of channel chats keyed by channel id.
+    Pinned (tabbed) channels are never evicted, unpinned are evicted least recently used first,
+    when there are more than limit channels or when cached messages take more than max_bytes.
+    """
+
+    def __init__(self, limit, max_bytes=0):
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   # channel_id: [messages, pinned, invalid, complete, size], least recently used first
+        self.tabs = []   # pinned channel ids in order they were pinned
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def __contains__(self, channel_id):
+        """Check if channel is cached"""
+        return channel_id in self.entries
+
+
+    def __len__(self):
+        """Number of cached channels"""
+        return len(self.entries)
+
+
+    def ids(self):
+        """Get ids of all cached channels"""
+        return list(self.entries)
+
+
+    def pinned_count(self):
+        """Get number of pinned channels"""
+        return len(self.tabs)
+
+
+    def is_full(self):
+        """Check if all cache slots are taken by pinned channels"""
+        return len(self.tabs) >= self.limit
+
+
+    def needs_fetch(self, channel_id):
+        """Check if channel is not cached, or its cached entry is invalid or empty"""
+        entry = self.entries.get(channel_id)
+        return not entry or entry[2] or not entry[0]
+
+
+    def has_free_slot(self):
+        """Check if channel can be added without evicting other channel"""
+        return len(self.entries) < self.limit and (not self.max_bytes or self.size < self.max_bytes)
+
+
+    def put(self, channel_id, messages, pinned, complete=False, recent=True):
+        """
+        Add or replace channel chat and mark it as most recently used.
+        complete means messages are whole channel history, so shorter chat is still valid.
+        If not recent, channel is added as least recently used, so it is first to be evicted, used for prefetched chats.
+        """
+        entry = self.entries.pop(channel_id, None)
+        if entry:
+            self.size -= entry[4]
+        size = estimate_size(messages)
+        self.entries[channel_id] = [messages, pinned, False, complete, size]
+        self.size += size
+        if pinned and channel_id not in self.tabs:
+            self.tabs.append(channel_id)
+        elif not pinned and channel_id in self.tabs:
+            self.tabs.remove(channel_id)
+        if recent:
+            self.evict(keep=channel_id)
+        else:
+            self.entries.move_to_end(channel_id, last=False)
+            self.evict()
+
+
+    def get(self, channel_id):
+        """Get cache entry and mark it as most recently used, invalid entries are not returned"""
+        entry = self.entries.get(channel_id)
+        if not entry or entry[2]:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(channel_id)
+        self.hits += 1
+        return entry
+
+
+    def get_messages(self, channel_id):
+        """Get cached messages without changing usage order, used to apply events to cached chats"""
+        entry = self.entries.get(channel_id)
+        if entry:
+            return entry[0]
+        return None
+
+
+    def pop(self, channel_id):
+        """Remove channel from cache and return its entry"""
+        entry = self.entries.pop(channel_id, None)
+        if entry:
+            self.size -= entry[4]
+            if channel_id in self.tabs:
+                self.tabs.remove(channel_id)
+        return entry
+
+
+    def update_size(self, channel_id):
+        """Estimate size of channel again after its cached messages are changed, and evict other channels if needed"""
+        entry = self.entries.get(channel_id)
+        if entry:
+            size = estimate_size(entry[0])
+            self.size += size - entry[4]
+            entry[4] = size
+            self.evict(keep=channel_id)
+
+
+    def evict(self, keep=None):
+        """Remove least recently used unpinned channels until cache is within limits"""
+        if len(self.entries) <= self.limit and (not self.max_bytes or self.size <= self.max_bytes):
+            return
+        for channel_id, entry in list(self.entries.items()):
+            if len(self.entries) <= self.limit and (not self.max_bytes or self.size <= self.max_bytes):
+                break
+            if entry[1] or channel_id == keep:
+                continue
+            del self.entries[channel_id]
+            self.size -= entry[4]
+            self.evictions += 1
+
+
+    def invalidate(self):
+        """Remove unpinned channels and mark pinned as invalid, so they are downloaded again, used after reconnecting"""
+        for channel_id, entry in list(self.entries.items()):
+            if entry[1]:
+                entry[2] = True
+            else:
+                self.pop(channel_id)
+
+
+    def remove_pinned(self):
+        """Remove all pinned channels"""
+        for channel_id in list(self.tabs):
+            self.pop(channel_id)
+
+
+    def get_stats(self):
+        """Get cache usage statistics as string for logging"""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+        return f"Channel cache: {len(self.entries)} channels, {len(self.tabs)} pinned, {self.size // 1024} KiB, hits={self.hits}, misses={self.misses} ({ratio:.0f}% hit), evictions={self.evictions}"
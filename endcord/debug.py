@@ -11,6 +11,13 @@ def hash_none(value):
     return str(hash(str(value)))
 
 
+def json_default(obj):
+    """Convert objects that json cant serialize, like message records"""
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
 def save_json(json_data, name, debug_path=True):
     """Save json to log path"""
     if debug_path:
@@ -20,7 +27,7 @@ def save_json(json_data, name, debug_path=True):
     else:
         path = name
     with open(path, "w") as f:
-        json.dump(json_data, f, indent=2)
+        json.dump(json_data, f, indent=2, default=json_default)
 
 
 def load_json(path):
@@ -4,8 +4,13 @@ settings = {
     "rpc": True,
     "game_detection": True,
     "downloads_path": None,
+    "limit_downloads": 3,
     "limit_chat_buffer": 100,
     "limit_channel_cache": 5,
+    "limit_channel_cache_memory": 50,
+    "prefetch_channels": True,
+    "message_store": True,
+    "limit_message_store": 1000,
     "download_msg": 25,
     "convert_timezone": True,
     "send_typing": True,
@@ -3,11 +3,14 @@ import http.client
 import logging
 import os
 import re
+import select
 import socket
 import ssl
+import threading
 import time
 import urllib.parse
 import uuid
+import zlib
 
 try:
     import orjson as json
@@ -17,6 +20,19 @@ except ImportError:
     except ImportError:
         import json
 
+# optional response compression libraries
+try:
+    from compression import zstd  # python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 import socks
 from discord_protos import FrecencyUserSettings, PreloadedUserSettings
 from google.protobuf.json_format import MessageToDict, ParseDict
@@ -52,6 +68,21 @@ SEARCH_HAS_OPTS = (
 )
 PING_OPTIONS = ["all", "mentions", "nothing", "default"]  # must be list
 SUPPRESS_OPTIONS = ("suppress_everyone", "suppress_roles")
+POOL_IDLE_TIMEOUT = 50  # seconds after which idle connection is dropped
+POOL_MAX_IDLE = 4  # max idle connections kept per host
+POOL_MAX_DRAIN = 65536  # unread body smaller than this is drained to keep connection
+READ_CHUNK_SIZE = 65536
+ACCEPT_ENCODING = ", ".join(
+    ["gzip"] + (["br"] if brotli else []) + (["zstd"] if zstd else [])
+)
+POOL_RETRY_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
 logger = logging.getLogger(__name__)
 
 
@@ -64,10 +95,91 @@ def ceil(x):
     return -int(-1 * x // 1)
 
 
+compression_stats = [0, 0]  # [received bytes, decompressed bytes]
+compression_stats_lock = threading.Lock()
+
+
+def get_decompressor(encoding):
+    """Get function that incrementally decompresses data chunks, and its flush function"""
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(47)  # 32 + 15 - auto detect gzip header
+        return decompressor.decompress, decompressor.flush
+    if encoding == "br" and brotli:
+        decompressor = brotli.Decompressor()
+        return decompressor.process, lambda: b""
+    if encoding == "zstd" and zstd:
+        if zstd.__name__ == "zstandard":
+            decompressor = zstd.ZstdDecompressor().decompressobj()
+        else:
+            decompressor = zstd.ZstdDecompressor()
+        return decompressor.decompress, lambda: b""
+    return None, None
+
+
+class DecodedResponse:
+    """File-like wrapper around HTTPResponse that decompresses body while reading it"""
+
+    def __init__(self, response):
+        self.response = response
+        encoding = (response.getheader("Content-Encoding") or "").strip().lower()
+        self.decompress, self.flush = get_decompressor(encoding)
+        if encoding and encoding != "identity" and not self.decompress:
+            logger.warning(f"Unsupported response Content-Encoding: {encoding}")
+        self.buffer = bytearray()
+        self.eof = False
+        self.received = 0
+        self.decoded = 0
+
+    def fill(self, size):
+        """Read and decompress chunks until buffer has at least size bytes or body ends"""
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.response.read(READ_CHUNK_SIZE)
+            if chunk:
+                self.received += len(chunk)
+                data = self.decompress(chunk)
+            else:
+                data = self.flush()
+                self.eof = True
+            self.decoded += len(data)
+            self.buffer += data
+            if self.eof:
+                self.log_stats()
+
+    def log_stats(self):
+        """Add this response to global compression stats"""
+        with compression_stats_lock:
+            compression_stats[0] += self.received
+            compression_stats[1] += self.decoded
+            saved = compression_stats[1] - compression_stats[0]
+        logger.debug(
+            f"Response decompressed: {self.received} -> {self.decoded} bytes, total saved: {saved} bytes"
+        )
+
+    def read(self, size=-1):
+        """Read up to size decompressed bytes, or all if size is negative"""
+        if not self.decompress:
+            if size < 0:
+                return self.response.read()
+            return self.response.read(size)
+        self.fill(size)
+        if size < 0 or size >= len(self.buffer):
+            data = bytes(self.buffer)
+            self.buffer = bytearray()
+        else:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+        return data
+
+
+def read_response(response):
+    """Read whole response body, decompressing it in chunks if its compressed"""
+    return DecodedResponse(response).read()
+
+
 def log_api_error(response, function_name):
     """Add api response error to log"""
     text = f"{function_name}: Response code {response.status}"
-    data = response.read()
+    data = read_response(response)
     if data:
         try:
             data = json.loads(data)
@@ -126,6 +238,196 @@ def build_multipart_body(data):
     return body, content_type, content_len
 
 
+class PooledConnection:
+    """
+    Wrapper around HTTPSConnection taken from ConnectionPool.
+    Calling close() returns connection to the pool instead closing it.
+    Broken reused connections are transparently reopened and request is resent once.
+    Non-idempotent requests are resent only if sending them failed, not if reading response failed,
+    because server might have already processed them, so they are sent on new connection if server closed reused one,
+    and failed reading is raised as TimeoutError, same as other network errors.
+    """
+
+    def __init__(self, pool, host, port, timeout, connection, reused):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connection = connection
+        self.reused = reused
+        self.last_request = None
+        self.response = None
+
+    def __getattr__(self, name):
+        """Pass other attributes to wrapped connection"""
+        return getattr(self.connection, name)
+
+    def can_retry(self, sent=False):
+        """Check if last request can be safely sent again on new connection, sent means it was fully sent"""
+        if not self.reused or not self.last_request:
+            return False
+        if sent and self.last_request[0] not in IDEMPOTENT_METHODS:
+            return False
+        body = self.last_request[2]
+        return body is None or isinstance(body, (bytes, bytearray, str))
+
+    def is_dropped(self):
+        """Check if server closed idle connection, its socket is readable after that"""
+        sock = self.connection.sock
+        if sock is None:
+            return False
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def reconnect(self):
+        """Drop broken connection and open new one"""
+        logger.debug(f"Pooled connection to {self.host} is broken, reconnecting")
+        self.connection.close()
+        self.connection = self.pool.new_connection(self.host, self.port, self.timeout)
+        self.reused = False
+
+    def request(self, method, url, body=None, headers=None):
+        """Send request, same as HTTPSConnection.request()"""
+        if headers is None:
+            headers = {}
+        self.last_request = (method, url, body, headers)
+        self.response = None
+        if self.reused and method not in IDEMPOTENT_METHODS and self.is_dropped():
+            self.reconnect()
+        try:
+            self.connection.request(method, url, body, headers)
+        except POOL_RETRY_ERRORS:
+            if not self.can_retry():
+                raise
+            self.reconnect()
+            self.connection.request(method, url, body, headers)
+
+    def getresponse(self):
+        """Get response, same as HTTPSConnection.getresponse()"""
+        try:
+            self.response = self.connection.getresponse()
+        except POOL_RETRY_ERRORS as e:
+            if not self.can_retry(sent=True):
+                if self.last_request and self.last_request[0] not in IDEMPOTENT_METHODS:
+                    raise TimeoutError(f"No response to {self.last_request[0]} request: {e}") from e
+                raise
+            self.reconnect()
+            self.connection.request(*self.last_request)
+            self.response = self.connection.getresponse()
+        return self.response
+
+    def close(self):
+        """Return connection to the pool"""
+        if self.connection is None:
+            return
+        self.pool.release(self.host, self.port, self.connection, self.response)
+        self.connection = None
+        self.response = None
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTPS connections, per host"""
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def new_connection(self, host, port, timeout=10):
+        """Create new connection object and handle proxying"""
+        if self.proxy.scheme:
+            if self.proxy.scheme.lower() == "http":
+                connection = http.client.HTTPSConnection(
+                    self.proxy.hostname, self.proxy.port
+                )
+                connection.set_tunnel(host, port=port)
+            elif "socks" in self.proxy.scheme.lower():
+                proxy_sock = socks.socksocket()
+                proxy_sock.set_proxy(socks.SOCKS5, self.proxy.hostname, self.proxy.port)
+                proxy_sock.settimeout(10)
+                proxy_sock.connect((host, port))
+                ssl_context = ssl.create_default_context()
+                ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+                proxy_sock = ssl_context.wrap_socket(proxy_sock, server_hostname=host)
+                # proxy_sock.do_handshake()   # seems like its not needed
+                connection = http.client.HTTPSConnection(
+                    host, port, timeout=timeout + 5
+                )
+                connection.sock = proxy_sock
+            else:
+                connection = http.client.HTTPSConnection(host, port)
+        else:
+            connection = http.client.HTTPSConnection(host, port, timeout=timeout)
+        return connection
+
+    def get(self, host, port, timeout=10):
+        """Get idle connection to this host from the pool, or create new one"""
+        key = (host, port)
+        now = time.time()
+        # socks connections have timeout +5, like when created
+        if self.proxy.scheme and "socks" in self.proxy.scheme.lower():
+            sock_timeout = timeout + 5
+        else:
+            sock_timeout = timeout
+        with self.lock:
+            idle = self.idle.get(key)
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used < POOL_IDLE_TIMEOUT:
+                    try:
+                        connection.sock.settimeout(sock_timeout)
+                        connection.timeout = sock_timeout
+                    except OSError:
+                        connection.close()
+                        continue
+                    return PooledConnection(
+                        self, host, port, timeout, connection, True
+                    )
+                connection.close()
+        connection = self.new_connection(host, port, timeout)
+        return PooledConnection(self, host, port, timeout, connection, False)
+
+    def release(self, host, port, connection, response):
+        """Put connection back to the pool if it can be reused, otherwise close it"""
+        if response is None or connection.sock is None or response.will_close:
+            connection.close()
+            return
+        if not response.isclosed():
+            # remaining body must be consumed before connection can be reused
+            if (
+                response.chunked
+                or response.length is None
+                or response.length > POOL_MAX_DRAIN
+            ):
+                connection.close()
+                return
+            try:
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                return
+            if connection.sock is None:
+                connection.close()
+                return
+        key = (host, port)
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) >= POOL_MAX_IDLE:
+                connection.close()
+                return
+            idle.append((connection, time.time()))
+
+    def clear(self):
+        """Close all idle connections"""
+        with self.lock:
+            for idle in self.idle.values():
+                for connection, _ in idle:
+                    connection.close()
+            self.idle = {}
+
+
 class Discord:
     """Methods for fetching and sending data to Discord using REST API"""
 
@@ -145,6 +447,7 @@ class Discord:
         self.token = token
         self.header = {
             "Accept": "*/*",
+            "Accept-Encoding": ACCEPT_ENCODING,
             "Authorization": self.token,
             "Content-Type": "application/json",
             "Priority": "u=1",
@@ -160,6 +463,7 @@ class Discord:
             self.header.pop("X-Super-Properties", None)
         self.user_agent = user_agent
         self.proxy = urllib.parse.urlsplit(proxy)
+        self.pool = ConnectionPool(self.proxy)
         self.my_id = self.get_my_id(exit_on_error=True)
         self.activity_token = None
         self.protos = [[], []]
@@ -172,6 +476,20 @@ class Discord:
         self.voice_regions = []
         self.ranked_voice_regions = []
         self.attachment_id = 1
+        self.ratelimit_until = 0
+
+    def update_ratelimit(self, response):
+        """Remember when exhausted rate limit resets, so background requests can wait for it"""
+        if response.status == 429:
+            retry_after = response.getheader("Retry-After")
+        elif response.getheader("X-RateLimit-Remaining") == "0":
+            retry_after = response.getheader("X-RateLimit-Reset-After")
+        else:
+            return
+        try:
+            self.ratelimit_until = time.time() + float(retry_after)
+        except (TypeError, ValueError):
+            pass
 
     def check_expired_attachment_url(self, url):
         """Check if provided url is attachment and return its querys"""
@@ -196,31 +514,8 @@ class Discord:
         return None
 
     def get_connection(self, host, port, timeout=10):
-        """Get connection object and handle proxying"""
-        if self.proxy.scheme:
-            if self.proxy.scheme.lower() == "http":
-                connection = http.client.HTTPSConnection(
-                    self.proxy.hostname, self.proxy.port
-                )
-                connection.set_tunnel(host, port=port)
-            elif "socks" in self.proxy.scheme.lower():
-                proxy_sock = socks.socksocket()
-                proxy_sock.set_proxy(socks.SOCKS5, self.proxy.hostname, self.proxy.port)
-                proxy_sock.settimeout(10)
-                proxy_sock.connect((host, port))
-                ssl_context = ssl.create_default_context()
-                ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
-                proxy_sock = ssl_context.wrap_socket(proxy_sock, server_hostname=host)
-                # proxy_sock.do_handshake()   # seems like its not needed
-                connection = http.client.HTTPSConnection(
-                    host, port, timeout=timeout + 5
-                )
-                connection.sock = proxy_sock
-            else:
-                connection = http.client.HTTPSConnection(host, port)
-        else:
-            connection = http.client.HTTPSConnection(host, port, timeout=timeout)
-        return connection
+        """Get pooled keep-alive connection object, proxying is handled by the pool"""
+        return self.pool.get(host, port, timeout=timeout)
 
     def get_my_id(self, exit_on_error=False):
         """Get my discord user ID"""
@@ -236,7 +531,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return data["id"]
         if response.status in (400, 401):  # bad request or unauthorized
@@ -258,7 +553,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             if extra:  # extra data for rpc
                 extra_data = {
@@ -315,7 +610,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             if "guild_member" in data:
                 nick = data["guild_member"]["nick"]
@@ -379,7 +674,7 @@ class Discord:
             connection.close()
             return None, None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             dms = []
             dms_id = []
@@ -434,7 +729,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             channels = []
             for channel in data:
@@ -470,8 +765,9 @@ class Discord:
         except (socket.gaierror, TimeoutError):
             connection.close()
             return None
+        self.update_ratelimit(response)
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             # debug_chat
             # from endcord import debug
@@ -494,7 +790,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             reaction = []
             for user in data:
@@ -526,7 +822,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             mentions = []
             for mention in data:
@@ -562,7 +858,7 @@ class Discord:
             connection.close()
             return []
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             for pack in data["sticker_packs"]:
                 pack_stickers = []
@@ -604,7 +900,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())["settings"]
+            data = json.loads(read_response(response))["settings"]
             connection.close()
             if num == 1:
                 decoded = PreloadedUserSettings.FromString(base64.b64decode(data))
@@ -685,7 +981,7 @@ class Discord:
             connection.close()
             return 1, None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return 0, {
                 "id": data["id"],
@@ -710,7 +1006,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             assets = []
             for asset in data:
@@ -737,11 +1033,11 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return data
         if response.status == 429:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             retry_after = float(data["retry_after"])
             logger.error(
@@ -769,7 +1065,7 @@ class Discord:
         if os.path.splitext(destination)[-1] == "":
             destination = destination + "." + extension
         with open(destination, mode="wb") as file:
-            file.write(response.read())
+            file.write(read_response(response))
 
     def send_message(
         self,
@@ -838,7 +1134,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             if "referenced_message" in data:
                 reference = {
@@ -886,7 +1182,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             mentions = []
             if data["mentions"]:
@@ -943,7 +1239,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return data
         log_api_error(response, "get_message")
@@ -1019,7 +1315,7 @@ class Discord:
             connection.close()
             return True
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return int(data["message_send_cooldown_ms"] / 1000)
         log_api_error(response, "send_typing")
@@ -1263,7 +1559,7 @@ class Discord:
             connection.close()
             return 0, []
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             threads = []
             total = data["total_results"]
@@ -1404,7 +1700,7 @@ class Discord:
             connection.close()
             return None, []
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             messages = []
             total = data["total_results"]
@@ -1430,7 +1726,7 @@ class Discord:
             connection.close()
             return [], []
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
 
             applications = data["applications"]
@@ -1488,7 +1784,7 @@ class Discord:
             connection.close()
             return [], []
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
 
             applications = data["applications"]
@@ -1671,7 +1967,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return prepare_messages(data, have_channel_id=True)
         log_api_error(response, "get_pinned")
@@ -1709,7 +2005,7 @@ class Discord:
             connection.close()
             return []
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             gifs = []
             for gif in data:
@@ -1760,7 +2056,7 @@ class Discord:
             connection.close()
             return None, 3  # network error
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return data["attachments"][0], 0
         if response.status == 413:
@@ -1865,7 +2161,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             if data["refreshed_urls"]:
                 return data["refreshed_urls"][0]["refreshed"]
@@ -1957,7 +2253,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return bool(data["ringable"])
         connection.close()
@@ -2015,7 +2311,7 @@ class Discord:
             return None
         if response.status == 200:
             with open(destination, "wb") as f:
-                f.write(response.read())
+                f.write(read_response(response))
             connection.close()
             return destination
         log_api_error(response, "get_pfp")
@@ -2049,7 +2345,7 @@ class Discord:
             return None
         if response.status == 200:
             with open(destination, "wb") as f:
-                f.write(response.read())
+                f.write(read_response(response))
             connection.close()
             return destination
         log_api_error(response, "get_emoji")
@@ -2077,7 +2373,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             if data["code"]:
                 return f"https://{self.host}/invite/{data['code']}"
@@ -2098,7 +2394,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             return data["account_standing"]["state"]
         log_api_error(response, "get_my_standing")
@@ -2136,7 +2432,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            self.activity_token = json.loads(response.read())["token"]
+            self.activity_token = json.loads(read_response(response))["token"]
             connection.close()
             return self.activity_token
         log_api_error(response, "send_update_activity_session")
@@ -2157,7 +2453,7 @@ class Discord:
             connection.close()
             return None
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             regions = []
             optimal = None
@@ -2194,7 +2490,7 @@ class Discord:
             connection.close()
             return self.ranked_voice_regions
         if response.status == 200:
-            data = json.loads(response.read())
+            data = json.loads(read_response(response))
             connection.close()
             regions = []
             for region in data:
@@ -2238,7 +2534,7 @@ class Discord:
                 nl = "\n"
             with open(save_path, "w" + ("b" if using_orjson else "")) as f:
                 try:
-                    for app in json_array_objects(response):
+                    for app in json_array_objects(DecodedResponse(response)):
                         executables = []
                         for exe in app["executables"]:
                             exe_os = exe["os"]
@@ -1,5 +1,8 @@
+import hashlib
 import logging
 import os
+import threading
+import time
 import urllib.parse
 
 import urllib3
@@ -8,9 +11,29 @@ from urllib3.contrib.socks import SOCKSProxyManager
 from endcord import peripherals
 
 CHUNK_SIZE = 1024 * 1024   # load max 1MB data in RAM when downloading
+RETRIES = 3   # number of times download is resumed after network error
+RETRY_DELAY = 1   # seconds
+PART_EXTENSION = ".part"   # unfinished downloads are kept with this extension so they can be resumed
 logger = logging.getLogger(__name__)
 
 
+def format_size(size):
+    """Format size in bytes as short human readable string"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def get_validator(headers):
+    """Get strong ETag or Last-Modified from response headers, that can be used in If-Range header, or None"""
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
 def convert_tenor_gif_type(url, content_type):
     """
     Convert tenor video link between types:
@@ -26,58 +49,194 @@ def convert_tenor_gif_type(url, content_type):
 
 
 class Downloader:
-    """Downloader class"""
+    """
+    Download manager with shared connection pool and limited number of parallel downloads.
+    Same file requested while its already downloading is downloaded only once.
+    Unfinished downloads are kept as .part files and resumed with HTTP Range request, guarded with If-Range so changed file is downloaded again.
+    """
 
-    def __init__(self, proxy=None):
-        self.downloading = True
-        self.active = 0
+    def __init__(self, proxy=None, limit=3):
         self.proxy = proxy
+        self.limit = max(limit, 1)
+        self.http = self.get_pool_manager()
+        self.slots = threading.Semaphore(self.limit)
+        self.lock = threading.Lock()
+        self.downloads = {}   # key: download, for downloads that are queued or running
+        self.validators = {}   # part_path: ETag or Last-Modified of file being downloaded into it, used for If-Range
+        self.generation = 0   # increased on cancel, so downloads started before are stopped
 
 
-    def download(self, url, file_id=None):
-        """Thread that downloads file and stores it in temp folder"""
-        if not os.path.exists(os.path.expanduser(peripherals.temp_path)):
-            os.makedirs(os.path.dirname(os.path.expanduser(peripherals.temp_path)), exist_ok=True)
-        url_object = urllib.parse.urlsplit(url)
-        filename = os.path.basename(url_object.path)
+    def get_pool_manager(self):
+        """Create connection pool manager shared by all downloads"""
         proxy = urllib.parse.urlsplit(self.proxy)
         if proxy.scheme.lower() == "http":
-            http = urllib3.ProxyManager(self.proxy)
-        elif proxy.scheme and "socks" in proxy.scheme.lower():
+            return urllib3.ProxyManager(self.proxy, maxsize=self.limit)
+        if proxy.scheme and "socks" in proxy.scheme.lower():
             # socket is replaced with PySocks globally in app.py
-            http = SOCKSProxyManager(self.proxy)
-        else:
-            http = urllib3.PoolManager()
-            if proxy.scheme:
-                logger.warning("Invalid proxy, continuing without proxy")
-        response = http.request("GET", url, preload_content=False)
-        extension = response.headers.get("Content-Type", None).split("/")[-1].replace("jpeg", "jpg")
+            return SOCKSProxyManager(self.proxy, maxsize=self.limit)
+        if proxy.scheme:
+            logger.warning("Invalid proxy, continuing without proxy")
+        return urllib3.PoolManager(maxsize=self.limit)
+
+
+    def download(self, url, file_id=None):
+        """
+        Download file and store it in temp folder, blocking until its done, should be run in a thread.
+        If all download slots are taken, wait for free one.
+        Return path to downloaded file and its original filename, or None, None.
+        """
+        key = file_id or urllib.parse.urlsplit(url).path
+        with self.lock:
+            download = self.downloads.get(key)
+            if download:
+                duplicate = True
+            else:
+                duplicate = False
+                download = {
+                    "key": key,
+                    "filename": os.path.basename(urllib.parse.urlsplit(url).path),
+                    "done": 0,
+                    "total": None,
+                    "resumed_from": 0,
+                    "start_time": None,
+                    "result": (None, None),
+                    "event": threading.Event(),
+                }
+                self.downloads[key] = download
+        if duplicate:
+            logger.debug(f"Already downloading {download["filename"]}, waiting for it")
+            download["event"].wait()
+            return download["result"]
+
+        generation = self.generation
+        try:
+            with self.slots:
+                if generation == self.generation:
+                    download["result"] = self.download_file(url, file_id, download, generation)
+        finally:
+            with self.lock:
+                self.downloads.pop(key, None)
+            download["event"].set()
+        return download["result"]
+
+
+    def download_file(self, url, file_id, download, generation):
+        """Download file into .part file, resuming it if it exists, and rename it when complete"""
+        temp_path = os.path.expanduser(peripherals.temp_path)
+        if not os.path.exists(temp_path):
+            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+        filename = download["filename"]
         if file_id:
             unique_filename = file_id + "_" + filename
         else:
-            unique_filename = filename
-        destination = os.path.join(os.path.expanduser(peripherals.temp_path), unique_filename)
-        if os.path.splitext(destination)[-1] == "" and extension:
-            destination = destination + "." + extension
-        self.active += 1
-        self.downloading = True
-        complete = False
-        with open(destination, "wb") as out:
-            while self.downloading:
-                data = response.read(CHUNK_SIZE)
-                if not data:
-                    complete = True
-                    break
-                out.write(data)
-        response.release_conn()
-        self.active -= 1
-        if self.active == 0:
-            self.downloading = True
-        if complete:
-            return destination, filename
-        logger.erorr("Error downloading file")
-        return None, None
+            # files without id often have same name (all tenor gifs are tenor.gif)
+            unique_filename = hashlib.sha1(download["key"].encode()).hexdigest()[:16] + "_" + filename
+        part_path = os.path.join(temp_path, unique_filename + PART_EXTENSION)
+
+        retries = 0
+        while True:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            validator = self.validators.get(part_path)
+            if offset and not validator:
+                offset = 0   # cant check that partial file is from same version of the file
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+            complete = False
+            try:
+                response = self.http.request("GET", url, headers=headers, preload_content=False)
+                if response.status == 416 and offset:   # range is invalid, file changed or part is broken
+                    response.drain_conn()
+                    os.remove(part_path)
+                    self.validators.pop(part_path, None)
+                    continue
+                if response.status not in (200, 206):
+                    logger.error(f"Error downloading file: status {response.status}")
+                    response.drain_conn()
+                    return None, None
+                if response.status == 206 and not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    response.drain_conn()
+                    os.remove(part_path)
+                    self.validators.pop(part_path, None)
+                    continue
+                if response.status == 200:
+                    offset = 0   # server does not support range or file has changed, start from beginning
+                    self.validators[part_path] = get_validator(response.headers)
+                length = response.headers.get("Content-Length")
+                download["total"] = offset + int(length) if length else None
+                download["done"] = download["resumed_from"] = offset
+                download["start_time"] = time.time()
+                if offset:
+                    logger.debug(f"Resuming download of {filename} from {offset} bytes")
+                with open(part_path, "ab" if offset else "wb") as out:
+                    while generation == self.generation:
+                        data = response.read(CHUNK_SIZE)
+                        if not data:
+                            complete = True
+                            break
+                        out.write(data)
+                        download["done"] += len(data)
+                if complete:
+                    response.release_conn()
+                else:
+                    response.close()   # dont return connection with unread data to the pool
+            except (urllib3.exceptions.HTTPError, OSError) as e:
+                retries += 1
+                if retries > RETRIES or generation != self.generation:
+                    logger.error(f"Error downloading file: {e}")
+                    return None, None
+                logger.warning(f"Download interrupted, resuming: {e}")
+                time.sleep(RETRY_DELAY)
+                continue
+            break
+
+        if not complete:
+            logger.info(f"Download of {filename} cancelled, keeping partial file")
+            return None, None
+        destination = os.path.join(temp_path, unique_filename)
+        content_type = response.headers.get("Content-Type")
+        if os.path.splitext(destination)[-1] == "" and content_type:
+            destination = destination + "." + content_type.split("/")[-1].replace("jpeg", "jpg")
+        os.replace(part_path, destination)
+        self.validators.pop(part_path, None)
+        return destination, filename
+
+
+    def get_progress(self):
+        """Get list of [filename, downloaded_bytes, total_bytes, bytes_per_second] for all running downloads, total can be None"""
+        progress = []
+        now = time.time()
+        with self.lock:
+            downloads = list(self.downloads.values())
+        for download in downloads:
+            if download["start_time"] is None:
+                continue
+            elapsed = now - download["start_time"]
+            speed = (download["done"] - download["resumed_from"]) / elapsed if elapsed > 0 else 0
+            progress.append([download["filename"], download["done"], download["total"], speed])
+        return progress
+
+
+    def get_progress_text(self):
+        """Get text with progress and speed of all running downloads and number of queued downloads"""
+        parts = []
+        for filename, done, total, speed in self.get_progress():
+            if total:
+                parts.append(f"{filename} {done * 100 // total}% {format_size(speed)}/s")
+            else:
+                parts.append(f"{filename} {format_size(done)} {format_size(speed)}/s")
+        with self.lock:
+            queued = len(self.downloads) - len(parts)
+        if queued:
+            parts.append(f"{queued} queued")
+        if not parts:
+            return None
+        return "Downloading: " + ", ".join(parts)
+
+
+    def get_active(self):
+        """Get number of queued and running downloads"""
+        return len(self.downloads)
+
 
     def cancel(self):
-        """Stops all active downloads"""
-        self.downloading = False
+        """Stops all active and queued downloads, their partial files are kept so they can be resumed"""
+        self.generation += 1
@@ -8,13 +8,14 @@ from itertools import chain
 
 import emoji
 
-from endcord.wide_ranges import WIDE_RANGES
+from endcord.wide_ranges import WIDE_INDEX, WIDE_PAGES
 from endcord.l10n import _
 
 logger = logging.getLogger(__name__)
 DAY_MS = 24 * 60 * 60 * 1000
 DISCORD_EPOCH_MS = 1420070400000
 TREE_EMOJI_REPLACE = "▮"
+CONTENT_CACHE_SIZE = 1000  # max number of messages with cached content in chat render cache
 
 
 TIME_DIVS = [1, 60, 3600, 86400, 2678400, 31190400]
@@ -226,28 +227,6 @@ def replace_emoji_string(line):
     return re.sub(match_emoji, TREE_EMOJI_REPLACE, line)
 
 
-def binary_search(codepoint, ranges):
-    """Binary-search a tuple of (start, end) ranges and return 1 if codepoint is inside any range, else 0"""
-    low = 0
-    high = len(ranges) - 1
-
-    if codepoint < ranges[0][0] or codepoint > ranges[high][1]:
-        return 0
-
-    while low <= high:
-        mid = (low + high) // 2
-        start, end = ranges[mid]
-
-        if codepoint > end:
-            low = mid + 1
-        elif codepoint < start:
-            high = mid - 1
-        else:
-            return 1
-
-    return 0
-
-
 def limit_width_wch(text, max_width):
     """Limit width of the text on the screen, because "wide characters" are 2 characters wide"""
     total_width = 0
@@ -256,7 +235,7 @@ def limit_width_wch(text, max_width):
         if 32 <= character < 0x7F:
             char_width = 1
         else:
-            char_width = 1 + binary_search(character, WIDE_RANGES)
+            char_width = 1 + WIDE_PAGES[WIDE_INDEX[character >> 8] << 8 | (character & 0xFF)]
         if total_width + char_width > max_width:
             return text[:i], total_width
         total_width += char_width
@@ -271,7 +250,7 @@ def len_wch(text):
         if 32 <= character < 0x7F:
             total_width += 1
         else:
-            total_width += 1 + binary_search(character, WIDE_RANGES)
+            total_width += 1 + WIDE_PAGES[WIDE_INDEX[character >> 8] << 8 | (character & 0xFF)]
     return total_width
 
 
@@ -284,11 +263,11 @@ if importlib.util.find_spec("endcord_cython") and importlib.util.find_spec(
 
     def limit_width_wch(text, max_width):
         """Limit width of the text on the screen, because "wide characters" are 2 characters wide"""
-        return limit_width_wch_cython(text, max_width, WIDE_RANGES)
+        return limit_width_wch_cython(text, max_width, WIDE_INDEX, WIDE_PAGES)
 
     def len_wch(text):
         """Calculate lenght of each character and store it in a bool list"""
-        return len_wch_cython(text, WIDE_RANGES)
+        return len_wch_cython(text, WIDE_INDEX, WIDE_PAGES)
 
 
 def normalize_string(input_string, max_length, emoji_safe=False, dots=False, fill=True):
@@ -800,6 +779,37 @@ def format_multiline_one_line_end(
     return line_format
 
 
+def normalize_format(line_format):
+    """
+    Convert line format to sorted and non-overlapping ranges, so it can be drawn in spans.
+    Where ranges overlap, earlier one has priority, as when drawing. Adjacent ranges with same color are merged.
+    """
+    if len(line_format) <= 1:
+        return line_format
+    points = set()
+    for format_part in line_format[1:]:
+        if format_part[1] < format_part[2]:
+            points.add(max(format_part[1], 0))
+            points.add(max(format_part[2], 0))
+    points = sorted(points)
+    normalized = [line_format[0]]
+    last_part = None
+    for num in range(len(points) - 1):
+        pos = points[num]
+        for format_part in line_format[1:]:
+            if format_part[1] <= pos < format_part[2]:
+                color = format_part[0]
+                break
+        else:
+            continue
+        if last_part and last_part[0] == color and last_part[2] == pos:
+            last_part[2] = points[num + 1]
+        else:
+            last_part = [color, pos, points[num + 1]]
+            normalized.append(last_part)
+    return normalized
+
+
 def ranges_multiline_one_line(ranges, line_len, newline_len, quote=False):
     """Generate ranges for one line"""
     line_ranges = []
@@ -986,6 +996,62 @@ def format_poll(poll):
     return content.strip("\n")
 
 
+def copy_ranges(ranges_lists):
+    """Copy lists of ranges so shifting them does not change originals"""
+    return [[format_range[:] for format_range in ranges] for ranges in ranges_lists]
+
+
+def chat_content_key(message, global_name):
+    """Get tuple of all message values that are used to build main message line"""
+    return (
+        message["content"],
+        message.get("edited"),
+        message["username"],
+        global_name,
+        len(message["mentions"]),
+        tuple(message.get("spoiled", ())),
+        tuple(
+            (embed["url"], embed["type"], embed.get("hidden"), "main_url" in embed)
+            for embed in message["embeds"]
+        ),
+        tuple(
+            (sticker["format_type"], sticker["name"]) for sticker in message["stickers"]
+        ),
+    )
+
+
+def chat_message_key(message, role_color, alt_role_color):
+    """Get tuple of all message values that change how message is drawn in chat"""
+    reference = message["referenced_message"]
+    if reference:
+        reference = (reference["id"], reference["user_id"], reference["content"])
+    poll = message.get("poll")
+    if poll:
+        poll = tuple(
+            (option["count"], option.get("me_voted")) for option in poll["options"]
+        )
+    return (
+        message["content"],
+        message.get("edited"),
+        message["username"],
+        message.get("global_name"),
+        message["nick"],
+        "deleted" in message,
+        "pending" in message,
+        role_color,
+        alt_role_color,
+        reference,
+        poll,
+        tuple(message.get("spoiled", ())),
+        tuple((embed["url"], embed.get("hidden")) for embed in message["embeds"]),
+        tuple(
+            (reaction["emoji"], reaction["count"], reaction["me"])
+            for reaction in message["reactions"]
+        ),
+        len(message["stickers"]),
+    )
+
+
 def generate_chat(
     messages,
     roles,
@@ -1000,6 +1066,7 @@ def generate_chat(
     last_seen_msg,
     show_blocked,
     config,
+    render_cache=None,
 ):
     """
     Generate chat according to provided formatting.
@@ -1037,6 +1104,7 @@ def generate_chat(
     limit_username normalizes length of username and global_name, by cropping them or appending spaces. Set to None to disable.
     Returned indexes correspond to each message as how many lines it is covering.
     use_nick will make it use nick instead global_name whenever possible.
+    render_cache is dict that holds lines of each message between calls, so only new and changed messages are formatted again.
     """
 
     # load from config
@@ -1088,12 +1156,12 @@ def generate_chat(
     # load formatted colors: [[id], [id, start, end]...]
     color_message = colors_formatted[0]
     color_newline = colors_formatted[1]
-    color_reply = colors_formatted[2]
-    color_reactions = colors_formatted[3]
+    color_reply = normalize_format(colors_formatted[2])
+    color_reactions = normalize_format(colors_formatted[3])
     color_mention_message = colors_formatted[8]
     color_mention_newline = colors_formatted[9]
-    color_mention_reply = colors_formatted[10]
-    color_mention_reactions = colors_formatted[11]
+    color_mention_reply = normalize_format(colors_formatted[10])
+    color_mention_reactions = normalize_format(colors_formatted[11])
 
     placeholder_timestamp = generate_timestamp(
         "2015-01-01T00:00:00.000000+00:00", format_timestamp
@@ -1133,6 +1201,43 @@ def generate_chat(
     end_name = pre_name_len + limit_username + 1
     len_messages = len(messages)
 
+    # drop all cached lines if anything they depend on has changed
+    if render_cache is not None:
+        render_context = (
+            max_length,
+            my_id,
+            tuple(my_roles),
+            show_blocked,
+            tuple(blocked),
+            id(member_roles),
+            len(member_roles),
+            id(roles),
+            len(roles),
+            id(channels),
+            len(channels),
+            id(config),
+            id(colors),
+            id(colors_formatted),
+        )
+        if render_cache.get("context") != render_context:
+            render_cache["context"] = render_context
+            render_cache["messages"] = {}
+        cached_messages = render_cache["messages"]
+        new_cached_messages = {}
+        # content is kept on resize and channel switch, so it has its own context
+        content_context = (
+            id(roles),
+            len(roles),
+            id(channels),
+            len(channels),
+            id(config),
+            id(colors_formatted),
+        )
+        if render_cache.get("content_context") != content_context:
+            render_cache["content_context"] = content_context
+            render_cache["contents"] = {}
+        cached_contents = render_cache["contents"]
+
     for num, message in enumerate(messages):
         if not message:  # failsafe
             continue
@@ -1140,6 +1245,9 @@ def generate_chat(
         temp_format = []
         temp_chat_map = []
         temp_wide_map = []
+        sep_chat = []  # separator lines above message, not cached
+        sep_format = []
+        sep_chat_map = []
         mentioned = False
         edited = message.get("edited")  # failsafe
         user_id = message.get("user_id")
@@ -1187,16 +1295,16 @@ def generate_chat(
 
         reply_color_format = color_base
 
-    # handle blocked messages
-    if blocked_mode and user_id in blocked and not show_blocked:
-        if blocked_mode == 1:
-            message["username"] = "blocked"
-            message["global_name"] = "blocked"
-            message["nick"] = "blocked"
-            message["content"] = _("blocked_message")
-            message["embeds"] = []
-            message["stickers"] = []
-            color_base = color_blocked
+        # handle blocked messages
+        if blocked_mode and user_id in blocked and not show_blocked:
+            if blocked_mode == 1:
+                message["username"] = "blocked"
+                message["global_name"] = "blocked"
+                message["nick"] = "blocked"
+                message["content"] = _("blocked_message")
+                message["embeds"] = []
+                message["stickers"] = []
+                color_base = color_blocked
             else:
                 temp_chat_map.append(None)
                 continue  # to not break message-to-chat conversion
@@ -1213,32 +1321,32 @@ def generate_chat(
                 )
             ):
                 if message_spacing:
-                    temp_chat.append(" " * max_length)
-                    temp_format.append([color_base])
-                    temp_chat_map.append((None, None, None, None, None, None))
+                    sep_chat.append(" " * max_length)
+                    sep_format.append([color_base])
+                    sep_chat_map.append((None, None, None, None, None, None))
                 # keep text always in center
                 filler = max_length - 3
                 filler_l = filler // 2
                 filler_r = filler - filler_l
-                temp_chat.append(
+                sep_chat.append(
                     f"{date_separator * filler_l}New{date_separator * filler_r}"
                 )
-                temp_format.append([color_deleted])
-                temp_chat_map.append(None)
+                sep_format.append([color_deleted])
+                sep_chat_map.append(None)
                 have_unseen_messages_line = True
                 if message_spacing:
-                    temp_chat.append(" " * max_length)
-                    temp_format.append([color_base])
-                    temp_chat_map.append(None)
+                    sep_chat.append(" " * max_length)
+                    sep_format.append([color_base])
+                    sep_chat_map.append(None)
 
             # date separator
             elif enable_separator and day_from_snowflake(
                 message["id"]
             ) != day_from_snowflake(messages[num + 1]["id"]):
                 if message_spacing:
-                    temp_chat.append(" " * max_length)
-                    temp_format.append([color_base])
-                    temp_chat_map.append(None)
+                    sep_chat.append(" " * max_length)
+                    sep_format.append([color_base])
+                    sep_chat_map.append(None)
                 # if this message is 1 day older than next message (up - past message)
                 date = generate_timestamp(
                     message["timestamp"], format_date, convert_timezone
@@ -1247,24 +1355,42 @@ def generate_chat(
                 filler = max_length - len(date)
                 filler_l = filler // 2
                 filler_r = filler - filler_l
-                temp_chat.append(
+                sep_chat.append(
                     f"{date_separator * filler_l}{date}{date_separator * filler_r}"
                 )
-                temp_format.append([color_separator])
-                temp_chat_map.append(None)
+                sep_format.append([color_separator])
+                sep_chat_map.append(None)
                 if message_spacing:
-                    temp_chat.append(" " * max_length)
-                    temp_format.append([color_base])
-                    temp_chat_map.append(None)
+                    sep_chat.append(" " * max_length)
+                    sep_format.append([color_base])
+                    sep_chat_map.append(None)
 
             # empty separator between messages not from same sender
             elif message_spacing and message["user_id"] != messages[num + 1]["user_id"]:
-                temp_chat.append(" " * max_length)
-                temp_format.append([color_base])
-                temp_chat_map.append(None)
+                sep_chat.append(" " * max_length)
+                sep_format.append([color_base])
+                sep_chat_map.append(None)
         except IndexError:
             pass
 
+        # reuse lines rendered in previous call if message is unchanged
+        if render_cache is not None:
+            message_key = chat_message_key(message, role_color, alt_role_color)
+            cached = cached_messages.get(message["id"])
+            if cached and cached[0] == message_key:
+                if cached[1] != num:
+                    cached[1] = num
+                    cached[4] = [(num, *line_map[1:]) for line_map in cached[4]]
+                new_cached_messages[message["id"]] = cached
+                wide_map.extend([len(chat) + len(cached[2]) - x for x in cached[5]])
+                chat.extend(cached[2])
+                chat_format.extend(cached[3])
+                chat_map.extend(cached[4])
+                chat.extend(sep_chat[::-1])
+                chat_format.extend(sep_format[::-1])
+                chat_map.extend(sep_chat_map[::-1])
+                continue
+
         # replied message line
         if message["referenced_message"]:
             ref_message = message["referenced_message"].copy()
@@ -1291,19 +1417,19 @@ def generate_chat(
                     content = ref_message["content"]
                     if emoji_as_text:
                         content = emoji.demojize(content)
-                    content, _ = replace_escaped_md(content)
+                    content, _ranges = replace_escaped_md(content)
                     content = replace_spoilers(content)
-                    content, _ = replace_discord_emoji(content)
-                    content, _ = replace_mentions(
+                    content, _ranges = replace_discord_emoji(content)
+                    content, _ranges = replace_mentions(
                         content,
                         ref_message["mentions"],
                         global_name=use_global_name,
                         use_nick=use_nick,
                     )
-                    content, _ = replace_roles(content, roles)
+                    content, _ranges = replace_roles(content, roles)
                     content = replace_discord_url(content)
-                    content, _ = replace_channels(content, channels)
-                    content, _ = replace_timestamps(content, convert_timezone)
+                    content, _ranges = replace_channels(content, channels)
+                    content, _ranges = replace_timestamps(content, convert_timezone)
                 if reply_embeds:
                     for embed in reply_embeds:
                         embed_url = embed["url"]
@@ -1421,159 +1547,21 @@ def generate_chat(
         elif message.get("webhook_id"):
             global_name += " [WEBHOOK]"
 
-        content = ""
         if "poll" in message:
             message["content"] = format_poll(message["poll"])
-        if message["content"]:
-            content = message["content"]
-            if emoji_as_text:
-                content = emoji.demojize(content)
-            content, emoji_ranges = replace_discord_emoji(content)
-            content, mention_ranges = replace_mentions(
-                content,
-                message["mentions"],
-                emoji_ranges,
-                global_name=use_global_name,
-                use_nick=use_nick,
-            )
-            content, role_ranges = replace_roles(
-                content, roles, emoji_ranges, mention_ranges
-            )
-            mention_ranges += role_ranges
-            content = replace_discord_url(content, emoji_ranges, mention_ranges)
-            content, channel_ranges = replace_channels(
-                content, channels, emoji_ranges, mention_ranges
-            )
-            content, timestamp_ranges = replace_timestamps(
-                content, convert_timezone, emoji_ranges, mention_ranges, channel_ranges
-            )
-            shift_ranges_all(
-                pre_content_len,
-                emoji_ranges,
-                mention_ranges,
-                channel_ranges,
-                timestamp_ranges,
-            )
-            if content.startswith("> "):
-                content = quote_character + " " + content[2:]
-                quote = True
-        else:
-            emoji_ranges = []
-            mention_ranges = []
-            channel_ranges = []
-            timestamp_ranges = []
-        for embed in message["embeds"]:
-            embed_url = embed["url"]
-            if embed_url and not embed.get("hidden") and embed_url not in content:
-                if content:
-                    content += "\n"
-                if "main_url" not in embed:  # its attachment
-                    if trim_embed_url_size:
-                        embed_url = trim_string(embed_url, trim_embed_url_size)
-                    content += f"[{clean_type(embed['type'])} attachment]: {embed_url}"
-                elif embed["type"] == "rich":
-                    content += f"[rich embed]:\n{embed_url}"
-                else:
-                    if trim_embed_url_size:
-                        embed_url = trim_string(embed_url, trim_embed_url_size)
-                    content += f"[{clean_type(embed['type'])} embed]: {embed_url}"
-        for sticker in message["stickers"]:
-            sticker_type = sticker["format_type"]
-            if content:
-                content += "\n"
-            if sticker_type == 1:
-                content += f"[png sticker] (can be opened): {sticker['name']}"
-            elif sticker_type == 2:
-                content += f"[apng sticker] (can be opened): {sticker['name']}"
-            elif sticker_type == 3:
-                content += f"[lottie sticker] (cannot be opened): {sticker['name']}"
-            else:
-                content += f"[gif sticker] (can be opened): {sticker['name']}"
 
-        message_line = lazy_replace(
-            format_message,
-            "%username",
-            lambda: normalize_string(
-                message["username"], limit_username, emoji_safe=True
-            ),
-        )
-        message_line = lazy_replace(
-            message_line,
-            "%global_name",
-            lambda: normalize_string(global_name, limit_username, emoji_safe=True),
-        )
-        message_line = lazy_replace(
-            message_line,
-            "%timestamp",
-            lambda: generate_timestamp(
-                message["timestamp"], format_timestamp, convert_timezone
-            ),
-        )
-        message_line = message_line.replace("%edited", edited_string if edited else "")
-        message_line = message_line.replace("%content", content)
-
-        # find all code snippets and blocks
-        code_snippets = []
-        code_blocks = []
-        for match in re.finditer(match_md_code_snippet, message_line):
-            code_snippets.append([match.start(), match.end()])
-        for match in re.finditer(match_md_code_block, message_line):
-            code_blocks.append([match.start(), match.end()])
-
-        # find all urls
-        urls = []
-        if color_chat_url:
-            for match in re.finditer(match_url, message_line):
-                start, end = match.span()
-                skip = False
-                for except_range in chain(code_snippets, code_blocks):
-                    start_r = except_range[0]
-                    end_r = except_range[1]
-                    if (
-                        start > start_r
-                        and start < end_r
-                        and end > start_r
-                        and end <= end_r
-                    ):
-                        skip = True
-                        break
-                if not skip:
-                    urls.append([start, end])
-
-        # find spoilers - must be after all other replacements
-        spoilers = []
-        for match in re.finditer(match_md_spoiler, message_line):
-            spoilers.append([match.start(), match.end()])
-        spoiled = message.get("spoiled")
-        if spoiled:
-            spoilers = [
-                value for i, value in enumerate(spoilers) if i not in spoiled
-            ]  # exclude spoiled messages
-
-        # find all markdown and correct format indexes
-        message_line, md_format, md_indexes = format_md_all(
-            message_line, pre_content_len, chain(code_snippets, code_blocks, urls)
-        )
-        if md_indexes:
-            move_by_indexes(
-                md_indexes,
-                urls,
-                spoilers,
-                code_snippets,
-                code_blocks,
-                emoji_ranges,
-                mention_ranges,
-                channel_ranges,
-                timestamp_ranges,
-            )
-        message_line, escaped_indexes = replace_escaped_md(
-            message_line, chain(code_snippets, code_blocks, urls)
-        )
-
-        # corrent format indexes for removed markdown escape characters "\"
-        if escaped_indexes:
-            move_by_indexes(
-                escaped_indexes,
+        # reuse content with all its ranges, they dont depend on width
+        content_cached = None
+        if render_cache is not None:
+            content_key = chat_content_key(message, global_name)
+            content_cached = cached_contents.pop(message["id"], None)
+            if content_cached and content_cached[0] != content_key:
+                content_cached = None
+        if content_cached:
+            cached_contents[message["id"]] = content_cached  # move to end
+            message_line = content_cached[1]
+            quote = content_cached[2]
+            (
                 md_format,
                 urls,
                 spoilers,
@@ -1583,21 +1571,205 @@ def generate_chat(
                 mention_ranges,
                 channel_ranges,
                 timestamp_ranges,
-            )
+            ) = copy_ranges(content_cached[3])
+        else:
+            content = ""
+            if message["content"]:
+                content = message["content"]
+                if emoji_as_text:
+                    content = emoji.demojize(content)
+                content, emoji_ranges = replace_discord_emoji(content)
+                content, mention_ranges = replace_mentions(
+                    content,
+                    message["mentions"],
+                    emoji_ranges,
+                    global_name=use_global_name,
+                    use_nick=use_nick,
+                )
+                content, role_ranges = replace_roles(
+                    content, roles, emoji_ranges, mention_ranges
+                )
+                mention_ranges += role_ranges
+                content = replace_discord_url(content, emoji_ranges, mention_ranges)
+                content, channel_ranges = replace_channels(
+                    content, channels, emoji_ranges, mention_ranges
+                )
+                content, timestamp_ranges = replace_timestamps(
+                    content, convert_timezone, emoji_ranges, mention_ranges, channel_ranges
+                )
+                shift_ranges_all(
+                    pre_content_len,
+                    emoji_ranges,
+                    mention_ranges,
+                    channel_ranges,
+                    timestamp_ranges,
+                )
+                if content.startswith("> "):
+                    content = quote_character + " " + content[2:]
+                    quote = True
+            else:
+                emoji_ranges = []
+                mention_ranges = []
+                channel_ranges = []
+                timestamp_ranges = []
+            for embed in message["embeds"]:
+                embed_url = embed["url"]
+                if embed_url and not embed.get("hidden") and embed_url not in content:
+                    if content:
+                        content += "\n"
+                    if "main_url" not in embed:  # its attachment
+                        if trim_embed_url_size:
+                            embed_url = trim_string(embed_url, trim_embed_url_size)
+                        content += f"[{clean_type(embed['type'])} attachment]: {embed_url}"
+                    elif embed["type"] == "rich":
+                        content += f"[rich embed]:\n{embed_url}"
+                    else:
+                        if trim_embed_url_size:
+                            embed_url = trim_string(embed_url, trim_embed_url_size)
+                        content += f"[{clean_type(embed['type'])} embed]: {embed_url}"
+            for sticker in message["stickers"]:
+                sticker_type = sticker["format_type"]
+                if content:
+                    content += "\n"
+                if sticker_type == 1:
+                    content += f"[png sticker] (can be opened): {sticker['name']}"
+                elif sticker_type == 2:
+                    content += f"[apng sticker] (can be opened): {sticker['name']}"
+                elif sticker_type == 3:
+                    content += f"[lottie sticker] (cannot be opened): {sticker['name']}"
+                else:
+                    content += f"[gif sticker] (can be opened): {sticker['name']}"
 
-        # delete all format ranges that are inside spoiler ranges
-        if spoilers:
-            delete_ranges(
-                spoilers,
-                md_format,
-                urls,
-                code_snippets,
-                code_blocks,
-                emoji_ranges,
-                mention_ranges,
-                channel_ranges,
-                timestamp_ranges,
+            message_line = lazy_replace(
+                format_message,
+                "%username",
+                lambda: normalize_string(
+                    message["username"], limit_username, emoji_safe=True
+                ),
+            )
+            message_line = lazy_replace(
+                message_line,
+                "%global_name",
+                lambda: normalize_string(global_name, limit_username, emoji_safe=True),
+            )
+            message_line = lazy_replace(
+                message_line,
+                "%timestamp",
+                lambda: generate_timestamp(
+                    message["timestamp"], format_timestamp, convert_timezone
+                ),
+            )
+            message_line = message_line.replace("%edited", edited_string if edited else "")
+            message_line = message_line.replace("%content", content)
+
+            # find all code snippets and blocks
+            code_snippets = []
+            code_blocks = []
+            for match in re.finditer(match_md_code_snippet, message_line):
+                code_snippets.append([match.start(), match.end()])
+            for match in re.finditer(match_md_code_block, message_line):
+                code_blocks.append([match.start(), match.end()])
+
+            # find all urls
+            urls = []
+            if color_chat_url:
+                for match in re.finditer(match_url, message_line):
+                    start, end = match.span()
+                    skip = False
+                    for except_range in chain(code_snippets, code_blocks):
+                        start_r = except_range[0]
+                        end_r = except_range[1]
+                        if (
+                            start > start_r
+                            and start < end_r
+                            and end > start_r
+                            and end <= end_r
+                        ):
+                            skip = True
+                            break
+                    if not skip:
+                        urls.append([start, end])
+
+            # find spoilers - must be after all other replacements
+            spoilers = []
+            for match in re.finditer(match_md_spoiler, message_line):
+                spoilers.append([match.start(), match.end()])
+            spoiled = message.get("spoiled")
+            if spoiled:
+                spoilers = [
+                    value for i, value in enumerate(spoilers) if i not in spoiled
+                ]  # exclude spoiled messages
+
+            # find all markdown and correct format indexes
+            message_line, md_format, md_indexes = format_md_all(
+                message_line, pre_content_len, chain(code_snippets, code_blocks, urls)
+            )
+            if md_indexes:
+                move_by_indexes(
+                    md_indexes,
+                    urls,
+                    spoilers,
+                    code_snippets,
+                    code_blocks,
+                    emoji_ranges,
+                    mention_ranges,
+                    channel_ranges,
+                    timestamp_ranges,
+                )
+            message_line, escaped_indexes = replace_escaped_md(
+                message_line, chain(code_snippets, code_blocks, urls)
             )
+
+            # corrent format indexes for removed markdown escape characters "\"
+            if escaped_indexes:
+                move_by_indexes(
+                    escaped_indexes,
+                    md_format,
+                    urls,
+                    spoilers,
+                    code_snippets,
+                    code_blocks,
+                    emoji_ranges,
+                    mention_ranges,
+                    channel_ranges,
+                    timestamp_ranges,
+                )
+
+            # delete all format ranges that are inside spoiler ranges
+            if spoilers:
+                delete_ranges(
+                    spoilers,
+                    md_format,
+                    urls,
+                    code_snippets,
+                    code_blocks,
+                    emoji_ranges,
+                    mention_ranges,
+                    channel_ranges,
+                    timestamp_ranges,
+                )
+            if render_cache is not None and ":R>" not in message["content"]:
+                cached_contents[message["id"]] = [
+                    content_key,
+                    message_line,
+                    quote,
+                    copy_ranges(
+                        (
+                            md_format,
+                            urls,
+                            spoilers,
+                            code_snippets,
+                            code_blocks,
+                            emoji_ranges,
+                            mention_ranges,
+                            channel_ranges,
+                            timestamp_ranges,
+                        )
+                    ),
+                ]
+                if len(cached_contents) > CONTENT_CACHE_SIZE:
+                    del cached_contents[next(iter(cached_contents))]
+
         standout_ranges = chain(
             timestamp_ranges, mention_ranges, channel_ranges, emoji_ranges
         )  # code_snippets are separated
@@ -1746,7 +1918,7 @@ def generate_chat(
                     color_mention_chat_edited
                     + [len_message_line - len_edited, len_message_line]
                 )
-            temp_format.append(format_line)
+            temp_format.append(normalize_format(format_line))
         else:
             format_line = color_message[:]
             format_line += format_multiline_one_line_format(
@@ -1778,7 +1950,7 @@ def generate_chat(
                         len_message_line,
                     ]
                 )
-            temp_format.append(format_line)
+            temp_format.append(normalize_format(format_line))
 
         # newline
         line_num = 1
@@ -1969,7 +2141,7 @@ def generate_chat(
                         color_mention_chat_edited
                         + [len_new_line - len_edited, len_new_line]
                     )
-                temp_format.append(format_line)
+                temp_format.append(normalize_format(format_line))
             else:
                 format_line = color_newline[:]
                 format_line += format_multiline_one_line_format(
@@ -1998,7 +2170,7 @@ def generate_chat(
                     format_line.append(
                         [*color_chat_edited, len_new_line - len_edited, len_new_line]
                     )
-                temp_format.append(format_line)
+                temp_format.append(normalize_format(format_line))
             line_num += 1
 
         # reactions
@@ -2052,10 +2224,29 @@ def generate_chat(
 
         # invert message lines order and append them to chat
         # it is inverted because chat is drawn from down to upside
+        temp_chat.reverse()
+        temp_format.reverse()
+        temp_chat_map.reverse()
+        # relative timestamps must be generated each time
+        if render_cache is not None and ":R>" not in message["content"]:
+            new_cached_messages[message["id"]] = [
+                message_key,
+                num,
+                temp_chat,
+                temp_format,
+                temp_chat_map,
+                temp_wide_map,
+            ]
         wide_map.extend([len(chat) + len(temp_chat) - x for x in temp_wide_map])
-        chat.extend(temp_chat[::-1])
-        chat_format.extend(temp_format[::-1])
-        chat_map.extend(temp_chat_map[::-1])
+        chat.extend(temp_chat)
+        chat_format.extend(temp_format)
+        chat_map.extend(temp_chat_map)
+        chat.extend(sep_chat[::-1])
+        chat_format.extend(sep_format[::-1])
+        chat_map.extend(sep_chat_map[::-1])
+
+    if render_cache is not None:
+        render_cache["messages"] = new_cached_messages
     return chat, chat_format, chat_map, wide_map
 
 
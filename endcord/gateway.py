@@ -3,6 +3,7 @@ import gc
 import http.client
 import logging
 import random
+import re
 import socket
 import ssl
 import struct
@@ -12,6 +13,8 @@ import traceback
 import urllib
 import urllib.parse
 import zlib
+from collections import deque
+from itertools import chain
 
 try:
     import orjson as json
@@ -21,12 +24,22 @@ except ImportError:
     except ImportError:
         import json
 
+# optional gateway transport compression
+try:
+    from compression import zstd  # python 3.14+
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
 import socks
 import websocket
 from discord_protos import PreloadedUserSettings
 from google.protobuf.json_format import MessageToDict
 
 from endcord import debug, perms
+from endcord.json_stream import JsonStream
 from endcord.message import prepare_message
 
 DISCORD_HOST = "discord.com"
@@ -37,14 +50,48 @@ DEFAULT_CAPABILITIES = 30717
 DEFAULT_INTENTS = 50364033
 QOS_HEARTBEAT = True
 QOS_PAYLOAD = {"ver": 26, "active": True, "reason": "foregrounded"}
-inflator = zlib.decompressobj()
+BUFFER_SIZE_MESSAGES = 10000   # max buffered events not yet taken by app
+BUFFER_SIZE_OTHER = 1000
+EVENT_SKIP = 1   # event handler return codes: dont pass event to extensions
+EVENT_STOP = 2   # stop receiver
+EVENT_FREE = 3   # event is large, free memory after handling it
+EVENT_PREFIX = re.compile(rb'{"t":"([A-Z0-9_]+)","s":(\d+),"op":0,')
+STREAM_MIN_SIZE = 64 * 1024   # compressed messages larger than this are checked for streamed events
+STREAM_CHUNK_SIZE = 256 * 1024   # max decompressed text decoded at once
+STREAM_INPUT_SIZE = 32 * 1024   # compressed data decompressed at once when streaming zstd
+DECOMPRESS_ERRORS = (zlib.error, zstd.ZstdError) if zstd else (zlib.error, )
+# fields of streamed events used by their handlers, None keeps whole value, see json_stream.reduce_fields
+GUILD_FIELDS = {
+    **dict.fromkeys(("id", "unavailable", "member_count", "features", "owner_id", "name", "description", "premium_tier")),
+    "properties": dict.fromkeys(("features", "owner_id", "name", "description", "premium_tier")),
+    "channels": dict.fromkeys(("id", "type", "name", "topic", "parent_id", "position", "permission_overwrites", "rate_limit_per_user", "last_message_id")),
+    "roles": dict.fromkeys(("id", "name", "color", "position", "hoist", "permissions")),
+    "threads": dict.fromkeys(("id", "type", "owner_id", "name", "thread_metadata", "message_count", "parent_id", "member", "last_message_id")),
+    "emojis": dict.fromkeys(("id", "name", "available")),
+    "stickers": dict.fromkeys(("id", "name", "available")),
+}
+READY_FIELDS = {
+    **dict.fromkeys(("resume_gateway_url", "session_id", "user", "auth_token", "private_channels", "user_guild_settings", "user_settings_proto", "user_settings")),
+    "guilds": GUILD_FIELDS,
+    "users": dict.fromkeys(("id", "username", "global_name")),
+    "read_state": {"entries": dict.fromkeys(("id", "last_message_id", "mention_count"))},
+    "relationships": dict.fromkeys(("id", "type", "user_ignored")),
+    "merged_members": dict.fromkeys(("user_id", "id", "roles")),
+}
+READY_SUPPLEMENTAL_FIELDS = {
+    "merged_presences": {
+        "guilds": dict.fromkeys(("user_id", "status", "activities")),
+        "friends": dict.fromkeys(("user_id", "status", "activities")),
+    },
+}
+STREAMED_EVENTS = {"READY": READY_FIELDS, "READY_SUPPLEMENTAL": READY_SUPPLEMENTAL_FIELDS}
 logger = logging.getLogger(__name__)
 status_unpacker = struct.Struct("!H")
 
 
-def zlib_decompress(data):
+def zlib_decompress(inflator, data):
     """Decompress zlib data, if it is not zlib compressed, return data instead"""
-    if len(data) < 4 or data[-4:] != ZLIB_SUFFIX:
+    if not data.endswith(ZLIB_SUFFIX):   # no slice copy for each frame
         return data
     try:
         return inflator.decompress(data)
@@ -53,11 +100,60 @@ def zlib_decompress(data):
         return None
 
 
-def reset_inflator():
-    """Resets inflator object"""
-    global inflator
-    del inflator
-    inflator = zlib.decompressobj()   # noqa
+def zlib_decompress_chunks(inflator, data):
+    """Decompress zlib data in chunks of at most STREAM_CHUNK_SIZE"""
+    chunk = inflator.decompress(data, STREAM_CHUNK_SIZE)
+    while True:
+        yield chunk
+        tail = inflator.unconsumed_tail
+        if not tail and len(chunk) < STREAM_CHUNK_SIZE:
+            return
+        chunk = inflator.decompress(tail, STREAM_CHUNK_SIZE)
+
+
+def zstd_decompress_chunks(decompressor, data):
+    """Decompress zstd data in chunks, feeding STREAM_INPUT_SIZE of compressed data at once"""
+    view = memoryview(data)   # slices dont copy data
+    for start in range(0, len(view), STREAM_INPUT_SIZE):
+        yield decompressor.decompress(view[start:start + STREAM_INPUT_SIZE])
+
+
+def zstd_decompressobj():
+    """Create zstd streaming decompression context"""
+    if zstd.__name__ == "zstandard":
+        return zstd.ZstdDecompressor().decompressobj()
+    return zstd.ZstdDecompressor()
+
+
+def decode_stream(chunks, streamed_events):
+    """
+    If decompressed chunks are one of streamed events, decode it while decompressing, keeping only fields
+    needed by its handler, so whole document is never in memory. streamed_events is dict of optext: fields.
+    Return (decompressed_data, None) for other events and (None, response) for streamed events.
+    """
+    first_chunk = b""
+    for chunk in chunks:
+        first_chunk += chunk
+        if len(first_chunk) >= 64:   # enough to match event prefix
+            break
+    match = EVENT_PREFIX.match(first_chunk)
+    if not match or match.group(1).decode("ascii") not in streamed_events:
+        return first_chunk + b"".join(chunks), None
+    fields = streamed_events[match.group(1).decode("ascii")]
+    stream = JsonStream(chain((first_chunk,), chunks))
+    response = {}
+    try:
+        for key in stream.items():
+            if key == "d":
+                response[key] = stream.fields(fields)
+            else:
+                response[key] = stream.value()
+    except ValueError as e:
+        logger.error(f"Streamed json decoding error: {e}")
+        response = None
+    for _ in chunks:   # decompress rest so decompressor stays usable
+        pass
+    return None, response
 
 
 def double_get(data, key1, key2, default=None):
@@ -104,15 +200,20 @@ class Gateway():
         self.sequence = None
         self.resume_gateway_url = ""
         self.session_id = ""
+        self.inflator = None   # decompression contexts are created for each connection
+        self.zstd_decompressor = None
         self.clear_ready_vars()
         self.want_member_list = False
         self.want_summaries = True
-        self.messages_buffer = []
-        self.typing_buffer = []
-        self.summaries_buffer = []
-        self.msg_ack_buffer = []
-        self.threads_buffer = []
-        self.call_buffer = []
+        self.messages_buffer = deque(maxlen=BUFFER_SIZE_MESSAGES)
+        self.typing_buffer = deque(maxlen=BUFFER_SIZE_OTHER)
+        self.summaries_buffer = deque(maxlen=BUFFER_SIZE_OTHER)
+        self.msg_ack_buffer = deque(maxlen=BUFFER_SIZE_OTHER)
+        self.threads_buffer = deque(maxlen=BUFFER_SIZE_OTHER)
+        self.call_buffer = deque(maxlen=BUFFER_SIZE_OTHER)
+        self.events_ready = threading.Event()
+        self.changed = set()
+        self.changed_lock = threading.Lock()
         self.reconnect_requested = False
         self.status_changed = False
         self.dm_activities_changed = False
@@ -121,8 +222,10 @@ class Gateway():
         self.proto_changed = False
         self.legacy = "spacebar" in self.host
         self.activities = []
+        self.activities_index = {}   # guild_id: member lists
         self.activities_changed = []
         self.subscribed_activities = []
+        self.subscribed_activities_index = {}   # guild_id: (members, {user_id: member_num})
         self.subscribed_activities_changed = []
         self.subscribed_channels = []
         self.emojis = []
@@ -135,6 +238,51 @@ class Gateway():
         self.querying_members = False
         self.member_query_results = []
         self.resumable = False
+        self.event_extensions = False
+        self.event_stats = {}
+        self.disabled_events = {"GUILD_MEMBER_LIST_UPDATE"}   # want_member_list is False
+        self.event_handlers = {
+            "READY": self.handle_ready,
+            "READY_SUPPLEMENTAL": self.handle_ready_supplemental,
+            "SESSIONS_REPLACE": self.handle_sessions_replace,
+            "PRESENCE_UPDATE": self.handle_presence_update,
+            "TYPING_START": self.handle_typing_start,
+            "MESSAGE_CREATE": self.handle_message_create,
+            "MESSAGE_UPDATE": self.handle_message_update,
+            "MESSAGE_DELETE": self.handle_message_delete,
+            "MESSAGE_REACTION_ADD": self.handle_message_reaction_add,
+            "MESSAGE_REACTION_ADD_MANY": self.handle_message_reaction_add_many,
+            "MESSAGE_REACTION_REMOVE": self.handle_message_reaction_remove,
+            "CONVERSATION_SUMMARY_UPDATE": self.handle_conversation_summary_update,
+            "MESSAGE_ACK": self.handle_message_ack,
+            "GUILD_MEMBERS_CHUNK": self.handle_guild_members_chunk,
+            "THREAD_LIST_SYNC": self.handle_thread_list_sync,
+            "GUILD_MEMBER_LIST_UPDATE": self.handle_guild_member_list_update,
+            "USER_SETTINGS_PROTO_UPDATE": self.handle_user_settings_proto_update,
+            "USER_GUILD_SETTINGS_UPDATE": self.handle_user_guild_settings_update,
+            "USER_UPDATE": self.handle_user_update,
+            "GUILD_MEMBER_UPDATE": self.handle_guild_member_update,
+            "APPLICATION_COMMAND_AUTOCOMPLETE_RESPONSE": self.handle_app_command_autocomplete_response,
+            "MESSAGE_POLL_VOTE_ADD": lambda data: self.handle_message_poll_vote(data, "MESSAGE_POLL_VOTE_ADD"),
+            "MESSAGE_POLL_VOTE_REMOVE": lambda data: self.handle_message_poll_vote(data, "MESSAGE_POLL_VOTE_REMOVE"),
+            "VOICE_STATE_UPDATE": self.handle_voice_state_update,
+            "VOICE_SERVER_UPDATE": self.handle_voice_server_update,
+            "CALL_CREATE": self.handle_call_create,
+            "CALL_UPDATE": self.handle_call_update,
+            "CALL_DELETE": self.handle_call_delete,
+            "THREAD_UPDATE": self.handle_thread_update,
+            "THREAD_CREATE": self.handle_thread_update,
+            "THREAD_DELETE": self.handle_thread_delete,
+            "CHANNEL_CREATE": lambda data: self.handle_channel_event(data, "CHANNEL_CREATE"),
+            "CHANNEL_UPDATE": lambda data: self.handle_channel_event(data, "CHANNEL_UPDATE"),
+            "CHANNEL_DELETE": lambda data: self.handle_channel_event(data, "CHANNEL_DELETE"),
+            "GUILD_CREATE": lambda data: self.handle_guild_event(data, "GUILD_CREATE"),
+            "GUILD_UPDATE": lambda data: self.handle_guild_event(data, "GUILD_UPDATE"),
+            "GUILD_DELETE": lambda data: self.handle_guild_event(data, "GUILD_DELETE"),
+            "GUILD_ROLE_CREATE": lambda data: self.handle_guild_role_event(data, "GUILD_ROLE_CREATE"),
+            "GUILD_ROLE_UPDATE": lambda data: self.handle_guild_role_event(data, "GUILD_ROLE_UPDATE"),
+            "GUILD_ROLE_DELETE": lambda data: self.handle_guild_role_event(data, "GUILD_ROLE_DELETE"),
+        }
         threading.Thread(target=self.thread_guard, daemon=True, args=()).start()
 
 
@@ -154,6 +302,15 @@ class Gateway():
         self.blocked = []
         self.my_roles = []
         self.guilds_changed = False
+        # indexes pointing to same objects that are in lists above
+        self.guilds_index = {}   # guild_id: guild
+        self.channels_index = {}   # channel_id: (guild, channel)
+        self.roles_index = {}   # guild_id: guild roles
+        self.role_index = {}   # role_id: role
+        self.my_roles_index = {}   # guild_id: my guild roles
+        self.members_index = {}   # guild_id: (guild members, {user_id: member})
+        self.dms_index = {}   # channel_id: dm
+        self.dm_activities_index = {}   # user_id: activity_num
         self.app_command_autocomplete_resp = []
         self.voice_gateway_data = {}
         self.voice_gateway_data_ready = 0
@@ -163,6 +320,91 @@ class Gateway():
         """Load already initialized extensions from app class"""
         self.extensions = extensions
         self.extension_cache = []
+        self.event_extensions = False
+        for extension in extensions:
+            if callable(getattr(extension, "on_gateway_event", None)):
+                self.event_extensions = True
+                break
+
+
+    def register_event_handler(self, optext, handler):
+        """
+        Register handler for gateway dispatch event, replacing existing one, and return replaced handler.
+        Handler is called as handler(data) and can return EVENT_SKIP or EVENT_STOP.
+        """
+        old_handler = self.event_handlers.get(optext)
+        if handler:
+            self.event_handlers[optext] = handler
+        else:
+            self.event_handlers.pop(optext, None)
+        return old_handler
+
+
+    def mark_changed(self, category):
+        """Mark category of data as changed and wake up anyone waiting for changes"""
+        with self.changed_lock:
+            self.changed.add(category)
+        self.events_ready.set()
+
+
+    def push_event(self, buffer, event, category):
+        """Add event to the buffer and mark its category as changed"""
+        if len(buffer) == buffer.maxlen:
+            logger.warning(f"Gateway event buffer is full, dropping oldest event ({len(buffer)} events)")
+        buffer.append(event)
+        self.mark_changed(category)
+
+
+    def wait_changes(self, timeout):
+        """
+        Block until some category is marked as changed or timeout expires.
+        Return set of changed categories:
+        messages, typing, summaries, msg_ack, threads, calls - new events in buffers
+        state - anything else handled in receiver, connection state, errors, or external wakeup (like input)
+        """
+        self.events_ready.wait(timeout)
+        with self.changed_lock:
+            self.events_ready.clear()
+            changed = self.changed
+            self.changed = set()
+        return changed
+
+
+    def count_event(self, optext, elapsed):
+        """Add event to per-event counter and timing table"""
+        stats = self.event_stats.get(optext)
+        if stats:
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+        else:
+            self.event_stats[optext] = [1, elapsed, elapsed]
+
+
+    def get_event_stats(self):
+        """Get formatted table of received events with their count, total and max handling time"""
+        text = "Gateway event stats (count, total ms, max ms):"
+        for optext, stats in sorted(self.event_stats.items(), key=lambda x: x[1][1], reverse=True):
+            text += f"\n    {optext} - {stats[0]}, {round(stats[1] * 1000, 3)}, {round(stats[2] * 1000, 3)}"
+        return text
+
+
+    def skip_undecoded(self, data):
+        """
+        Check if dispatch event is not handled and not wanted by extensions, so json decoding can be skipped.
+        Sequence is still updated from raw data.
+        """
+        if self.event_extensions:
+            return False
+        match = EVENT_PREFIX.match(data)
+        if not match:
+            return False
+        optext = match.group(1).decode("ascii")
+        if optext in self.event_handlers and optext not in self.disabled_events:
+            return False
+        self.sequence = int(match.group(2))
+        self.count_event(optext, 0)
+        return True
 
 
     def execute_extensions_method_nochain(self, method_name, *args, cache=False):
@@ -207,17 +449,54 @@ class Gateway():
             gateway_url = self.resume_gateway_url
         else:
             gateway_url = self.gateway_url
+        # new decompression context for each connection
+        if zstd:
+            self.zstd_decompressor = zstd_decompressobj()
+            self.inflator = None
+            compress = "zstd-stream"
+        else:
+            self.zstd_decompressor = None
+            self.inflator = zlib.decompressobj()
+            compress = "zlib-stream"
         self.ws = websocket.WebSocket()
         if self.proxy.scheme:
             self.ws.connect(
-                gateway_url + "/?v=9&encoding=json&compress=zlib-stream",
+                gateway_url + f"/?v=9&encoding=json&compress={compress}",
                 header=self.header,
                 proxy_type=self.proxy.scheme,
                 http_proxy_host=self.proxy.hostname,
                 http_proxy_port=self.proxy.port,
             )
         else:
-            self.ws.connect(gateway_url + "/?v=9&encoding=json&compress=zlib-stream", header=self.header)
+            self.ws.connect(gateway_url + f"/?v=9&encoding=json&compress={compress}", header=self.header)
+
+
+    def decompress(self, data):
+        """Decompress data with transport compression of this connection, if it is not compressed, return data instead"""
+        if isinstance(data, str):   # text frames are not compressed
+            return data
+        if not self.zstd_decompressor:
+            return zlib_decompress(self.inflator, data)
+        try:
+            return self.zstd_decompressor.decompress(data)
+        except zstd.ZstdError as e:
+            logger.error(f"zstd error: {e}")
+            return None
+
+
+    def decompress_stream(self, data, streamed_events):
+        """Decompress large data with transport compression of this connection and decode it if its streamed event, see decode_stream"""
+        if self.zstd_decompressor:
+            chunks = zstd_decompress_chunks(self.zstd_decompressor, data)
+        elif data.endswith(ZLIB_SUFFIX):
+            chunks = zlib_decompress_chunks(self.inflator, data)
+        else:
+            return data, None
+        try:
+            return decode_stream(chunks, streamed_events)
+        except DECOMPRESS_ERRORS as e:
+            logger.error(f"Decompression error: {e}")
+            return None, None
 
 
     def disconnect_ws(self, timeout=2, status=1000):
@@ -276,7 +555,7 @@ class Gateway():
 
         self.connect_ws()
         self.state = 1
-        self.heartbeat_interval = int(json.loads(zlib_decompress(self.ws.recv()))["d"]["heartbeat_interval"])
+        self.heartbeat_interval = int(json.loads(self.decompress(self.ws.recv()))["d"]["heartbeat_interval"])
         self.receiver_thread = threading.Thread(target=self.safe_function_wrapper, daemon=True, args=(self.receiver, ))
         self.receiver_thread.start()
         self.heartbeat_thread = threading.Thread(target=self.send_heartbeat, daemon=True)
@@ -294,6 +573,7 @@ class Gateway():
             function(*args)
         except BaseException as e:
             self.error = "".join(traceback.format_exception(e))
+            self.mark_changed("state")
 
 
     def send(self, request):
@@ -306,73 +586,74 @@ class Gateway():
 
     def add_member_roles(self, guild_id, user_id, roles, nick=None, nonce=None):
         """Add member-role pair to corresponding guild, number of users per guild is limited"""
-        num = -1
-        for num, guild in enumerate(self.member_roles):
-            if guild["guild_id"] == guild_id:
-                break
+        if guild_id in self.members_index:
+            guild, guild_members = self.members_index[guild_id]
         else:
-            self.member_roles.append({
+            guild = {
                 "guild_id": guild_id,
                 "members": [],
-            })
-            num += 1
-        for member in self.member_roles[num]["members"]:
-            if member["user_id"] == user_id:
-                return
-        self.member_roles[num]["members"].insert(0, {
+            }
+            guild_members = {}
+            self.member_roles.append(guild)
+            self.members_index[guild_id] = (guild, guild_members)
+        if user_id in guild_members:
+            return
+        member = {
             "user_id": user_id,
             "roles": roles,
             "nick": nick,
-        })
-        if len(self.member_roles[num]) > LOCAL_MEMBER_COUNT:
-            self.member_roles[num].pop(-1)
+        }
+        guild["members"].insert(0, member)
+        guild_members[user_id] = member
+        if len(guild) > LOCAL_MEMBER_COUNT:
+            guild.pop(-1)
         if not self.roles_changed:
             self.roles_changed = nonce or True
 
 
     def process_hidden_channels(self):
         """Search for unprocessed guilds and handle channel/category hiding logic"""
-        for guild_num, guild in enumerate(self.guilds):
+        for guild in self.guilds:
             if "opt_in_channels" in guild:
                 owned = guild["owned"]
                 community = guild["community"]
                 opt_in_channels = guild.pop("opt_in_channels", False)
-                for category_num, category in enumerate(guild["channels"]):
-                    if owned or not community or opt_in_channels:   # cant hide channels in owned and non-community guild
-                        self.guilds[guild_num]["channels"][category_num]["hidden"] = False
-                        continue
+                if owned or not community or opt_in_channels:   # cant hide channels in owned and non-community guild
+                    for channel in guild["channels"]:
+                        channel["hidden"] = False
+                    continue
+                category_channels = {}   # category_id: [channels]
+                for channel in guild["channels"]:
+                    if channel["parent_id"]:
+                        category_channels.setdefault(channel["parent_id"], []).append(channel)
+                for category in guild["channels"]:
                     if category["type"] == 4:
-                        category_id = category["id"]
                         if not category["hidden"]:
                             # if category is not hidden - show its channels
-                            for channel in guild["channels"]:
-                                if channel["parent_id"] == category_id:
-                                    channel["hidden"] = False
+                            for channel in category_channels.get(category["id"], []):
+                                channel["hidden"] = False
                         else:
                             # if category is hidden - hide its channels
-                            for channel in guild["channels"]:
-                                if channel["parent_id"] == category_id:
-                                    if not channel["hidden"]:
-                                        self.guilds[guild_num]["channels"][category_num]["hidden"] = False
-                                        break
+                            for channel in category_channels.get(category["id"], []):
+                                if not channel["hidden"]:
+                                    category["hidden"] = False
+                                    break
 
 
-    def process_one_channel_overrides(self, channel_overrides, guild_num, guild_message_notifications):
+    def process_one_channel_overrides(self, channel_overrides, guild, guild_message_notifications):
         """Process channel_overrides for one guild"""
 
         # first pass to get values and process message_notifications for categories
         for channel in channel_overrides:
-            for channel_num, channel_g in enumerate(self.guilds[guild_num]["channels"]):
-                if channel_g["id"] == channel["channel_id"]:
-                    break
-            else:
+            channel_g = self.get_channel(channel["channel_id"], guild["guild_id"])
+            if not channel_g:
                 continue
             if channel_g["type"] in (0, 2, 4, 5, 15):
                 flags = int(channel.get("flags", 0))
                 hidden = not perms.decode_flag(flags, 12)   # manually hidden
             else:
                 hidden = False
-            self.guilds[guild_num]["channels"][channel_num].update({
+            channel_g.update({
                 "message_notifications": channel["message_notifications"],
                 "muted": channel["muted"],
                 "hidden": hidden,
@@ -380,25 +661,37 @@ class Gateway():
             })
 
         # second pass to process message_notifications for categories
-        for channel in self.guilds[guild_num]["channels"]:
+        for channel in guild["channels"]:
             if channel["type"] == 4 and ("message_notifications" not in channel or channel["message_notifications"] == 3):    # category with server defaults notifications
                 channel["message_notifications"] = 10 + guild_message_notifications
 
         # third pass to process message_notifications for channels
-        for channel in self.guilds[guild_num]["channels"]:
+        for channel in guild["channels"]:
             if channel["type"] != 4 and ("message_notifications" not in channel or channel["message_notifications"] == 3):   # channel with category defaults notifications
-                category_id = channel["parent_id"]
-                for category in self.guilds[guild_num]["channels"]:
-                    if category["id"] == category_id:
-                        category_message_notifications = category["message_notifications"]
-                        if category_message_notifications >= 10:
-                            category_message_notifications -= 10
-                        break
+                category = self.get_channel(channel["parent_id"], guild["guild_id"])
+                if category:
+                    category_message_notifications = category["message_notifications"]
+                    if category_message_notifications >= 10:
+                        category_message_notifications -= 10
                 else:
                     category_message_notifications = guild_message_notifications
                 channel["message_notifications"] = 10 + category_message_notifications
 
 
+    def index_guild(self, guild):
+        """Add guild and its channels to indexes"""
+        self.guilds_index[guild["guild_id"]] = guild
+        for channel in guild["channels"]:
+            self.channels_index[channel["id"]] = (guild, channel)
+
+
+    def unindex_guild(self, guild):
+        """Remove guild and its channels from indexes"""
+        self.guilds_index.pop(guild["guild_id"], None)
+        for channel in guild["channels"]:
+            self.channels_index.pop(channel["id"], None)
+
+
     def add_guild(self, guild):
         """Process received guild object and add guild to the guilds channels, roles, threads, emojis and stickers lists"""
         if guild.get("unavailable"):
@@ -450,10 +743,14 @@ class Gateway():
         # sort roles
         guild_roles = sorted(guild_roles, key=lambda x: x.get("position"), reverse=True)
         guild_roles = sorted(guild_roles, key=lambda x: not bool(x.get("color")))
-        self.roles.append({
+        roles = {
             "guild_id": guild_id,
             "roles": guild_roles,
-        })
+        }
+        self.roles.append(roles)
+        self.roles_index[guild_id] = roles
+        for role in guild_roles:
+            self.role_index[role["id"]] = role
 
         # guild
         community = False
@@ -461,7 +758,7 @@ class Gateway():
             if feature in ("COMMUNITY", "COMMUNITY_CANARY"):
                 community = True
                 break
-        self.guilds.append({
+        new_guild = {
             "guild_id": guild_id,
             "owned": self.my_id == properties["owner_id"],
             "name": properties["name"],
@@ -472,7 +769,9 @@ class Gateway():
             "community": community,
             "premium": properties["premium_tier"],
             "opt_in_channels": True,   # will be overwritten later if opted-out
-        })
+        }
+        self.guilds.append(new_guild)
+        self.index_guild(new_guild)
 
         # threads
         threads = []
@@ -498,11 +797,11 @@ class Gateway():
                 "muted": thread["member"]["muted"],
                 "joined": True,
             })
-        self.threads_buffer.append({
+        self.push_event(self.threads_buffer, {
             "op": "THREAD_UPDATE",
             "guild_id": guild_id,
             "threads": threads,
-        })
+        }, "threads")
 
         # emojis
         guild_emojis = []
@@ -533,8 +832,8 @@ class Gateway():
         })
 
 
-    def add_dm(self, dm, data=[]):
-        """Process received dm channel object and add it to dms list"""
+    def add_dm(self, dm, users={}):
+        """Process received dm channel object and add it to dms list, users is dict of READY users by their id"""
         channel_id = dm["id"]
 
         recipients = []
@@ -548,17 +847,17 @@ class Gateway():
                 })
             else:   # spacebar_fix - can open dm with self
                 add_me = True
-        elif data:
+        elif users:
             for recipient_id in dm["recipient_ids"]:
-                for user in data["users"]:
-                    if user["id"] == recipient_id:
-                        recipients.append({
-                            "id": recipient_id,
-                            "username": user["username"],
-                            "global_name": user.get("global_name"),   # spacebar_fix - get
-                        })
-                    elif recipient_id == self.my_id:   # spacebar_fix - can open dm with self
-                        recipients.append(self.my_user_data)
+                user = users.get(recipient_id)
+                if user:
+                    recipients.append({
+                        "id": recipient_id,
+                        "username": user["username"],
+                        "global_name": user.get("global_name"),   # spacebar_fix - get
+                    })
+                elif recipient_id == self.my_id:   # spacebar_fix - can open dm with self
+                    recipients.append(self.my_user_data)
         if add_me:
             recipients.append(self.my_user_data)
 
@@ -609,12 +908,19 @@ class Gateway():
             "last_message_id": int(last_message_id),
             "avatar": dm.get("avatar"),
         }
-        for num, dm_old in enumerate(self.dms):
-            if dm_old["id"] == channel_id:
-                self.dms[num] = new_dm
-                break
+        dm_old = self.dms_index.get(channel_id)
+        if dm_old:
+            self.dms[self.dms.index(dm_old)] = new_dm
         else:
             self.dms.append(new_dm)
+        self.dms_index[channel_id] = new_dm
+
+
+    def remove_dm(self, channel_id):
+        """Remove dm from dms list"""
+        dm = self.dms_index.pop(channel_id, None)
+        if dm:
+            self.dms.remove(dm)
 
 
     def set_my_user_data(self, data):
@@ -651,6 +957,7 @@ class Gateway():
     def receiver(self):
         """Receive and handle all traffic from gateway, should be run in a thread"""
         logger.debug("Receiver started")
+        debug = logger.isEnabledFor(logging.DEBUG)   # so message is not formatted for each event
         self.resumable = False
         while self.run and not self.wait:
             try:
@@ -673,8 +980,21 @@ class Gateway():
                 self.resumable = status in (4000, 4009)
                 break
             try:
-                data = zlib_decompress(data)
-                if data:
+                if ws_opcode == websocket.ABNF.OPCODE_TEXT:   # not compressed
+                    response = None
+                elif len(data) > STREAM_MIN_SIZE:
+                    if self.event_extensions:   # extensions receive whole READY_SUPPLEMENTAL
+                        data, response = self.decompress_stream(data, {"READY": READY_FIELDS})
+                    else:
+                        data, response = self.decompress_stream(data, STREAMED_EVENTS)
+                else:
+                    data = self.decompress(data)
+                    response = None
+                if response:
+                    opcode = response["op"]
+                elif data and self.skip_undecoded(data):
+                    continue
+                elif data:
                     try:
                         response = json.loads(data)
                         opcode = response["op"]
@@ -689,7 +1009,8 @@ class Gateway():
                 logger.warning(f"Receiver error: {e}")
                 self.resumable = True
                 break
-            logger.debug(f"Received: opcode={opcode}, optext={response["t"] if (response and "t" in response and response["t"] and "LIST" not in response["t"]) else 'None'}")
+            if debug:
+                logger.debug(f"Received: opcode={opcode}, optext={response["t"] if (response and "t" in response and response["t"] and "LIST" not in response["t"]) else 'None'}")
             # debug_events
             # if response.get("t"):
             #     debug.save_json(response, f"{response["t"]}.json", False)
@@ -707,957 +1028,993 @@ class Gateway():
                 self.sequence = int(response["s"])
                 optext = response["t"]
                 data = response["d"]
-                guild = None
-                guild_channels = None
-                role = None
-                guild_roles = None
-                if optext == "READY":
-                    ready_time_start = time.time()
-                    self.resume_gateway_url = data["resume_gateway_url"]
-                    self.session_id = data["session_id"]
-                    self.clear_ready_vars()
-                    time_log_string = "READY event time profile:\n"
-                    last_messages = []
-                    # get my user data
-                    self.set_my_user_data(data["user"])
-                    self.my_id = data["user"]["id"]
-                    self.premium = data["user"].get("premium_type")   # 0 - none, 1 - classic, 2 - full, 3 - basic
-                    if data.get("auth_token"):
-                        self.token_update = data["auth_token"]
-                    # guilds and channels
-                    if ("guilds" not in data) and ("user_guild_settings" in data):
-                        logger.warning("Abnormal READY event received, if its always happening, report this")
-                        self.resumable = True
-                        break
-                    for guild in data["guilds"]:
-                        self.add_guild(guild)
-                        if not guild.get("unavailable"):
-                            # build list of last messages from each channel
-                            for channel in guild["channels"]:
-                                if channel["type"] != 15:   # skip forums
-                                    last_messages.append({
-                                        "message_id": channel.get("last_message_id", 0),   # really last message id
-                                        "channel_id": channel["id"],
-                                    })
-                            # add threads to list of last messages from channels
-                            for thread in guild["threads"]:
-                                last_messages.append({
-                                    "message_id": thread.get("last_message_id", 0),   # really last message id
-                                    "channel_id": thread["id"],
-                                })
-                    time_log_string += f"    guilds - {round((time.time() - ready_time_start) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    # DM channels
-                    for dm in data["private_channels"]:
-                        self.add_dm(dm, data)
-                        if "last_message_id" in dm:
-                            last_messages.append({
-                                "message_id": dm["last_message_id"],   # really last message id
-                                "channel_id": dm["id"],
-                            })
-                    self.dms = sorted(self.dms, key=lambda x: x["last_message_id"], reverse=True)
-                    self.dms = sorted(self.dms, key=lambda x: x["last_message_id"] == 0)
-                    for dm in self.dms:   # dont need it anymore
-                        dm.pop("last_message_id")
-                    for dm in self.dms:
-                        self.dms_id.append(dm["id"])
-                    time_log_string += f"    DMs - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    # unread messages and pings
-                    for channel in double_get(data, "read_state", "entries", default=[]):
-                        # last_message_id in unread_state is actually last_ACKED_message_id
-                        if "last_message_id" in channel and "mention_count" in channel:
-                            channel_id = channel["id"]
-                            last_acked = channel["last_message_id"]
-                            for last_message in last_messages:
-                                if last_message["channel_id"] == channel_id:
-                                    last_message_id = last_message["message_id"]
-                                    break
-                            else:
-                                continue
-                            unseen_channel = {
-                                "last_message_id": last_message_id,
-                                "last_acked_message_id": last_acked or 0,   # dont allow it to be None
-                                "mentions": ["True"] * channel["mention_count"] if channel["mention_count"] else [],   # message_id is unknown
-                            }
-                            if not last_message_id or int(unseen_channel["last_acked_message_id"]) < int(last_message_id):
-                                unseen_channel["last_acked_unreads_line"] = unseen_channel["last_acked_message_id"]
-                            self.read_state[channel_id] = unseen_channel
-                    time_log_string += f"    read state ({len(self.read_state)} channels) - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    # guild and dm settings
-                    for guild in double_get(data, "user_guild_settings", "entries", default=[]):
-                        if guild["guild_id"]:
-                            # find this guild in self.guilds
-                            for guild_num, guild_g in enumerate(self.guilds):
-                                if guild_g["guild_id"] == guild["guild_id"]:
-                                    break
-                            else:
-                                continue
-                            self.guilds[guild_num].update({
-                                "suppress_everyone": guild["suppress_everyone"],
-                                "suppress_roles": guild["suppress_roles"],
-                                "message_notifications": guild["message_notifications"],
-                                "muted": guild["muted"],
-                            })
-                            guild_flags = int(guild.get("flags", 0))
-                            # opt_in_channels means: show all guild channels - when guild is joined
-                            opt_in_channels = not perms.decode_flag(guild_flags, 14) or perms.decode_flag(guild_flags, 13)
-                            self.guilds[guild_num]["opt_in_channels"] = opt_in_channels
-                            self.process_one_channel_overrides(guild["channel_overrides"], guild_num, guild["message_notifications"])
-                        else:
-                            for dm in guild["channel_overrides"]:
-                                for dm_num, dm_g in enumerate(self.dms):
-                                    if dm_g["id"] == dm["channel_id"]:
-                                        break
-                                else:
-                                    continue
-                                self.dms[dm_num].update({
-                                    "message_notifications": dm["message_notifications"],
-                                    "muted": dm["muted"],
-                                })
-                    self.process_hidden_channels()
-                    self.guilds_changed = True
-                    time_log_string += f"    channel settings - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    for user in data["relationships"]:
-                        if user["type"] == 2 or user.get("user_ignored"):
-                            self.blocked.append(user["id"])
-                    time_log_string += f"    blocked users - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    # get user settings
-                    if "user_settings_proto" in data and not self.legacy:
-                        decoded = PreloadedUserSettings.FromString(base64.b64decode(data["user_settings_proto"]))
-                        self.user_settings_proto = MessageToDict(decoded)
-                    else:
-                        self.legacy = True
-                        old_user_settings = data["user_settings"]
-                        old_user_settings.update({
-                            "status": {
-                                "status": old_user_settings.get("status", "online"),
-                                "guildFolders": {
-                                    "guildPositions": old_user_settings.get("guild_positions"),
-                                },
-                            },
-                        })
-                        self.user_settings_proto = old_user_settings
-                        if old_user_settings.get("custom_status"):
-                            self.user_settings_proto["status"]["customStatus"] = old_user_settings["custom_status"]
-                    self.proto_changed = True
-                    time_log_string += f"    protobuf - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    # get my roles
-                    if self.guilds:
-                        for num, guild in enumerate(data["merged_members"]):
-                            guild_id = self.guilds[num]["guild_id"]
-                            roles = []
-                            for member in guild:
-                                if member.get("user_id") == self.my_id or member.get("id") == self.my_id:   # spacebar_fix - user_id -> id
-                                    roles = member["roles"]
-                            self.my_roles.append({
-                                "guild_id": guild_id,
-                                "roles": roles,
-                            })
-                    time_log_string += f"    roles - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    ready_time_mid = time.time()
-                    # write debug data
-                    if logger.getEffectiveLevel() == logging.DEBUG:
-                        debug.save_json(debug.anonymize_guilds(self.guilds), "guilds.json")
-                    # blocked users
-                    time_log_string += f"    debug data - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
-                    self.ready = True
-                    time_log_string += f"    total - {round((time.time() - ready_time_start) * 1000, 3)} ms"
-                    logger.debug(time_log_string)
+                handler = self.event_handlers.get(optext)
+                result = None
+                if handler:
+                    start_time = time.perf_counter()
+                    result = handler(data)
+                    self.count_event(optext, time.perf_counter() - start_time)
+                    self.mark_changed("state")
+                else:
+                    self.count_event(optext, 0)
+                if result == EVENT_STOP:
+                    break
+                if result == EVENT_FREE:
                     # READY is huge so lets save some memory
-                    del (response, data, guild, guild_channels, role, guild_roles, last_messages, time_log_string)
+                    del (response, data)
                     data = None
                     gc.collect()
+                if result != EVENT_SKIP:
+                    self.execute_extensions_method_nochain("on_gateway_event", data, cache=True)
 
-                elif optext == "READY_SUPPLEMENTAL":
-                    for guild in data["merged_presences"]["guilds"]:
-                        for user in guild:
-                            custom_status = None
-                            activities = []
-                            for activity in user["activities"]:
-                                if activity["type"] == 4:
-                                    custom_status = activity.get("state", "")
-                                elif activity["type"] in (0, 2):
-                                    assets = activity.get("assets", {})
-                                    activities.append({
-                                        "type": activity["type"],
-                                        "name": activity["name"],
-                                        "state": activity.get("state"),
-                                        "details": activity.get("details"),
-                                        "small_text": assets.get("small_text"),
-                                        "large_text": assets.get("large_text"),
-                                    })
-                            self.dm_activities.append({
-                                "id": user["user_id"],
-                                "status": user["status"],
-                                "custom_status": custom_status,
-                                "activities": activities,
-                            })
-                    else:
-                        guild = {}
-                    for user in data["merged_presences"]["friends"]:
-                        custom_status = None
-                        activities = []
-                        for activity in user["activities"]:
-                            if activity["type"] == 4:
-                                custom_status = activity.get("state")
-                            elif activity["type"] in (0, 2):
-                                assets = activity.get("assets", {})
-                                activities.append({
-                                    "type": activity["type"],
-                                    "name": activity["name"],
-                                    "state": activity.get("state"),
-                                    "details": activity.get("details"),
-                                    "small_text": assets.get("small_text"),
-                                    "large_text": assets.get("large_text"),
-                                })
-                        self.dm_activities.append({
-                            "id": user["user_id"],
-                            "status": user["status"],
-                            "custom_status": custom_status,
-                            "activities": activities,
-                        })
-                    self.dm_activities_changed = True
-                    del (guild)   # this is large dict so lets save some memory
-                    gc.collect()
+            elif opcode == 7:
+                logger.info("Host requested reconnect")
+                self.resumable = True
+                break
 
-                elif optext == "SESSIONS_REPLACE":
-                    # received when new client is connected
-                    activities = []
-                    for activity in data[0]["activities"]:
-                        if activity["type"] in (0, 2):
-                            if "assets" in activity:
-                                small_text = activity["assets"].get("small_text")
-                                large_text = activity["assets"].get("large_text")
-                            else:
-                                small_text = None
-                                large_text = None
-                            activities.append({
-                                "type": activity["type"],
-                                "name": activity["name"],
-                                "state": activity.get("state", ""),
-                                "details": activity.get("details", ""),
-                                "small_text": small_text,
-                                "large_text": large_text,
-                            })
-                    self.my_status = {
-                        "activities": activities,
-                    }
-                    self.status_changed = True
-
-                elif optext == "PRESENCE_UPDATE":
-                    # received when friend/DM user changes presence state (online/rich/custom)
-                    user_id = data["user"]["id"]
-                    custom_status = None
-                    activities = []
-                    for activity in data.get("activities", []):
-                        if activity["type"] == 4:
-                            custom_status = activity.get("state")
-                        elif activity["type"] in (0, 2):
-                            if "assets" in activity:
-                                small_text =  activity["assets"].get("small_text")
-                                large_text =  activity["assets"].get("large_text")
-                            else:
-                                small_text = None
-                                large_text = None
-                            activities.append({
-                                "type": activity["type"],
-                                "name": activity["name"],
-                                "state": activity.get( "state"),
-                                "details": activity.get("details"),
-                                "small_text": small_text,
-                                "large_text": large_text,
-                            })
-                    # select what list of activities to update
-                    if "guild_id" in data:
-                        guild_id = data["guild_id"]
-                        for guild_activities in self.subscribed_activities:
-                            if guild_activities["guild_id"] == guild_id:
-                                selected_activities = guild_activities["members"]
-                                break
-                        else:
-                            self.subscribed_activities.append({
-                                "guild_id": guild_id,
-                                "members": [],
-                            })
-                            selected_activities = self.subscribed_activities[-1]["members"]
-                        self.subscribed_activities_changed.append(guild_id)
-                    else:
-                        selected_activities = self.dm_activities
-                    for num, user in enumerate(selected_activities):
-                        if user["id"] == user_id:
-                            selected_activities[num] = {
-                                "id": user_id,
-                                "status": data.get("status"),   # spacebar_fix - status
-                                "custom_status": custom_status,
-                                "activities": activities,
-                            }
-                            break
-                    else:
-                        selected_activities.append({
-                            "id": data["user"]["id"],
-                            "status": data.get("status"),   # spacebar_fix - get
-                            "custom_status": custom_status,
-                            "activities": activities,
-                        })
-                    self.dm_activities_changed = True
-
-                elif optext == "TYPING_START":
-                    # received when user in currently subscribed guild channel starts typing
-                    if "member" in data:
-                        username = data["member"]["user"]["username"]
-                        global_name = data["member"]["user"].get("global_name")   # spacebar_fix - get
-                        nick = data["member"]["user"].get("nick")
-                    else:
-                        username = None
-                        global_name = None
-                        nick = None
-                    self.typing_buffer.append({
-                        "user_id": data["user_id"],
-                        "timestamp": data["timestamp"],
-                        "channel_id": data["channel_id"],
-                        "username": username,
-                        "global_name": global_name,
-                        "nick": nick,
-                    })
+            elif opcode == 9:
+                if response["d"]:
+                    logger.info("Session invalidated, reconnecting")
+                    break
+
+        self.state = 0
+        self.mark_changed("state")
+        logger.debug("Receiver stopped")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(self.get_event_stats())
+        self.reconnect_requested = True
+        self.heartbeat_running = False
 
-                elif optext == "MESSAGE_CREATE" and "content" in response["d"]:
-                    message = response["d"]
-                    # saving roles to cache
-                    if  message["channel_id"] in self.subscribed_channels and "member" in message and "roles" in message["member"]:
-                        self.add_member_roles(
-                            message.get("guild_id"),
-                            message["author"]["id"],
-                            message["member"]["roles"],
-                            nick=message["member"].get("nick"),
-                            nonce=message["channel_id"],
-                        )
-                    message_done = prepare_message(message)
-                    message_done.update({
-                        "channel_id": message["channel_id"],
-                        "guild_id": message.get("guild_id"),
-                    })
-                    if message_done["user_id"] == self.my_id:
-                        message_done.update({
-                            "nonce": message.get("nonce"),
-                        })
-                    self.messages_buffer.append({
-                        "op": "MESSAGE_CREATE",
-                        "d": message_done,
-                    })
 
-                elif optext == "MESSAGE_UPDATE":
-                    message = response["d"]
-                    message_done = prepare_message(message)
-                    message_done.update({
-                        "channel_id": message["channel_id"],
-                        "guild_id": message.get("guild_id"),
+    def handle_ready(self, data):
+        """Handle READY gateway event"""
+        ready_time_start = time.time()
+        self.resume_gateway_url = data["resume_gateway_url"]
+        self.session_id = data["session_id"]
+        self.clear_ready_vars()
+        time_log_string = "READY event time profile:\n"
+        last_messages = {}   # channel_id: last_message_id
+        # get my user data
+        self.set_my_user_data(data["user"])
+        self.my_id = data["user"]["id"]
+        self.premium = data["user"].get("premium_type")   # 0 - none, 1 - classic, 2 - full, 3 - basic
+        if data.get("auth_token"):
+            self.token_update = data["auth_token"]
+        # guilds and channels
+        if ("guilds" not in data) and ("user_guild_settings" in data):
+            logger.warning("Abnormal READY event received, if its always happening, report this")
+            self.resumable = True
+            return EVENT_STOP
+        for guild in data["guilds"]:
+            self.add_guild(guild)
+            if not guild.get("unavailable"):
+                # build list of last messages from each channel
+                for channel in guild["channels"]:
+                    if channel["type"] != 15:   # skip forums
+                        last_messages[channel["id"]] = channel.get("last_message_id", 0)   # really last message id
+                # add threads to list of last messages from channels
+                for thread in guild["threads"]:
+                    last_messages[thread["id"]] = thread.get("last_message_id", 0)   # really last message id
+        time_log_string += f"    guilds - {round((time.time() - ready_time_start) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        # DM channels
+        users = {user["id"]: user for user in data.get("users", [])}
+        for dm in data["private_channels"]:
+            self.add_dm(dm, users)
+            if "last_message_id" in dm:
+                last_messages[dm["id"]] = dm["last_message_id"]   # really last message id
+        del users
+        # newest first, then ones without messages
+        self.dms = sorted(self.dms, key=lambda x: (x["last_message_id"] == 0, -x["last_message_id"]))
+        for dm in self.dms:
+            dm.pop("last_message_id")   # dont need it anymore
+            self.dms_id.append(dm["id"])
+        time_log_string += f"    DMs - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        # unread messages and pings
+        for channel in double_get(data, "read_state", "entries", default=[]):
+            # last_message_id in unread_state is actually last_ACKED_message_id
+            if "last_message_id" in channel and "mention_count" in channel:
+                channel_id = channel["id"]
+                last_acked = channel["last_message_id"]
+                if channel_id not in last_messages:
+                    continue
+                last_message_id = last_messages[channel_id]
+                unseen_channel = {
+                    "last_message_id": last_message_id,
+                    "last_acked_message_id": last_acked or 0,   # dont allow it to be None
+                    "mentions": ["True"] * channel["mention_count"] if channel["mention_count"] else [],   # message_id is unknown
+                }
+                if not last_message_id or int(unseen_channel["last_acked_message_id"]) < int(last_message_id):
+                    unseen_channel["last_acked_unreads_line"] = unseen_channel["last_acked_message_id"]
+                self.read_state[channel_id] = unseen_channel
+        time_log_string += f"    read state ({len(self.read_state)} channels) - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        # guild and dm settings
+        for guild in double_get(data, "user_guild_settings", "entries", default=[]):
+            if guild["guild_id"]:
+                guild_g = self.guilds_index.get(guild["guild_id"])
+                if not guild_g:
+                    continue
+                guild_g.update({
+                    "suppress_everyone": guild["suppress_everyone"],
+                    "suppress_roles": guild["suppress_roles"],
+                    "message_notifications": guild["message_notifications"],
+                    "muted": guild["muted"],
+                })
+                guild_flags = int(guild.get("flags", 0))
+                # opt_in_channels means: show all guild channels - when guild is joined
+                opt_in_channels = not perms.decode_flag(guild_flags, 14) or perms.decode_flag(guild_flags, 13)
+                guild_g["opt_in_channels"] = opt_in_channels
+                self.process_one_channel_overrides(guild["channel_overrides"], guild_g, guild["message_notifications"])
+            else:
+                for dm in guild["channel_overrides"]:
+                    dm_g = self.dms_index.get(dm["channel_id"])
+                    if not dm_g:
+                        continue
+                    dm_g.update({
+                        "message_notifications": dm["message_notifications"],
+                        "muted": dm["muted"],
                     })
-                    self.messages_buffer.append({
-                        "op": "MESSAGE_UPDATE",
-                        "d": message_done,
+        self.process_hidden_channels()
+        self.guilds_changed = True
+        time_log_string += f"    channel settings - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        for user in data["relationships"]:
+            if user["type"] == 2 or user.get("user_ignored"):
+                self.blocked.append(user["id"])
+        time_log_string += f"    blocked users - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        # get user settings
+        if "user_settings_proto" in data and not self.legacy:
+            decoded = PreloadedUserSettings.FromString(base64.b64decode(data["user_settings_proto"]))
+            self.user_settings_proto = MessageToDict(decoded)
+        else:
+            self.legacy = True
+            old_user_settings = data["user_settings"]
+            old_user_settings.update({
+                "status": {
+                    "status": old_user_settings.get("status", "online"),
+                    "guildFolders": {
+                        "guildPositions": old_user_settings.get("guild_positions"),
+                    },
+                },
+            })
+            self.user_settings_proto = old_user_settings
+            if old_user_settings.get("custom_status"):
+                self.user_settings_proto["status"]["customStatus"] = old_user_settings["custom_status"]
+        self.proto_changed = True
+        time_log_string += f"    protobuf - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        # get my roles
+        if self.guilds:
+            for num, guild in enumerate(data["merged_members"]):
+                guild_id = self.guilds[num]["guild_id"]
+                roles = []
+                for member in guild:
+                    if member.get("user_id") == self.my_id or member.get("id") == self.my_id:   # spacebar_fix - user_id -> id
+                        roles = member["roles"]
+                my_roles = {
+                    "guild_id": guild_id,
+                    "roles": roles,
+                }
+                self.my_roles.append(my_roles)
+                self.my_roles_index[guild_id] = my_roles
+        time_log_string += f"    roles - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        ready_time_mid = time.time()
+        # write debug data
+        if logger.getEffectiveLevel() == logging.DEBUG:
+            debug.save_json(debug.anonymize_guilds(self.guilds), "guilds.json")
+        # blocked users
+        time_log_string += f"    debug data - {round((time.time() - ready_time_mid) * 1000, 3)} ms\n"
+        self.ready = True
+        time_log_string += f"    total - {round((time.time() - ready_time_start) * 1000, 3)} ms"
+        logger.debug(time_log_string)
+        return EVENT_FREE
+
+
+    def handle_ready_supplemental(self, data):
+        """Handle READY_SUPPLEMENTAL gateway event"""
+        for guild in data["merged_presences"]["guilds"]:
+            for user in guild:
+                custom_status = None
+                activities = []
+                for activity in user["activities"]:
+                    if activity["type"] == 4:
+                        custom_status = activity.get("state", "")
+                    elif activity["type"] in (0, 2):
+                        assets = activity.get("assets", {})
+                        activities.append({
+                            "type": activity["type"],
+                            "name": activity["name"],
+                            "state": activity.get("state"),
+                            "details": activity.get("details"),
+                            "small_text": assets.get("small_text"),
+                            "large_text": assets.get("large_text"),
+                        })
+                self.dm_activities_index.setdefault(user["user_id"], len(self.dm_activities))
+                self.dm_activities.append({
+                    "id": user["user_id"],
+                    "status": user["status"],
+                    "custom_status": custom_status,
+                    "activities": activities,
+                })
+        else:
+            guild = {}
+        for user in data["merged_presences"]["friends"]:
+            custom_status = None
+            activities = []
+            for activity in user["activities"]:
+                if activity["type"] == 4:
+                    custom_status = activity.get("state")
+                elif activity["type"] in (0, 2):
+                    assets = activity.get("assets", {})
+                    activities.append({
+                        "type": activity["type"],
+                        "name": activity["name"],
+                        "state": activity.get("state"),
+                        "details": activity.get("details"),
+                        "small_text": assets.get("small_text"),
+                        "large_text": assets.get("large_text"),
                     })
+            self.dm_activities_index.setdefault(user["user_id"], len(self.dm_activities))
+            self.dm_activities.append({
+                "id": user["user_id"],
+                "status": user["status"],
+                "custom_status": custom_status,
+                "activities": activities,
+            })
+        self.dm_activities_changed = True
+        del (guild)   # this is large dict so lets save some memory
+        gc.collect()
+
+
+    def handle_sessions_replace(self, data):
+        """Handle SESSIONS_REPLACE gateway event"""
+        # received when new client is connected
+        activities = []
+        for activity in data[0]["activities"]:
+            if activity["type"] in (0, 2):
+                if "assets" in activity:
+                    small_text = activity["assets"].get("small_text")
+                    large_text = activity["assets"].get("large_text")
+                else:
+                    small_text = None
+                    large_text = None
+                activities.append({
+                    "type": activity["type"],
+                    "name": activity["name"],
+                    "state": activity.get("state", ""),
+                    "details": activity.get("details", ""),
+                    "small_text": small_text,
+                    "large_text": large_text,
+                })
+        self.my_status = {
+            "activities": activities,
+        }
+        self.status_changed = True
+
+
+    def handle_presence_update(self, data):
+        """Handle PRESENCE_UPDATE gateway event"""
+        # received when friend/DM user changes presence state (online/rich/custom)
+        user_id = data["user"]["id"]
+        custom_status = None
+        activities = []
+        for activity in data.get("activities", []):
+            if activity["type"] == 4:
+                custom_status = activity.get("state")
+            elif activity["type"] in (0, 2):
+                if "assets" in activity:
+                    small_text =  activity["assets"].get("small_text")
+                    large_text =  activity["assets"].get("large_text")
+                else:
+                    small_text = None
+                    large_text = None
+                activities.append({
+                    "type": activity["type"],
+                    "name": activity["name"],
+                    "state": activity.get( "state"),
+                    "details": activity.get("details"),
+                    "small_text": small_text,
+                    "large_text": large_text,
+                })
+        # select what list of activities to update
+        if "guild_id" in data:
+            guild_id = data["guild_id"]
+            if guild_id in self.subscribed_activities_index:
+                selected_activities, selected_index = self.subscribed_activities_index[guild_id]
+            else:
+                selected_activities = []
+                selected_index = {}
+                self.subscribed_activities.append({
+                    "guild_id": guild_id,
+                    "members": selected_activities,
+                })
+                self.subscribed_activities_index[guild_id] = (selected_activities, selected_index)
+            self.subscribed_activities_changed.append(guild_id)
+        else:
+            selected_activities = self.dm_activities
+            selected_index = self.dm_activities_index
+        num = selected_index.get(user_id)
+        if num is not None:
+            selected_activities[num] = {
+                "id": user_id,
+                "status": data.get("status"),   # spacebar_fix - status
+                "custom_status": custom_status,
+                "activities": activities,
+            }
+        else:
+            selected_index[user_id] = len(selected_activities)
+            selected_activities.append({
+                "id": data["user"]["id"],
+                "status": data.get("status"),   # spacebar_fix - get
+                "custom_status": custom_status,
+                "activities": activities,
+            })
+        self.dm_activities_changed = True
 
-                elif optext == "MESSAGE_DELETE":
-                    ready_data = {
-                        "id": data["id"],
-                        "channel_id": data["channel_id"],
-                        "guild_id": data.get("guild_id"),
-                    }
-                    self.messages_buffer.append({
-                        "op": "MESSAGE_DELETE",
-                        "d": ready_data,
-                    })
 
-                elif optext == "MESSAGE_REACTION_ADD":
-                    if "member" in data and "user" in data["member"]:   # spacebar_fix - "user" is mising
-                        user_id = data["member"]["user"]["id"]
-                        username = data["member"]["user"]["username"]
-                        global_name = data["member"]["user"].get("global_name")   # spacebar_fix - get
-                        nick = data["member"]["user"].get("nick")
-                    else:
-                        user_id = data["user_id"]
-                        username = None
-                        global_name = None
-                        nick = None
-                    ready_data = {
-                        "id": data["message_id"],
-                        "channel_id": data["channel_id"],
-                        "guild_id": data.get("guild_id"),
-                        "emoji": data["emoji"]["name"],
-                        "emoji_id": data["emoji"].get("id"),   # spacebar_fix - get
-                        "user_id": user_id,
-                        "username": username,
-                        "global_name": global_name,
-                        "nick": nick,
-                    }
-                    self.messages_buffer.append({
-                        "op": "MESSAGE_REACTION_ADD",
-                        "d": ready_data,
-                    })
+    def handle_typing_start(self, data):
+        """Handle TYPING_START gateway event"""
+        # received when user in currently subscribed guild channel starts typing
+        if "member" in data:
+            username = data["member"]["user"]["username"]
+            global_name = data["member"]["user"].get("global_name")   # spacebar_fix - get
+            nick = data["member"]["user"].get("nick")
+        else:
+            username = None
+            global_name = None
+            nick = None
+        self.push_event(self.typing_buffer, {
+            "user_id": data["user_id"],
+            "timestamp": data["timestamp"],
+            "channel_id": data["channel_id"],
+            "username": username,
+            "global_name": global_name,
+            "nick": nick,
+        }, "typing")
 
-                elif optext == "MESSAGE_REACTION_ADD_MANY":
-                    channel_id = data["channel_id"]
-                    guild_id = data.get("guild_id")
-                    message_id = data["message_id"]
-                    for reaction in data["reactions"]:
-                        for user_id in reaction["users"]:
-                            ready_data = {
-                                "id": message_id,
-                                "channel_id": channel_id,
-                                "guild_id": guild_id,
-                                "emoji": reaction["emoji"]["name"],
-                                "emoji_id": reaction["emoji"]["id"],
-                                "user_id": user_id,
-                                "username": None,
-                                "global_name": None,
-                                "nick": None,
-                            }
-                            self.messages_buffer.append({
-                                "op": "MESSAGE_REACTION_ADD",
-                                "d": ready_data,
-                            })
-
-                elif optext == "MESSAGE_REACTION_REMOVE":
-                    ready_data = {
-                        "id": data["message_id"],
-                        "channel_id": data["channel_id"],
-                        "guild_id": data.get("guild_id"),
-                        "emoji": data["emoji"]["name"],
-                        "emoji_id": data["emoji"].get("id"),   # spacebar_fix - get
-                        "user_id": data["user_id"],
-                    }
-                    self.messages_buffer.append({
-                        "op": "MESSAGE_REACTION_REMOVE",
-                        "d": ready_data,
-                    })
 
-                elif self.want_summaries and optext == "CONVERSATION_SUMMARY_UPDATE":
-                    # received when new conversation summary is generated
-                    for summary in data["summaries"]:
-                        if summary["type"] == 3:
-                            self.summaries_buffer.append({
-                                "message_id": summary["start_id"],
-                                "channel_id": data["channel_id"],
-                                "guild_id": data.get("guild_id"),
-                                "topic": summary["topic"],
-                                "description": summary["summ_short"],
-                            })
-                        else:
-                            logger.warning(f"Unhandled summary type\n{json.dumps(summary)}")
+    def handle_message_create(self, data):
+        """Handle MESSAGE_CREATE gateway event"""
+        if "content" not in data:
+            return
+        message = data
+        # saving roles to cache
+        if  message["channel_id"] in self.subscribed_channels and "member" in message and "roles" in message["member"]:
+            self.add_member_roles(
+                message.get("guild_id"),
+                message["author"]["id"],
+                message["member"]["roles"],
+                nick=message["member"].get("nick"),
+                nonce=message["channel_id"],
+            )
+        message_done = prepare_message(message)
+        message_done.update({
+            "channel_id": message["channel_id"],
+            "guild_id": message.get("guild_id"),
+        })
+        if message_done["user_id"] == self.my_id:
+            message_done.update({
+                "nonce": message.get("nonce"),
+            })
+        self.push_event(self.messages_buffer, {
+            "op": "MESSAGE_CREATE",
+            "d": message_done,
+        }, "messages")
+
+
+    def handle_message_update(self, data):
+        """Handle MESSAGE_UPDATE gateway event"""
+        message = data
+        message_done = prepare_message(message)
+        message_done.update({
+            "channel_id": message["channel_id"],
+            "guild_id": message.get("guild_id"),
+        })
+        self.push_event(self.messages_buffer, {
+            "op": "MESSAGE_UPDATE",
+            "d": message_done,
+        }, "messages")
 
-                elif optext == "MESSAGE_ACK":
-                    # received when other client ACKs messages
 
-                    self.msg_ack_buffer.append({
-                        "message_id": data["message_id"],
-                        "channel_id": data["channel_id"],
-                    })
+    def handle_message_delete(self, data):
+        """Handle MESSAGE_DELETE gateway event"""
+        ready_data = {
+            "id": data["id"],
+            "channel_id": data["channel_id"],
+            "guild_id": data.get("guild_id"),
+        }
+        self.push_event(self.messages_buffer, {
+            "op": "MESSAGE_DELETE",
+            "d": ready_data,
+        }, "messages")
+
+
+    def handle_message_reaction_add(self, data):
+        """Handle MESSAGE_REACTION_ADD gateway event"""
+        if "member" in data and "user" in data["member"]:   # spacebar_fix - "user" is mising
+            user_id = data["member"]["user"]["id"]
+            username = data["member"]["user"]["username"]
+            global_name = data["member"]["user"].get("global_name")   # spacebar_fix - get
+            nick = data["member"]["user"].get("nick")
+        else:
+            user_id = data["user_id"]
+            username = None
+            global_name = None
+            nick = None
+        ready_data = {
+            "id": data["message_id"],
+            "channel_id": data["channel_id"],
+            "guild_id": data.get("guild_id"),
+            "emoji": data["emoji"]["name"],
+            "emoji_id": data["emoji"].get("id"),   # spacebar_fix - get
+            "user_id": user_id,
+            "username": username,
+            "global_name": global_name,
+            "nick": nick,
+        }
+        self.push_event(self.messages_buffer, {
+            "op": "MESSAGE_REACTION_ADD",
+            "d": ready_data,
+        }, "messages")
+
+
+    def handle_message_reaction_add_many(self, data):
+        """Handle MESSAGE_REACTION_ADD_MANY gateway event"""
+        channel_id = data["channel_id"]
+        guild_id = data.get("guild_id")
+        message_id = data["message_id"]
+        for reaction in data["reactions"]:
+            for user_id in reaction["users"]:
+                ready_data = {
+                    "id": message_id,
+                    "channel_id": channel_id,
+                    "guild_id": guild_id,
+                    "emoji": reaction["emoji"]["name"],
+                    "emoji_id": reaction["emoji"]["id"],
+                    "user_id": user_id,
+                    "username": None,
+                    "global_name": None,
+                    "nick": None,
+                }
+                self.push_event(self.messages_buffer, {
+                    "op": "MESSAGE_REACTION_ADD",
+                    "d": ready_data,
+                }, "messages")
+
+
+    def handle_message_reaction_remove(self, data):
+        """Handle MESSAGE_REACTION_REMOVE gateway event"""
+        ready_data = {
+            "id": data["message_id"],
+            "channel_id": data["channel_id"],
+            "guild_id": data.get("guild_id"),
+            "emoji": data["emoji"]["name"],
+            "emoji_id": data["emoji"].get("id"),   # spacebar_fix - get
+            "user_id": data["user_id"],
+        }
+        self.push_event(self.messages_buffer, {
+            "op": "MESSAGE_REACTION_REMOVE",
+            "d": ready_data,
+        }, "messages")
 
-                elif optext == "GUILD_MEMBERS_CHUNK":
-                    # received when requesting members (op 8)
-                    if self.querying_members:
-                        self.querying_members = False
-                        self.member_query_results = []
-                        for member in data["members"]:
-                            name = member.get("nick")
-                            if not name:
-                                name = member["user"].get("global_name", member["user"]["username"])   # spacebar_fix - get
-                            self.member_query_results.append({
-                                "id": member["user"]["id"],
-                                "username": member["user"]["username"],
-                                "name": name,
-                            })
-                    else:
-                        guild_id = data["guild_id"]
-                        for member in data["members"]:
-                            if "roles" in member and "roles" in member:
-                                self.add_member_roles(
-                                    guild_id,
-                                    member["user"]["id"],
-                                    member["roles"],
-                                    nick=member.get("nick"),
-                                )
-                                if data.get("nonce"):
-                                    self.roles_changed = data["nonce"]
-
-                elif optext == "THREAD_LIST_SYNC":
-                    threads = []
-                    guild_id = None
-                    for thread in response["d"]["threads"]:
-                        if not guild_id:
-                            guild_id = thread["guild_id"]   # assuming its one event per thread
-                        threads.append({
-                            "id": thread["id"],
-                            "type": thread["type"],
-                            "owner_id": thread["owner_id"],
-                            "name": thread["name"],
-                            "locked": thread["thread_metadata"]["locked"],
-                            "message_count": thread["message_count"],
-                            "timestamp": thread["thread_metadata"].get("create_timestamp", None),
-                            "parent_id": thread["parent_id"],
-                            "suppress_everyone": False,   # no config for threads
-                            "suppress_roles": False,
-                            "message_notifications": None,
-                            "muted": False,   # muted and joined are in READY event
-                            "joined": False,
-                        })
-                    self.threads_buffer.append({
-                        "op": "THREAD_UPDATE",
-                        "guild_id": guild_id,
-                        "threads": threads,
-                    })
 
-                elif self.want_member_list and optext == "GUILD_MEMBER_LIST_UPDATE":
-                    guild_id = data["guild_id"]
-                    list_id = data["id"]
-                    for guild_index, guild in enumerate(self.activities):
-                        if guild[0] == guild_id:
-                            break
-                    else:
-                        self.activities.append([guild_id, {}])   # [guild_id, member_lists]
-                        guild_index = -1
-                    for memlist in data["ops"]:
-                        # keeping only necessary data, because the rest can be fetched with discord.get_user_guild()
-                        if memlist["op"] == "SYNC":
-                            if memlist["range"][0] != 0:
-                                # keeping only first chunk (first 99)
-                                continue
-                            members_sync = []
-                            for item in memlist["items"]:
-                                if "group" in item:
-                                    members_sync.append({"group": item["group"]["id"]})
-                                else:
-                                    member_data = item["member"]
-                                    ## unused for now
-                                    # custom_status = None
-                                    # activities = []
-                                    # for activity in member_data["presence"]["activities"]:
-                                    #     if activity["type"] == 4:
-                                    #         custom_status = activity.get("state", "")
-                                    #     elif activity["type"] in (0, 2):
-                                    #         assets = activity.get("assets", {})
-                                    #         activities.append({
-                                    #             "type": activity["type"],
-                                    #             "name": activity["name"],
-                                    #             "state": activity.get("state"),
-                                    #             "details": activity.get("details"),
-                                    #             "small_text": assets.get("small_text"),
-                                    #             "large_text": assets.get("large_text"),
-                                    #         })
-                                    members_sync.append({
-                                        "id": member_data["user"]["id"],
-                                        "username": member_data["user"]["username"],
-                                        "global_name": member_data["user"].get("global_name"),   # spacebar_fix - get
-                                        "nick": member_data["nick"],
-                                        "roles": member_data["roles"],
-                                        "status": member_data["presence"]["status"],
-                                        # "custom_status": custom_status,
-                                        # "activities": activities,
-                                    })
-                            self.activities[guild_index][1][list_id] = [0, members_sync]
-                            self.activities_changed.append(guild_id)
-                        elif memlist["op"] == "DELETE":
-                            try:
-                                del self.activities[guild_index][1][list_id][1][memlist["index"]]
-                            except (IndexError, NameError):
-                                pass
-                        elif memlist["op"] in ("UPDATE", "INSERT"):
-                            custom_status = None
-                            if list_id not in self.activities[guild_index][1]:
-                                self.activities[guild_index][1][list_id] = [0, []]   # [last_index, members]
-                            if "group" in memlist["item"]:
-                                # group can only be inserted
-                                self.activities[guild_index][1][list_id][1].insert(memlist["index"], {"group": memlist["item"]["group"]["id"]})
-                                if len(self.activities[guild_index][1][list_id][1]) > 100:
-                                    self.activities[guild_index][1][list_id][1].pop(-1)
-                                self.activities_changed.append(guild_id)
-                                self.activities[guild_index][1][list_id][0] = int(memlist["index"])
-                                continue
-                            member_data = memlist["item"]["member"]
-                            activities = []
-                            for activity in member_data["presence"]["activities"]:
-                                if activity["type"] == 4:
-                                    custom_status = activity.get("state", "")
-                                elif activity["type"] in (0, 2):
-                                    assets = activity.get("assets", {})
-                                    activities.append({
-                                        "type": activity["type"],
-                                        "name": activity["name"],
-                                        "state": activity.get("state"),
-                                        "details": activity.get("details"),
-                                        "small_text": assets.get("small_text"),
-                                        "large_text": assets.get("large_text"),
-                                    })
-                            member_id = member_data["user"]["id"]
-                            ready_data = {
-                                "id": member_id,
-                                "username": member_data["user"]["username"],
-                                "global_name": member_data["user"].get("global_name"),   # spacebar_fix - get
-                                "nick": member_data["nick"],
-                                "roles": member_data["roles"],
-                                "status": member_data["presence"]["status"],
-                                # "custom_status": custom_status,
-                                # "activities": activities,
-                            }
-                            if memlist["op"] == "UPDATE":
-                                try:
-                                    if self.activities[guild_index][1][list_id][1][memlist["index"]].get("id") == member_id:
-                                        self.activities[guild_index][1][list_id][1][memlist["index"]].update(ready_data)
-                                    else:   # failsafe
-                                        for num, member in enumerate(self.activities[guild_index][1][list_id][1]):
-                                            if member.get("id") == member_id:
-                                                self.activities[guild_index][1][list_id][1][num].update(ready_data)
-                                except IndexError:
-                                    pass
-                            else:   # INSERT
-                                self.activities[guild_index][1][list_id][1].insert(memlist["index"], ready_data)
-                                if len(self.activities[guild_index][1][list_id][1]) > 100:   # lets have some limits
-                                    self.activities[guild_index][1][list_id][1].pop(-1)
-                            self.activities[guild_index][1][list_id][0] = int(memlist["index"])
-                        self.activities_changed.append(guild_id)
-
-                elif optext == "USER_SETTINGS_PROTO_UPDATE":
-                    if data["partial"] or data["settings"]["type"] != 1:
-                        continue
-                    decoded = PreloadedUserSettings.FromString(base64.b64decode(data["settings"]["proto"]))
-                    self.user_settings_proto = MessageToDict(decoded)
-                    self.proto_changed = True
-
-                elif optext == "USER_GUILD_SETTINGS_UPDATE":
-                    if data["guild_id"]:   # guild and channel
-                        for guild_num_search, guild_g in enumerate(self.guilds):
-                            if guild_g["guild_id"] == data["guild_id"]:
-                                guild_g.pop("suppress_everyone", None)   # reset to default
-                                guild_g.pop("suppress_roles", None)
-                                guild_g.pop("message_notifications", None)
-                                guild_g.pop("muted", None)
-                                guild_num = guild_num_search
-                                break
-                        else:
-                            continue
-                        guild_flags = int(data.get("flags", 0))
-                        # opt_in_channels means: show all guild channels - when guild is joined
-                        opt_in_channels = not perms.decode_flag(guild_flags, 14) or perms.decode_flag(guild_flags, 13)
-                        self.guilds[guild_num].update({
-                            "suppress_everyone": data["suppress_everyone"],
-                            "suppress_roles": data["suppress_roles"],
-                            "message_notifications": data["message_notifications"],
-                            "muted": data["muted"],
-                            "opt_in_channels": opt_in_channels,
-                        })
-                        # reset all to defaults
-                        for channel_num, channel in enumerate(self.guilds[guild_num]["channels"]):
-                            if channel["type"] in (0, 2, 4, 5, 15):
-                                flags = int(channel.get("flags", 0))
-                                hidden = not perms.decode_flag(flags, 12)   # manually hidden
-                            else:
-                                hidden = False
-                            self.guilds[guild_num]["channels"][channel_num]["hidden"] = hidden
-                            self.guilds[guild_num]["channels"][channel_num]["muted"] = False
-                            self.guilds[guild_num]["channels"][channel_num]["message_notifications"] = 3
-                        self.process_one_channel_overrides(data["channel_overrides"], guild_num, data["message_notifications"])
-                        self.process_hidden_channels()
-                    else:   # dm
-                        for dm_g in self.dms:
-                            dm_g.pop("message_notifications", None)   # reset to default
-                            dm_g.pop("muted", None)
-                        for dm in data["channel_overrides"]:
-                            for dm_num, dm_g in enumerate(self.dms):
-                                if dm_g["id"] == dm["channel_id"]:
-                                    break
-                            else:
-                                continue
-                            self.dms[dm_num].update({
-                                "message_notifications": dm["message_notifications"],
-                                "muted": dm["muted"],
-                            })
-                    self.guilds_changed = True
-
-                elif optext == "USER_UPDATE":
-                    self.set_my_user_data(data)
-                    self.my_id = data["id"]
-                    self.premium = data.get("premium_type")
-                    self.user_update = (self.my_user_data, None)
-
-                elif optext == "GUILD_MEMBER_UPDATE":
-                    if data["user"]["id"] == self.my_id:
-                        nick = data.get("nick")
-                        roles_changed = None
-                        for num, guild in enumerate(self.my_roles):
-                            if guild["guild_id"] == data["guild_id"]:
-                                self.my_roles[num]["roles"] = data["roles"]
-                                roles_changed = data["guild_id"]
-                                break
-                        self.user_update = ({
-                            "id": data["user"]["id"],
-                            "nick": nick,
-                        }, roles_changed)
-
-                elif optext == "APPLICATION_COMMAND_AUTOCOMPLETE_RESPONSE":
-                    self.app_command_autocomplete_resp = response["d"]["choices"]
-
-                elif optext in ("MESSAGE_POLL_VOTE_ADD", "MESSAGE_POLL_VOTE_REMOVE"):
-                    data["id"] = data.pop("message_id")
-                    self.messages_buffer.append({
-                        "op": optext,
-                        "d": data,
-                    })
+    def handle_conversation_summary_update(self, data):
+        """Handle CONVERSATION_SUMMARY_UPDATE gateway event"""
+        if not self.want_summaries:
+            return
+        # received when new conversation summary is generated
+        for summary in data["summaries"]:
+            if summary["type"] == 3:
+                self.push_event(self.summaries_buffer, {
+                    "message_id": summary["start_id"],
+                    "channel_id": data["channel_id"],
+                    "guild_id": data.get("guild_id"),
+                    "topic": summary["topic"],
+                    "description": summary["summ_short"],
+                }, "summaries")
+            else:
+                logger.warning(f"Unhandled summary type\n{json.dumps(summary)}")
 
-                elif optext == "VOICE_STATE_UPDATE":
-                    if "session_id" not in self.voice_gateway_data and self.voice_gateway_data_ready >= 1:
-                        self.voice_gateway_data["session_id"] = data["session_id"]
-                        self.voice_gateway_data["guild_id"] = data.get("guild_id")
-                        if not self.voice_gateway_data["guild_id"]:
-                            self.voice_gateway_data["guild_id"] = data["channel_id"]   # must be channel_id in DM
-                        self.voice_gateway_data["channel_id"] = data["channel_id"]
-                        self.voice_gateway_data_ready += 1
-                    elif data["user_id"] != self.my_id:
-                        name = None
-                        if "member" in data:
-                            name = data["member"].get("nick")
-                            if not name:
-                                name = data["member"]["user"].get("global_name", data["member"]["user"]["username"])   # spacebar_fix - get
-                        self.call_buffer.append({
-                            "op": "STATE_UPDATE",
-                            "channel_id": data["channel_id"],
-                            "user_id": data["user_id"],
-                            "name": name,
-                            "muted": data["self_mute"] or data["mute"],
-                        })
-                        # this is just to get mute states, enter/leave call and speaking are sent in voice gateway
-
-                elif optext == "VOICE_SERVER_UPDATE":
-                    if "endpoint" not in self.voice_gateway_data and self.voice_gateway_data_ready >= 1:
-                        self.voice_gateway_data["token"] = data["token"]
-                        self.voice_gateway_data["endpoint"] = data["endpoint"]
-                        self.voice_gateway_data_ready += 1
-
-                elif optext == "CALL_CREATE":
-                    # event is received even when this client creates call
-                    if not data["voice_states"] or data["voice_states"][0]["user_id"] != self.my_id:
-                        self.call_buffer.append({
-                            "op": "CALL_CREATE",
-                            "channel_id": data["channel_id"],
-                            "ringing": self.my_id in data["ringing"],
-                        })
 
-                elif optext == "CALL_UPDATE":
-                    self.call_buffer.append({
-                        "op": "CALL_UPDATE",
-                        "channel_id": data["channel_id"],
-                        "ringing": self.my_id in data["ringing"],
-                    })
+    def handle_message_ack(self, data):
+        """Handle MESSAGE_ACK gateway event"""
+        # received when other client ACKs messages
 
-                elif optext == "CALL_DELETE":
-                    self.call_buffer.append({
-                        "op": "CALL_DELETE",
-                        "channel_id": data["channel_id"],
-                    })
+        self.push_event(self.msg_ack_buffer, {
+            "message_id": data["message_id"],
+            "channel_id": data["channel_id"],
+        }, "msg_ack")
 
-                elif optext in ("THREAD_UPDATE", "THREAD_CREATE"):
-                    self.threads_buffer.append({
-                        "op": "THREAD_UPDATE",
-                        "guild_id": data["guild_id"],
-                        "threads": [{
-                            "id": data["id"],
-                            "type": data["type"],
-                            "owner_id": data["owner_id"],
-                            "name": data["name"],
-                            "locked": data["thread_metadata"]["locked"],
-                            "message_count": data["message_count"],
-                            "timestamp": data["thread_metadata"]["create_timestamp"],
-                            "parent_id": data["parent_id"],
-                            "suppress_everyone": False,   # no config for threads
-                            "suppress_roles": False,
-                            "message_notifications": None,
-                            "muted": False,
-                            "joined": False,
-                        }],
-                    })
 
-                elif optext == "THREAD_DELETE":
-                    self.threads_buffer.append({
-                        "op": "THRRAD_DELETE",
-                        "guild_id": data["guild_id"],
-                        "threads": [{
-                            "id": data["id"],
-                            "parent_id": data["parent_id"],
-                        }],
-                    })
+    def handle_guild_members_chunk(self, data):
+        """Handle GUILD_MEMBERS_CHUNK gateway event"""
+        # received when requesting members (op 8)
+        if self.querying_members:
+            self.querying_members = False
+            self.member_query_results = []
+            for member in data["members"]:
+                name = member.get("nick")
+                if not name:
+                    name = member["user"].get("global_name", member["user"]["username"])   # spacebar_fix - get
+                self.member_query_results.append({
+                    "id": member["user"]["id"],
+                    "username": member["user"]["username"],
+                    "name": name,
+                })
+        else:
+            guild_id = data["guild_id"]
+            for member in data["members"]:
+                if "roles" in member and "roles" in member:
+                    self.add_member_roles(
+                        guild_id,
+                        member["user"]["id"],
+                        member["roles"],
+                        nick=member.get("nick"),
+                    )
+                    if data.get("nonce"):
+                        self.roles_changed = data["nonce"]
+
+
+    def handle_thread_list_sync(self, data):
+        """Handle THREAD_LIST_SYNC gateway event"""
+        threads = []
+        guild_id = None
+        for thread in data["threads"]:
+            if not guild_id:
+                guild_id = thread["guild_id"]   # assuming its one event per thread
+            threads.append({
+                "id": thread["id"],
+                "type": thread["type"],
+                "owner_id": thread["owner_id"],
+                "name": thread["name"],
+                "locked": thread["thread_metadata"]["locked"],
+                "message_count": thread["message_count"],
+                "timestamp": thread["thread_metadata"].get("create_timestamp", None),
+                "parent_id": thread["parent_id"],
+                "suppress_everyone": False,   # no config for threads
+                "suppress_roles": False,
+                "message_notifications": None,
+                "muted": False,   # muted and joined are in READY event
+                "joined": False,
+            })
+        self.push_event(self.threads_buffer, {
+            "op": "THREAD_UPDATE",
+            "guild_id": guild_id,
+            "threads": threads,
+        }, "threads")
 
-                elif optext in ("CHANNEL_CREATE", "CHANNEL_UPDATE", "CHANNEL_DELETE"):
-                    new_channel = response["d"]
-                    channel_id = new_channel["id"]
-                    guild_id = new_channel.get("guild_id")
-                    if not guild_id:   # DMs
-                        channel_id = new_channel["id"]
-                        if optext == "CHANNEL_DELETE":
-                            for num, dm in enumerate(self.dms):
-                                if dm["id"] == channel_id:
-                                    self.dms.pop(num)
-                                    break
-                        else:
-                            self.add_dm(new_channel)
-                        self.dms_id = []
-                        for dm in self.dms:
-                            self.dms_id.append(dm["id"])
-                        self.guilds_changed = True
-                        continue
 
-                    if optext == "CHANNEL_DELETE":
-                        for num, guild in enumerate(self.guilds):
-                            if guild["guild_id"] == guild_id:
-                                for num_ch, channel in enumerate(guild["channels"]):
-                                    if channel["id"] == channel_id:
-                                        self.guilds[num]["channels"].pop(num_ch)
-                                        break
-                                break
-                    else:
-                        for num, guild in enumerate(self.guilds):
-                            if guild["guild_id"] == guild_id:
-                                for num_ch, channel in enumerate(guild["channels"]):
-                                    if channel["id"] == channel_id:
-                                        break
-                                else:
-                                    self.guilds[num]["channels"].append({})
-                                    num_ch += 1
-                                break
-                        else:
-                            continue
-                        ready_data = {
-                            "id": new_channel["id"],
-                            "type": new_channel["type"],
-                            "name": new_channel["name"],
-                            "topic": new_channel.get("topic"),
-                            "parent_id": new_channel.get("parent_id"),
-                            "position": new_channel["position"],
-                            "permission_overwrites": new_channel["permission_overwrites"],
-                            "hidden": False,
-                        }
-                        if new_channel.get("rate_limit_per_user"):
-                            ready_data["rate_limit"] = new_channel["rate_limit_per_user"]
-                        self.guilds[num]["channels"][num_ch] = ready_data
-                    self.guilds_changed = True
-
-                elif optext in ("GUILD_CREATE", "GUILD_UPDATE", "GUILD_DELETE"):
-                    guild_id = data["id"]
-                    if optext == "GUILD_CREATE":
-                        have_it = False
-                        for guild in self.guilds:
-                            if guild["guild_id"] == guild_id:
-                                have_it = True
-                                break
-                        if have_it:
-                            continue
-                        self.add_guild(data)
-                        # add my roles
-                        for member in data.get("members", []):
-                            if member.get("user_id") == self.my_id or member.get("id") or member["user"]["id"] == self.my_id:
-                                self.my_roles.append({
-                                    "guild_id": guild_id,
-                                    "roles": member["roles"],
-                                })
-                                break
-                        self.guilds_changed = True
-                    elif optext == "GUILD_UPDATE":
-                        for num, guild in enumerate(self.guilds):
-                            community = False
-                            for feature in data["features"]:
-                                if feature in ("COMMUNITY", "COMMUNITY_CANARY"):
-                                    community = True
-                                    break
-                            if guild["guild_id"] == guild_id:
-                                self.guilds[num]["owned"] = self.my_id == data["owner_id"]
-                                self.guilds[num]["name"] = data["name"]
-                                self.guilds[num]["description"] = data["description"]
-                                self.guilds[num]["community"] = community
-                                self.guilds[num]["premium"] = data["premium_tier"]
-                                self.guilds_changed = True
-                    elif optext == "GUILD_DELETE":
-                        for num, guild in enumerate(self.guilds):
-                            if guild["guild_id"] == guild_id:
-                                self.guilds.pop(num)
-                                self.guilds_changed = True
-                                break
-
-                elif optext in ("GUILD_ROLE_CREATE", "GUILD_ROLE_UPDATE", "GUILD_ROLE_DELETE"):
-                    guild_id = data["guild_id"]
-                    for num_guild, guild in enumerate(self.roles):
-                        if guild["guild_id"] == guild_id:
-                            break
+    def handle_guild_member_list_update(self, data):
+        """Handle GUILD_MEMBER_LIST_UPDATE gateway event"""
+        if not self.want_member_list:
+            return
+        guild_id = data["guild_id"]
+        list_id = data["id"]
+        member_lists = self.activities_index.get(guild_id)
+        if member_lists is None:
+            member_lists = {}
+            self.activities.append([guild_id, member_lists])   # [guild_id, member_lists]
+            self.activities_index[guild_id] = member_lists
+        for memlist in data["ops"]:
+            # keeping only necessary data, because the rest can be fetched with discord.get_user_guild()
+            if memlist["op"] == "SYNC":
+                if memlist["range"][0] != 0:
+                    # keeping only first chunk (first 99)
+                    continue
+                members_sync = []
+                for item in memlist["items"]:
+                    if "group" in item:
+                        members_sync.append({"group": item["group"]["id"]})
                     else:
-                        continue
-                    if optext == "GUILD_ROLE_CREATE":
-                        role = data["role"]
-                        self.roles[num_guild]["roles"].append({
-                            "id": role["id"],
-                            "name": role["name"],
-                            "color": role["color"],
-                            "position": role["position"],
-                            "hoist": role["hoist"],
-                            "permissions": role["permissions"],
+                        member_data = item["member"]
+                        ## unused for now
+                        # custom_status = None
+                        # activities = []
+                        # for activity in member_data["presence"]["activities"]:
+                        #     if activity["type"] == 4:
+                        #         custom_status = activity.get("state", "")
+                        #     elif activity["type"] in (0, 2):
+                        #         assets = activity.get("assets", {})
+                        #         activities.append({
+                        #             "type": activity["type"],
+                        #             "name": activity["name"],
+                        #             "state": activity.get("state"),
+                        #             "details": activity.get("details"),
+                        #             "small_text": assets.get("small_text"),
+                        #             "large_text": assets.get("large_text"),
+                        #         })
+                        members_sync.append({
+                            "id": member_data["user"]["id"],
+                            "username": member_data["user"]["username"],
+                            "global_name": member_data["user"].get("global_name"),   # spacebar_fix - get
+                            "nick": member_data["nick"],
+                            "roles": member_data["roles"],
+                            "status": member_data["presence"]["status"],
+                            # "custom_status": custom_status,
+                            # "activities": activities,
                         })
-                        # sort roles
-                        self.roles[num_guild]["roles"] = sorted(self.roles[num_guild]["roles"], key=lambda x: x.get("position"), reverse=True)
-                        self.roles[num_guild]["roles"] = sorted(self.roles[num_guild]["roles"], key=lambda x: not bool(x.get("color")))
-                        if not self.user_update:
-                            self.user_update = (None, None)
-                        self.guild_roles_changed = (guild_id, role["id"])
-                    elif optext == "GUILD_ROLE_UPDATE":
-                        role = data["role"]
-                        for num, role_old in enumerate(self.roles[num_guild]["roles"]):
-                            if role["id"] == role_old["id"]:
-                                self.roles[num_guild]["roles"][num] = {
-                                    "id": role["id"],
-                                    "name": role["name"],
-                                    "color": role["color"],
-                                    "position": role["position"],
-                                    "hoist": role["hoist"],
-                                    "permissions": role["permissions"],
-                                }
-                                # sort roles
-                                self.roles[num_guild]["roles"] = sorted(self.roles[num_guild]["roles"], key=lambda x: x.get("position"), reverse=True)
-                                self.roles[num_guild]["roles"] = sorted(self.roles[num_guild]["roles"], key=lambda x: not bool(x.get("color")))
-                                # update default role
-                                if role["id"] == guild_id:
-                                    for num_g, guild in enumerate(self.guilds):
-                                        if guild["guild_id"] == guild_id:
-                                            self.guilds[num_g]["permissions"] = role["permissions"]
-                                            break
-                                if not self.user_update:
-                                    self.user_update = (None, None)
-                                self.guild_roles_changed = (guild_id, role["id"])
-                                break
-                    elif optext == "GUILD_ROLE_DELETE":
-                        for num, role in enumerate(self.roles[num_guild]["roles"]):
-                            if role["id"] == data["role_id"]:
-                                self.roles[num_guild]["roles"].pop(num)
-                                if not self.user_update:
-                                    self.user_update = (None, None)
-                                self.guild_roles_changed = (guild_id, role["id"])
-                                break
-
-                self.execute_extensions_method_nochain("on_gateway_event", data, cache=True)
+                member_lists[list_id] = [0, members_sync]
+                self.activities_changed.append(guild_id)
+            elif memlist["op"] == "DELETE":
+                try:
+                    del member_lists[list_id][1][memlist["index"]]
+                except (IndexError, NameError):
+                    pass
+            elif memlist["op"] in ("UPDATE", "INSERT"):
+                # custom_status = None   # unused for now
+                if list_id not in member_lists:
+                    member_lists[list_id] = [0, []]   # [last_index, members]
+                if "group" in memlist["item"]:
+                    # group can only be inserted
+                    member_lists[list_id][1].insert(memlist["index"], {"group": memlist["item"]["group"]["id"]})
+                    if len(member_lists[list_id][1]) > 100:
+                        member_lists[list_id][1].pop(-1)
+                    self.activities_changed.append(guild_id)
+                    member_lists[list_id][0] = int(memlist["index"])
+                    continue
+                member_data = memlist["item"]["member"]
+                activities = []
+                for activity in member_data["presence"]["activities"]:
+                    # if activity["type"] == 4:
+                    #     custom_status = activity.get("state", "")
+                    if activity["type"] in (0, 2):
+                        assets = activity.get("assets", {})
+                        activities.append({
+                            "type": activity["type"],
+                            "name": activity["name"],
+                            "state": activity.get("state"),
+                            "details": activity.get("details"),
+                            "small_text": assets.get("small_text"),
+                            "large_text": assets.get("large_text"),
+                        })
+                member_id = member_data["user"]["id"]
+                ready_data = {
+                    "id": member_id,
+                    "username": member_data["user"]["username"],
+                    "global_name": member_data["user"].get("global_name"),   # spacebar_fix - get
+                    "nick": member_data["nick"],
+                    "roles": member_data["roles"],
+                    "status": member_data["presence"]["status"],
+                    # "custom_status": custom_status,
+                    # "activities": activities,
+                }
+                if memlist["op"] == "UPDATE":
+                    try:
+                        if member_lists[list_id][1][memlist["index"]].get("id") == member_id:
+                            member_lists[list_id][1][memlist["index"]].update(ready_data)
+                        else:   # failsafe
+                            for num, member in enumerate(member_lists[list_id][1]):
+                                if member.get("id") == member_id:
+                                    member_lists[list_id][1][num].update(ready_data)
+                    except IndexError:
+                        pass
+                else:   # INSERT
+                    member_lists[list_id][1].insert(memlist["index"], ready_data)
+                    if len(member_lists[list_id][1]) > 100:   # lets have some limits
+                        member_lists[list_id][1].pop(-1)
+                member_lists[list_id][0] = int(memlist["index"])
+            self.activities_changed.append(guild_id)
+
+
+    def handle_user_settings_proto_update(self, data):
+        """Handle USER_SETTINGS_PROTO_UPDATE gateway event"""
+        if data["partial"] or data["settings"]["type"] != 1:
+            return EVENT_SKIP
+        decoded = PreloadedUserSettings.FromString(base64.b64decode(data["settings"]["proto"]))
+        self.user_settings_proto = MessageToDict(decoded)
+        self.proto_changed = True
+
+
+    def handle_user_guild_settings_update(self, data):
+        """Handle USER_GUILD_SETTINGS_UPDATE gateway event"""
+        if data["guild_id"]:   # guild and channel
+            guild_g = self.guilds_index.get(data["guild_id"])
+            if not guild_g:
+                return EVENT_SKIP
+            guild_g.pop("suppress_everyone", None)   # reset to default
+            guild_g.pop("suppress_roles", None)
+            guild_g.pop("message_notifications", None)
+            guild_g.pop("muted", None)
+            guild_flags = int(data.get("flags", 0))
+            # opt_in_channels means: show all guild channels - when guild is joined
+            opt_in_channels = not perms.decode_flag(guild_flags, 14) or perms.decode_flag(guild_flags, 13)
+            guild_g.update({
+                "suppress_everyone": data["suppress_everyone"],
+                "suppress_roles": data["suppress_roles"],
+                "message_notifications": data["message_notifications"],
+                "muted": data["muted"],
+                "opt_in_channels": opt_in_channels,
+            })
+            # reset all to defaults
+            for channel in guild_g["channels"]:
+                if channel["type"] in (0, 2, 4, 5, 15):
+                    flags = int(channel.get("flags", 0))
+                    hidden = not perms.decode_flag(flags, 12)   # manually hidden
+                else:
+                    hidden = False
+                channel["hidden"] = hidden
+                channel["muted"] = False
+                channel["message_notifications"] = 3
+            self.process_one_channel_overrides(data["channel_overrides"], guild_g, data["message_notifications"])
+            self.process_hidden_channels()
+        else:   # dm
+            for dm_g in self.dms:
+                dm_g.pop("message_notifications", None)   # reset to default
+                dm_g.pop("muted", None)
+            for dm in data["channel_overrides"]:
+                dm_g = self.dms_index.get(dm["channel_id"])
+                if not dm_g:
+                    continue
+                dm_g.update({
+                    "message_notifications": dm["message_notifications"],
+                    "muted": dm["muted"],
+                })
+        self.guilds_changed = True
 
-            elif opcode == 7:
-                logger.info("Host requested reconnect")
-                self.resumable = True
-                break
 
-            elif opcode == 9:
-                if response["d"]:
-                    logger.info("Session invalidated, reconnecting")
-                    break
+    def handle_user_update(self, data):
+        """Handle USER_UPDATE gateway event"""
+        self.set_my_user_data(data)
+        self.my_id = data["id"]
+        self.premium = data.get("premium_type")
+        self.user_update = (self.my_user_data, None)
+
+
+    def handle_guild_member_update(self, data):
+        """Handle GUILD_MEMBER_UPDATE gateway event"""
+        if data["user"]["id"] == self.my_id:
+            nick = data.get("nick")
+            roles_changed = None
+            my_roles = self.my_roles_index.get(data["guild_id"])
+            if my_roles:
+                my_roles["roles"] = data["roles"]
+                roles_changed = data["guild_id"]
+            self.user_update = ({
+                "id": data["user"]["id"],
+                "nick": nick,
+            }, roles_changed)
+
+
+    def handle_app_command_autocomplete_response(self, data):
+        """Handle APPLICATION_COMMAND_AUTOCOMPLETE_RESPONSE gateway event"""
+        self.app_command_autocomplete_resp = data["choices"]
+
+
+    def handle_message_poll_vote(self, data, optext):
+        """Handle MESSAGE_POLL_VOTE_ADD, MESSAGE_POLL_VOTE_REMOVE gateway events"""
+        data["id"] = data.pop("message_id")
+        self.push_event(self.messages_buffer, {
+            "op": optext,
+            "d": data,
+        }, "messages")
+
+
+    def handle_voice_state_update(self, data):
+        """Handle VOICE_STATE_UPDATE gateway event"""
+        if "session_id" not in self.voice_gateway_data and self.voice_gateway_data_ready >= 1:
+            self.voice_gateway_data["session_id"] = data["session_id"]
+            self.voice_gateway_data["guild_id"] = data.get("guild_id")
+            if not self.voice_gateway_data["guild_id"]:
+                self.voice_gateway_data["guild_id"] = data["channel_id"]   # must be channel_id in DM
+            self.voice_gateway_data["channel_id"] = data["channel_id"]
+            self.voice_gateway_data_ready += 1
+        elif data["user_id"] != self.my_id:
+            name = None
+            if "member" in data:
+                name = data["member"].get("nick")
+                if not name:
+                    name = data["member"]["user"].get("global_name", data["member"]["user"]["username"])   # spacebar_fix - get
+            self.push_event(self.call_buffer, {
+                "op": "STATE_UPDATE",
+                "channel_id": data["channel_id"],
+                "user_id": data["user_id"],
+                "name": name,
+                "muted": data["self_mute"] or data["mute"],
+            }, "calls")
+            # this is just to get mute states, enter/leave call and speaking are sent in voice gateway
+
+
+    def handle_voice_server_update(self, data):
+        """Handle VOICE_SERVER_UPDATE gateway event"""
+        if "endpoint" not in self.voice_gateway_data and self.voice_gateway_data_ready >= 1:
+            self.voice_gateway_data["token"] = data["token"]
+            self.voice_gateway_data["endpoint"] = data["endpoint"]
+            self.voice_gateway_data_ready += 1
+
+
+    def handle_call_create(self, data):
+        """Handle CALL_CREATE gateway event"""
+        # event is received even when this client creates call
+        if not data["voice_states"] or data["voice_states"][0]["user_id"] != self.my_id:
+            self.push_event(self.call_buffer, {
+                "op": "CALL_CREATE",
+                "channel_id": data["channel_id"],
+                "ringing": self.my_id in data["ringing"],
+            }, "calls")
+
+
+    def handle_call_update(self, data):
+        """Handle CALL_UPDATE gateway event"""
+        self.push_event(self.call_buffer, {
+            "op": "CALL_UPDATE",
+            "channel_id": data["channel_id"],
+            "ringing": self.my_id in data["ringing"],
+        }, "calls")
+
+
+    def handle_call_delete(self, data):
+        """Handle CALL_DELETE gateway event"""
+        self.push_event(self.call_buffer, {
+            "op": "CALL_DELETE",
+            "channel_id": data["channel_id"],
+        }, "calls")
+
+
+    def handle_thread_update(self, data):
+        """Handle THREAD_UPDATE, THREAD_CREATE gateway events"""
+        self.push_event(self.threads_buffer, {
+            "op": "THREAD_UPDATE",
+            "guild_id": data["guild_id"],
+            "threads": [{
+                "id": data["id"],
+                "type": data["type"],
+                "owner_id": data["owner_id"],
+                "name": data["name"],
+                "locked": data["thread_metadata"]["locked"],
+                "message_count": data["message_count"],
+                "timestamp": data["thread_metadata"]["create_timestamp"],
+                "parent_id": data["parent_id"],
+                "suppress_everyone": False,   # no config for threads
+                "suppress_roles": False,
+                "message_notifications": None,
+                "muted": False,
+                "joined": False,
+            }],
+        }, "threads")
+
+
+    def handle_thread_delete(self, data):
+        """Handle THREAD_DELETE gateway event"""
+        self.push_event(self.threads_buffer, {
+            "op": "THRRAD_DELETE",
+            "guild_id": data["guild_id"],
+            "threads": [{
+                "id": data["id"],
+                "parent_id": data["parent_id"],
+            }],
+        }, "threads")
+
+
+    def handle_channel_event(self, data, optext):
+        """Handle CHANNEL_CREATE, CHANNEL_UPDATE, CHANNEL_DELETE gateway events"""
+        new_channel = data
+        channel_id = new_channel["id"]
+        guild_id = new_channel.get("guild_id")
+        if not guild_id:   # DMs
+            channel_id = new_channel["id"]
+            if optext == "CHANNEL_DELETE":
+                self.remove_dm(channel_id)
+            else:
+                self.add_dm(new_channel)
+            self.dms_id = []
+            for dm in self.dms:
+                self.dms_id.append(dm["id"])
+            self.guilds_changed = True
+            return EVENT_SKIP
+
+        if optext == "CHANNEL_DELETE":
+            channel = self.get_channel(channel_id, guild_id)
+            if channel:
+                self.guilds_index[guild_id]["channels"].remove(channel)
+                self.channels_index.pop(channel_id)
+        else:
+            guild = self.guilds_index.get(guild_id)
+            if not guild:
+                return EVENT_SKIP
+            ready_data = {
+                "id": new_channel["id"],
+                "type": new_channel["type"],
+                "name": new_channel["name"],
+                "topic": new_channel.get("topic"),
+                "parent_id": new_channel.get("parent_id"),
+                "position": new_channel["position"],
+                "permission_overwrites": new_channel["permission_overwrites"],
+                "hidden": False,
+            }
+            if new_channel.get("rate_limit_per_user"):
+                ready_data["rate_limit"] = new_channel["rate_limit_per_user"]
+            channel = self.get_channel(channel_id, guild_id)
+            if channel:
+                guild["channels"][guild["channels"].index(channel)] = ready_data
+            else:
+                guild["channels"].append(ready_data)
+            self.channels_index[channel_id] = (guild, ready_data)
+        self.guilds_changed = True
 
-        self.state = 0
-        logger.debug("Receiver stopped")
-        self.reconnect_requested = True
-        self.heartbeat_running = False
+
+    def handle_guild_event(self, data, optext):
+        """Handle GUILD_CREATE, GUILD_UPDATE, GUILD_DELETE gateway events"""
+        guild_id = data["id"]
+        if optext == "GUILD_CREATE":
+            if guild_id in self.guilds_index:
+                return EVENT_SKIP
+            self.add_guild(data)
+            # add my roles
+            for member in data.get("members", []):
+                if member.get("user_id") == self.my_id or member.get("id") or member["user"]["id"] == self.my_id:
+                    my_roles = {
+                        "guild_id": guild_id,
+                        "roles": member["roles"],
+                    }
+                    self.my_roles.append(my_roles)
+                    self.my_roles_index[guild_id] = my_roles
+                    break
+            self.guilds_changed = True
+        elif optext == "GUILD_UPDATE":
+            guild = self.guilds_index.get(guild_id)
+            if guild:
+                community = False
+                for feature in data["features"]:
+                    if feature in ("COMMUNITY", "COMMUNITY_CANARY"):
+                        community = True
+                        break
+                guild["owned"] = self.my_id == data["owner_id"]
+                guild["name"] = data["name"]
+                guild["description"] = data["description"]
+                guild["community"] = community
+                guild["premium"] = data["premium_tier"]
+                self.guilds_changed = True
+        elif optext == "GUILD_DELETE":
+            guild = self.guilds_index.get(guild_id)
+            if guild:
+                self.guilds.remove(guild)
+                self.unindex_guild(guild)
+                self.guilds_changed = True
+
+
+    def handle_guild_role_event(self, data, optext):
+        """Handle GUILD_ROLE_CREATE, GUILD_ROLE_UPDATE, GUILD_ROLE_DELETE gateway events"""
+        guild_id = data["guild_id"]
+        guild = self.roles_index.get(guild_id)
+        if not guild:
+            return EVENT_SKIP
+        if optext in ("GUILD_ROLE_CREATE", "GUILD_ROLE_UPDATE"):
+            role = data["role"]
+            role_old = self.role_index.get(role["id"])
+            if optext == "GUILD_ROLE_UPDATE" and not role_old:
+                return
+            new_role = {
+                "id": role["id"],
+                "name": role["name"],
+                "color": role["color"],
+                "position": role["position"],
+                "hoist": role["hoist"],
+                "permissions": role["permissions"],
+            }
+            if optext == "GUILD_ROLE_CREATE":
+                guild["roles"].append(new_role)
+            else:
+                guild["roles"][guild["roles"].index(role_old)] = new_role
+            self.role_index[role["id"]] = new_role
+            # sort roles
+            guild["roles"] = sorted(guild["roles"], key=lambda x: x.get("position"), reverse=True)
+            guild["roles"] = sorted(guild["roles"], key=lambda x: not bool(x.get("color")))
+            # update default role
+            if optext == "GUILD_ROLE_UPDATE" and role["id"] == guild_id and guild_id in self.guilds_index:
+                self.guilds_index[guild_id]["permissions"] = role["permissions"]
+            if not self.user_update:
+                self.user_update = (None, None)
+            self.guild_roles_changed = (guild_id, role["id"])
+        elif optext == "GUILD_ROLE_DELETE":
+            role = self.role_index.pop(data["role_id"], None)
+            if role:
+                guild["roles"].remove(role)
+                if not self.user_update:
+                    self.user_update = (None, None)
+                self.guild_roles_changed = (guild_id, role["id"])
 
 
     def send_heartbeat(self):
@@ -1712,6 +2069,7 @@ class Gateway():
             # in this time heartbeat ack should be received from discord
             time.sleep(1)
         self.state = 0
+        self.mark_changed("state")
         logger.debug("Heartbeater stopped")
         self.reconnect_requested = True
 
@@ -1745,18 +2103,17 @@ class Gateway():
         """
         self.ws.close(timeout=0)   # this will stop receiver
         time.sleep(1)   # so receiver ends before opening new socket
-        reset_inflator()   # otherwise decompression wont work
         self.ws = websocket.WebSocket()
         try:
             self.connect_ws(resume=True)
         except websocket._exceptions.WebSocketBadStatusException:
             logger.info("Failed to resume connection")
             return 9
-        _ = zlib_decompress(self.ws.recv())
+        _ = self.decompress(self.ws.recv())
         payload = {"op": 6, "d": {"token": self.token, "session_id": self.session_id, "seq": self.sequence}}
         self.send(payload)
         try:
-            op = json.loads(zlib_decompress(self.ws.recv()))["op"]
+            op = json.loads(self.decompress(self.ws.recv()))["op"]
             logger.debug(f"Connection resumed with code {op}")
             return op or True
         except json.JSONDecodeError:
@@ -1768,6 +2125,7 @@ class Gateway():
         """Try to resume session, if cant, create new one"""
         if not self.wait:
             self.state = 2
+            self.mark_changed("state")
             logger.info("Trying to reconnect")
         try:
             code = None
@@ -1778,7 +2136,6 @@ class Gateway():
                 logger.debug("Restarting connection")
                 self.ws.close(timeout=0)   # this will stop receiver
                 time.sleep(1)   # so receiver ends before opening new socket
-                reset_inflator()   # otherwise decompression wont work
                 self.ready = False   # will receive new ready event
                 self.ws = websocket.WebSocket()
                 self.connect_ws()
@@ -1792,6 +2149,7 @@ class Gateway():
                 self.heartbeat_thread = threading.Thread(target=self.send_heartbeat, daemon=True)
                 self.heartbeat_thread.start()
             self.state = 1
+            self.mark_changed("state")
             logger.info("Connection established")
         except websocket._exceptions.WebSocketAddressException:
             if not self.wait:   # if not running from wait_oline
@@ -2033,11 +2391,19 @@ class Gateway():
     def set_want_member_list(self, want):
         """Set if client wants to receive member list updates"""
         self.want_member_list = want
+        if want:
+            self.disabled_events.discard("GUILD_MEMBER_LIST_UPDATE")
+        else:
+            self.disabled_events.add("GUILD_MEMBER_LIST_UPDATE")
 
 
     def set_want_summaries(self, want):
         """Set if client wants to receive summaries"""
         self.want_summaries = want
+        if want:
+            self.disabled_events.discard("CONVERSATION_SUMMARY_UPDATE")
+        else:
+            self.disabled_events.add("CONVERSATION_SUMMARY_UPDATE")
 
 
     def set_offline(self):
@@ -2087,11 +2453,50 @@ class Gateway():
         return None
 
 
+    def get_guild(self, guild_id):
+        """Get guild by its id, from the same list as get_guilds"""
+        return self.guilds_index.get(guild_id)
+
+
+    def get_channel(self, channel_id, guild_id=None):
+        """Get guild channel by its id, optionally only if it is in specified guild"""
+        guild_channel = self.channels_index.get(channel_id)
+        if guild_channel and (guild_id is None or guild_channel[0]["guild_id"] == guild_id):
+            return guild_channel[1]
+        return None
+
+
+    def get_channel_guild(self, channel_id):
+        """Get guild containing channel with this id"""
+        guild_channel = self.channels_index.get(channel_id)
+        if guild_channel:
+            return guild_channel[0]
+        return None
+
+
+    def get_dm(self, channel_id):
+        """Get DM by its channel id"""
+        return self.dms_index.get(channel_id)
+
+
     def get_roles(self):
         """Get list of roles for all guilds with their metadata, updated only when reconnecting"""
         return self.roles
 
 
+    def get_guild_roles(self, guild_id):
+        """Get list of roles for one guild"""
+        roles = self.roles_index.get(guild_id)
+        if roles:
+            return roles["roles"]
+        return []
+
+
+    def get_role(self, role_id):
+        """Get role by its id"""
+        return self.role_index.get(role_id)
+
+
     def get_blocked(self):
         """Get list of blocked user ids"""
         return self.blocked
@@ -2115,6 +2520,14 @@ class Gateway():
         return self.my_roles
 
 
+    def get_my_guild_roles(self, guild_id):
+        """Get list of my role ids in one guild, None if guild is unknown"""
+        my_roles = self.my_roles_index.get(guild_id)
+        if my_roles:
+            return my_roles["roles"]
+        return None
+
+
     def get_my_id(self):
         """Get my discord user ID"""
         return self.my_id
@@ -2174,6 +2587,22 @@ class Gateway():
         return [], []
 
 
+    def get_member(self, guild_id, user_id):
+        """Get cached member roles and nick of one guild member"""
+        guild_members = self.members_index.get(guild_id)
+        if guild_members:
+            return guild_members[1].get(user_id)
+        return None
+
+
+    def get_guild_members(self, guild_id):
+        """Get list of cached member roles for one guild, same list as in get_member_roles"""
+        guild_members = self.members_index.get(guild_id)
+        if guild_members:
+            return guild_members[0]["members"]
+        return None
+
+
     def get_member_roles(self):
         """Get member roles, updated regularly."""
         if self.roles_changed:
@@ -2263,9 +2692,9 @@ class Gateway():
         Get message CREATE, UPDATE, DELETE and ACK events for every guild and channel.
         Returns 1 by 1 event as an update for list of messages.
         """
-        if len(self.messages_buffer) == 0:
+        if not self.messages_buffer:
             return None
-        return self.messages_buffer.pop(0)
+        return self.messages_buffer.popleft()
 
 
     def get_typing(self):
@@ -2273,9 +2702,9 @@ class Gateway():
         Get typing across guilds.
         Returns 1 by 1 event as an update for list of typing.
         """
-        if len(self.typing_buffer) == 0:
+        if not self.typing_buffer:
             return None
-        return self.typing_buffer.pop(0)
+        return self.typing_buffer.popleft()
 
 
     def get_summaries(self):
@@ -2283,9 +2712,9 @@ class Gateway():
         Get summaries.
         Returns 1 by 1 event as an update for list of summaries.
         """
-        if len(self.summaries_buffer) == 0:
+        if not self.summaries_buffer:
             return None
-        return self.summaries_buffer.pop(0)
+        return self.summaries_buffer.popleft()
 
 
     def get_message_ack(self):
@@ -2293,9 +2722,9 @@ class Gateway():
         Get messages seen by other clients.
         Returns 1 by 1 ack event.
         """
-        if len(self.msg_ack_buffer) == 0:
+        if not self.msg_ack_buffer:
             return None
-        return self.msg_ack_buffer.pop(0)
+        return self.msg_ack_buffer.popleft()
 
 
     def get_threads(self):
@@ -2303,9 +2732,9 @@ class Gateway():
         Get thread update related events: update, crate and delete.
         Returns 1 by 1 update event with opcode.
         """
-        if len(self.threads_buffer) == 0:
+        if not self.threads_buffer:
             return None
-        return self.threads_buffer.pop(0)
+        return self.threads_buffer.popleft()
 
 
     def get_call_events(self):
@@ -2313,6 +2742,6 @@ class Gateway():
         Get call events.
         Returns 1 by 1 call event.
         """
-        if len(self.call_buffer) == 0:
+        if not self.call_buffer:
             return None
-        return self.call_buffer.pop(0)
+        return self.call_buffer.popleft()
@@ -0,0 +1,144 @@
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+decoder = json.JSONDecoder()
+
+
+def reduce_fields(value, fields):
+    """
+    Keep only specified fields in decoded value.
+    fields is dict of key: subfields, where subfields are applied to object or each object in list, None keeps whole value.
+    """
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [reduce_fields(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {key: reduce_fields(value[key], subfields) for key, subfields in fields.items() if key in value}
+    return value
+
+
+class JsonStream:
+    """
+    Decode JSON document from iterator of bytes chunks, one value at a time.
+    Only part of text that is not yet decoded is kept in memory.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.done = False
+
+
+    def fill(self, size=0):
+        """Drop decoded text and read chunks until more than size characters are available, return False if nothing was read"""
+        parts = [self.buffer[self.pos:]]
+        length = len(parts[0])
+        self.pos = 0
+        for chunk in self.chunks:
+            parts.append(self.utf8.decode(chunk))
+            length += len(parts[-1])
+            if length > size:
+                break
+        else:
+            self.done = True
+        self.buffer = "".join(parts)
+        return len(parts) > 1
+
+
+    def peek(self):
+        """Skip whitespace and get next character, empty string at the end of document"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+
+    def expect(self, char):
+        """Consume next character, raise ValueError if its not expected one"""
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at position {self.pos}")
+        self.pos += 1
+
+
+    def value(self):
+        """Decode next whole value"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # value is not complete, read at least twice as much so retries stay linear
+                if not self.fill(2 * (len(self.buffer) - self.pos)):
+                    raise
+                continue
+            # number at the end of buffer could continue in next chunk, even after "." or "e" that are not decoded yet
+            if not self.done and isinstance(value, (int, float)) and NUMBER_TAIL.fullmatch(self.buffer, end):
+                self.fill(len(self.buffer) - self.pos)
+                continue
+            self.pos = end
+            return value
+
+
+    def items(self):
+        """Iterate over keys of next object, value of each key must be consumed before next iteration"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' at position {self.pos - 1}")
+
+
+    def array_values(self):
+        """Iterate over decoded items of next array, one at a time"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' at position {self.pos - 1}")
+
+
+    def skip(self):
+        """Consume next value without keeping it, arrays are decoded one item at a time"""
+        if self.peek() == "[":
+            for _ in self.array_values():
+                pass
+        else:
+            self.value()
+
+
+    def fields(self, fields):
+        """
+        Decode next object keeping only specified fields, see reduce_fields.
+        Arrays in this object are decoded one item at a time, so only one whole item is in memory.
+        """
+        result = {}
+        for key in self.items():
+            if key not in fields:
+                self.skip()
+            elif self.peek() == "[":
+                result[key] = [reduce_fields(item, fields[key]) for item in self.array_values()]
+            else:
+                result[key] = reduce_fields(self.value(), fields[key])
+        return result
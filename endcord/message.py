@@ -1,4 +1,5 @@
 import re
+import sys
 from datetime import datetime
 from endcord.l10n import _
 
@@ -31,6 +32,157 @@ match_discord_attachment_url = re.compile(
     r"https:\/\/(?:cdn|media)\.discord(?:app)?\.(?:com|net)\/attachments\/\d+\/\d+\/([^\?\s)\]>]+)(?:\?.+)?"
 )
 match_url = re.compile(r"https?:\/\/[\w-]+(\.[\w-])+[^\s)\]>]*")
+MESSAGE_FIELDS = (
+    "id",
+    "channel_id",
+    "guild_id",
+    "timestamp",
+    "edited",
+    "content",
+    "mentions",
+    "mention_roles",
+    "mention_everyone",
+    "user_id",
+    "username",
+    "global_name",
+    "nick",
+    "referenced_message",
+    "reactions",
+    "embeds",
+    "stickers",
+    "interaction",
+    "webhook_id",
+    "application_id",
+)
+MESSAGE_FIELDS_SET = frozenset(MESSAGE_FIELDS)
+MISSING = object()
+
+
+class Message:
+    """
+    Compact message record with dict-like access, so it can be used everywhere prepared message dict was used.
+    Fields that every prepared message has are stored in slots, all other keys (poll, nonce, deleted...) in extra dict.
+    """
+
+    __slots__ = (*MESSAGE_FIELDS, "extra")
+
+    def __init__(self, **fields):
+        for key in MESSAGE_FIELDS:
+            setattr(self, key, fields.pop(key, None))
+        self.extra = fields or None
+
+    def __getitem__(self, key):
+        """message[key]"""
+        if key in MESSAGE_FIELDS_SET:
+            return getattr(self, key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        """message[key] = value"""
+        if key in MESSAGE_FIELDS_SET:
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        """Delete key, slot fields are set to None"""
+        if key in MESSAGE_FIELDS_SET:
+            setattr(self, key, None)
+        elif self.extra is None:
+            raise KeyError(key)
+        else:
+            del self.extra[key]
+
+    def __contains__(self, key):
+        """Check if message has key"""
+        return key in MESSAGE_FIELDS_SET or (
+            self.extra is not None and key in self.extra
+        )
+
+    def __iter__(self):
+        """Iterate over keys"""
+        yield from MESSAGE_FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        """Number of keys"""
+        return len(MESSAGE_FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def __eq__(self, other):
+        """Compare with other message or dict"""
+        if isinstance(other, (Message, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        """Show as dict"""
+        return f"Message({self.to_dict()!r})"
+
+    def get(self, key, default=None):
+        """dict.get clone"""
+        if key in MESSAGE_FIELDS_SET:
+            return getattr(self, key)
+        if self.extra is None:
+            return default
+        return self.extra.get(key, default)
+
+    def pop(self, key, default=MISSING):
+        """dict.pop clone, slot fields are set to None"""
+        if key in MESSAGE_FIELDS_SET:
+            value = getattr(self, key)
+            setattr(self, key, None)
+            return value
+        if self.extra is not None and key in self.extra:
+            return self.extra.pop(key)
+        if default is MISSING:
+            raise KeyError(key)
+        return default
+
+    def setdefault(self, key, default=None):
+        """dict.setdefault clone"""
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, fields):
+        """dict.update clone"""
+        for key, value in fields.items():
+            self[key] = value
+
+    def keys(self):
+        """dict.keys clone"""
+        return list(self)
+
+    def values(self):
+        """dict.values clone"""
+        return [self[key] for key in self]
+
+    def items(self):
+        """dict.items clone"""
+        return [(key, self[key]) for key in self]
+
+    def copy(self):
+        """Shallow copy of this message"""
+        return Message(**self.to_dict())
+
+    def to_dict(self):
+        """Convert message to plain dict, eg. for json"""
+        message_dict = {key: getattr(self, key) for key in MESSAGE_FIELDS}
+        if self.extra:
+            message_dict.update(self.extra)
+        return message_dict
+
+
+def intern(text):
+    """Intern string that is repeated in many messages, like user id or username"""
+    if text is None:
+        return None
+    return sys.intern(text)
 
 
 def get_newlined_value(embed, name):
@@ -199,12 +351,14 @@ def prepare_message(message):
                 "timestamp": message["referenced_message"]["timestamp"],
                 "content": message["referenced_message"]["content"],
                 "mentions": ref_mentions,
-                "user_id": message["referenced_message"]["author"]["id"],
-                "username": message["referenced_message"]["author"]["username"],
-                "global_name": message["referenced_message"]["author"].get(
-                    "global_name"
+                "user_id": intern(message["referenced_message"]["author"]["id"]),
+                "username": intern(
+                    message["referenced_message"]["author"]["username"]
+                ),
+                "global_name": intern(
+                    message["referenced_message"]["author"].get("global_name")
                 ),  # spacebar_fix - get
-                "nick": reference_nick,
+                "nick": intern(reference_nick),
                 "embeds": reference_embeds,
                 "stickers": message["referenced_message"].get("sticker_items", []),
             }
@@ -265,9 +419,11 @@ def prepare_message(message):
         for mention in message["mentions"]:
             mentions.append(
                 {
-                    "username": mention.get("username"),  # spacebar_fix - get
-                    "global_name": mention.get("global_name"),  # spacebar_fix - get
-                    "id": mention["id"],
+                    "username": intern(mention.get("username")),  # spacebar_fix - get
+                    "global_name": intern(
+                        mention.get("global_name")
+                    ),  # spacebar_fix - get
+                    "id": intern(mention["id"]),
                 }
             )
 
@@ -295,36 +451,38 @@ def prepare_message(message):
         message["content"] += new_content_str
         embeds.extend(new_embeds)
 
-    message_dict = {
-        "id": message["id"],
-        "channel_id": message["channel_id"],
-        "guild_id": message.get("guild_id"),
-        "timestamp": message["timestamp"],
-        "edited": bool(message.get("edited_timestamp")),  # spacebar_fix - get
-        "content": message["content"],
-        "mentions": mentions,
-        "mention_roles": message["mention_roles"],
-        "mention_everyone": message["mention_everyone"],
-        "user_id": message["author"]["id"],
-        "username": message["author"]["username"],
-        "global_name": message["author"].get("global_name"),  # spacebar_fix - get
-        "nick": nick,
-        "referenced_message": reference,
-        "reactions": reactions,
-        "embeds": embeds,
-        "stickers": message.get("sticker_items", []),  # {name, id, format_type}
-        "interaction": interaction,
-        "webhook_id": message.get("webhook_id"),
-        "application_id": message.get("application_id"),
-    }
+    message_done = Message(
+        id=message["id"],
+        channel_id=message["channel_id"],
+        guild_id=message.get("guild_id"),
+        timestamp=message["timestamp"],
+        edited=bool(message.get("edited_timestamp")),  # spacebar_fix - get
+        content=message["content"],
+        mentions=mentions,
+        mention_roles=message["mention_roles"],
+        mention_everyone=message["mention_everyone"],
+        user_id=intern(message["author"]["id"]),
+        username=intern(message["author"]["username"]),
+        global_name=intern(
+            message["author"].get("global_name")
+        ),  # spacebar_fix - get
+        nick=intern(nick),
+        referenced_message=reference,
+        reactions=reactions,
+        embeds=embeds,
+        stickers=message.get("sticker_items", []),  # {name, id, format_type}
+        interaction=interaction,
+        webhook_id=message.get("webhook_id"),
+        application_id=message.get("application_id"),
+    )
 
     if poll:
-        message_dict["poll"] = poll
+        message_done["poll"] = poll
     if component_info:
-        message_dict["component_info"] = component_info
+        message_done["component_info"] = component_info
     # if message["author"].get("bot"):
-    #     message_dict["bot"] = True
-    return message_dict
+    #     message_done["bot"] = True
+    return message_done
 
 
 def prepare_messages(data, have_channel_id=False):
@@ -0,0 +1,260 @@
+import json
+import os
+import sqlite3
+import threading
+
+from endcord.message import Message
+
+TRANSIENT_KEYS = ("nonce", "pending", "deleted", "spoiled")   # set by app, not part of message
+
+
+def encode_message(message):
+    """Convert message to json string for storing, without keys set by app"""
+    if isinstance(message, Message):
+        message = message.to_dict()
+    else:
+        message = dict(message)
+    for key in TRANSIENT_KEYS:
+        message.pop(key, None)
+    return json.dumps(message, separators=(",", ":"))
+
+
+def decode_message(data):
+    """Convert stored json string back to message"""
+    return Message(**json.loads(data))
+
+
+class MessageStore:
+    """
+    Persistent message cache in sqlite database.
+    For each channel, ranges of message ids are stored, for which all messages in that range are known to be stored,
+    so chat can be served from disk only when there are no gaps in it.
+    Ranges are made from downloaded chunks, that are always continuous, and extended by received new messages.
+    Newest messages are served only for live channels, whose newest chunk was downloaded in this session,
+    so edits and deletions made while client was not running are applied to it.
+    """
+
+    def __init__(self, path, limit=1000):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.live = set()   # channels whose newest range is extended with new messages from gateway
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS messages (channel_id TEXT, id INTEGER, data TEXT, PRIMARY KEY (channel_id, id)) WITHOUT ROWID")
+        # first - start_id is first message in the channel
+        self.connection.execute("CREATE TABLE IF NOT EXISTS ranges (channel_id TEXT, start_id INTEGER, end_id INTEGER, first INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ranges_channel ON ranges (channel_id, end_id)")
+        self.connection.commit()
+
+
+    def close(self):
+        """Close database"""
+        with self.lock:
+            self.connection.close()
+
+
+    def reset_live(self):
+        """Stop extending ranges with new messages, used after reconnecting, when some messages might have been missed"""
+        self.live = set()
+
+
+    def get_range(self, channel_id, message_id):
+        """Get stored range containing this message id"""
+        return self.connection.execute(
+            "SELECT start_id, end_id, first FROM ranges WHERE channel_id = ? AND start_id <= ? AND end_id >= ?",
+            (channel_id, message_id, message_id),
+        ).fetchone()
+
+
+    def get_newest_range(self, channel_id):
+        """Get stored range with newest messages"""
+        return self.connection.execute(
+            "SELECT start_id, end_id, first FROM ranges WHERE channel_id = ? ORDER BY end_id DESC LIMIT 1",
+            (channel_id, ),
+        ).fetchone()
+
+
+    def select(self, channel_id, start_id, end_id, num):
+        """Get up to num newest messages with id in range, newest first"""
+        rows = self.connection.execute(
+            "SELECT data FROM messages WHERE channel_id = ? AND id >= ? AND id <= ? ORDER BY id DESC LIMIT ?",
+            (channel_id, start_id, end_id, num),
+        ).fetchall()
+        return [decode_message(row[0]) for row in rows]
+
+
+    def get_latest(self, channel_id, num, last_message_id):
+        """
+        Get num newest messages in channel, newest first.
+        Return None if channel is not live, or newest stored range does not reach last_message_id or is shorter than num messages.
+        """
+        if not last_message_id or channel_id not in self.live:
+            return None
+        last_message_id = int(last_message_id)
+        with self.lock:
+            newest = self.get_newest_range(channel_id)
+            if not newest or newest[1] < last_message_id:
+                return None
+            messages = self.select(channel_id, newest[0], newest[1], num)
+        if len(messages) < num and not newest[2]:
+            return None
+        return messages
+
+
+    def get_newest_id(self, channel_id):
+        """Get id of newest message in newest stored range, used to download only newer messages"""
+        with self.lock:
+            newest = self.get_newest_range(channel_id)
+        if newest:
+            return newest[1]
+        return None
+
+
+    def get_before(self, channel_id, before, num):
+        """
+        Get num messages older than before, newest first.
+        Return None if they are not all stored.
+        """
+        before = int(before)
+        with self.lock:
+            stored_range = self.get_range(channel_id, before)
+            if not stored_range:
+                return None
+            messages = self.select(channel_id, stored_range[0], before - 1, num)
+        if len(messages) < num and not stored_range[2]:
+            return None
+        return messages
+
+
+    def add_range(self, channel_id, start_id, end_id, first):
+        """Add range and merge it with all ranges it overlaps"""
+        rows = self.connection.execute(
+            "SELECT start_id, end_id, first FROM ranges WHERE channel_id = ? AND start_id <= ? AND end_id >= ?",
+            (channel_id, end_id, start_id),
+        ).fetchall()
+        for row in rows:
+            if row[0] < start_id:
+                start_id = row[0]
+                first = row[2]
+            elif row[0] == start_id:
+                first = first or row[2]
+            end_id = max(end_id, row[1])
+        self.connection.execute(
+            "DELETE FROM ranges WHERE channel_id = ? AND start_id <= ? AND end_id >= ?",
+            (channel_id, end_id, start_id),
+        )
+        self.connection.execute(
+            "INSERT INTO ranges VALUES (?, ?, ?, ?)",
+            (channel_id, start_id, end_id, int(bool(first))),
+        )
+
+
+    def save(self, channel_id, messages, num, before=None, after=None, around=None):
+        """
+        Save downloaded chunk of messages (newest first) requested with num, before, after and around, same as for get_messages.
+        If chunk is newest messages in the channel, new messages from gateway will extend it.
+        """
+        reached_end = len(messages) < num
+        latest = not (before or after or around)
+        if after and reached_end:
+            self.live.add(channel_id)
+        if not messages and not before:
+            return
+        ids = [int(message["id"]) for message in messages]
+        if before:
+            end_id = int(before)
+            start_id = ids[-1] if ids else end_id
+            first = reached_end
+        elif after:
+            start_id = int(after)
+            end_id = ids[0]
+            first = False
+        else:
+            start_id = ids[-1]
+            end_id = ids[0]
+            first = reached_end and latest
+        with self.lock:
+            # chunk is continuous, so stored messages inside it that are not in it were deleted
+            self.connection.execute(
+                "DELETE FROM messages WHERE channel_id = ? AND id >= ? AND id <= ?",
+                (channel_id, start_id + bool(after), end_id - bool(before)),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                [(channel_id, message_id, encode_message(message)) for message_id, message in zip(ids, messages)],
+            )
+            self.add_range(channel_id, start_id, end_id, first)
+            self.prune(channel_id)
+            self.connection.commit()
+        if latest:
+            self.live.add(channel_id)
+
+
+    def prune(self, channel_id):
+        """Remove oldest messages in channel over the limit, and shrink ranges"""
+        row = self.connection.execute(
+            "SELECT id FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+            (channel_id, self.limit),
+        ).fetchone()
+        if not row:
+            return
+        cutoff = row[0] + 1
+        self.connection.execute("DELETE FROM messages WHERE channel_id = ? AND id < ?", (channel_id, cutoff))
+        self.connection.execute("DELETE FROM ranges WHERE channel_id = ? AND end_id < ?", (channel_id, cutoff))
+        self.connection.execute("UPDATE ranges SET start_id = ?, first = 0 WHERE channel_id = ? AND start_id < ?", (cutoff, channel_id, cutoff))
+
+
+    def add_new(self, channel_id, message):
+        """Store new message from gateway, only if channel is live, so there is no gap before it"""
+        if channel_id not in self.live:
+            return
+        message_id = int(message["id"])
+        with self.lock:
+            newest = self.get_newest_range(channel_id)
+            if not newest:
+                self.live.discard(channel_id)
+                return
+            self.connection.execute(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                (channel_id, message_id, encode_message(message)),
+            )
+            self.connection.execute(
+                "UPDATE ranges SET end_id = ? WHERE channel_id = ? AND end_id = ?",
+                (max(message_id, newest[1]), channel_id, newest[1]),
+            )
+            self.connection.commit()
+
+
+    def get_message(self, channel_id, message_id):
+        """Get one stored message"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM messages WHERE channel_id = ? AND id = ?",
+                (channel_id, int(message_id)),
+            ).fetchone()
+        if row:
+            return decode_message(row[0])
+        return None
+
+
+    def update(self, channel_id, message):
+        """Replace stored message if it is stored"""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE messages SET data = ? WHERE channel_id = ? AND id = ?",
+                (encode_message(message), channel_id, int(message["id"])),
+            )
+            self.connection.commit()
+
+
+    def delete(self, channel_id, message_id):
+        """Delete stored message, ranges stay continuous"""
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM messages WHERE channel_id = ? AND id = ?",
+                (channel_id, int(message_id)),
+            )
+            self.connection.commit()
@@ -4,6 +4,7 @@ import importlib.util
 import json
 import logging
 import os
+import queue
 import re
 import shutil
 import subprocess
@@ -12,6 +13,7 @@ import threading
 import time
 import webbrowser
 from ast import literal_eval
+from collections import OrderedDict
 from configparser import ConfigParser
 
 import filetype
@@ -22,7 +24,11 @@ from endcord import defaults
 
 logger = logging.getLogger(__name__)
 APP_NAME = "endcord"
-ASPELL_TIMEOUT = 0.1   # aspell limit for looking-up one word
+ASPELL_TIMEOUT = 0.1   # aspell limit for looking-up one line of words
+ASPELL_WORD_TIMEOUT = 0.01   # added to aspell limit for each word in the line
+ASPELL_LINE_WORDS = 50   # max number of words sent to aspell in one line
+SPELLCHECK_CACHE_SIZE = 5000   # number of words whose spelling is remembered
+match_word_separator = re.compile(r"(?:[^\w']|[\d_])+")   # aspell splits words on these characters
 NO_NOTIFY_SOUND_DE = ("kde", "plasma")   # linux desktops without notification sound
 
 
@@ -915,19 +921,28 @@ def find_aspell():
 
 
 class SpellCheck():
-    """Sentence and word spellchecker"""
+    """
+    Sentence and word spellchecker.
+    Words are checked in batches, one line per aspell request, and verdicts are cached.
+    Words that are not cached can be checked in a thread, callback is called when they are done.
+    """
 
     def __init__(self, aspell_mode, aspell_language):
         self.aspell_mode = aspell_mode
         self.aspell_language = aspell_language
         self.enable = False
         self.lock = threading.Lock()
+        self.cache_lock = threading.Lock()
+        self.cache = OrderedDict()   # word: misspelled, least recently used first
+        self.queue = queue.Queue()
+        self.callback = None
         if aspell_mode:
             aspell_path = find_aspell()
             if aspell_path:
                 self.aspell_path = aspell_path
                 self.enable = True
                 self.start_aspell()
+                threading.Thread(target=self.worker, daemon=True).start()
             else:
                 logger.info("Spellchecking disabled: Aspell not found")
         else:
@@ -951,61 +966,128 @@ class SpellCheck():
             self.enable = False
 
 
-    def check_word_pexpect(self, word):
-        """Spellcheck single word with aspell"""
-        if word.isdigit():
-            return False   # dont spellcheck numbers
-        with self.lock:
-            try:
-                self.proc.sendline(word)
-                status = self.proc.expect([r"^[&\#\*].*\r?\n", r"\r?\n", pexpect.TIMEOUT], timeout=ASPELL_TIMEOUT)
-                if status == 0:
-                    line = self.proc.after.strip()
-                    return line[0] != "*"
-                return False
-            except pexpect.exceptions.TIMEOUT:
-                return False   # if timed-out return it as correct
-            except pexpect.exceptions.EOF:
-                if self.enable:
-                    self.start_aspell()
-                return False
-
-
-    # def check_word_subprocess(self, word):
-    #     """Spellcheck single word with aspell"""
-    #     try:
-    #         proc = subprocess.Popen(
-    #             [self.aspell_path, "-a", f"--sug-mode={self.aspell_mode}", f"--lang={self.aspell_language}"],
-    #             stdin=subprocess.PIPE,
-    #             stdout=subprocess.PIPE,
-    #             stderr=subprocess.DEVNULL,
-    #         )
-    #         output, error = proc.communicate(word.encode())
-    #         check = output.decode().split("\n")[1]
-    #         if check == "*":
-    #             return False
-    #         return True
-    #     except FileNotFoundError:   # aspell not installed
-    #         return False
+    def restart_aspell(self):
+        """Restart aspell, used when its output is no longer in sync with requests"""
+        try:
+            self.proc.kill(9)
+        except OSError:
+            pass
+        if self.enable:
+            self.start_aspell()
 
 
-    def check_list(self, words):
+    def check_line(self, words):
         """
-        Spellcheck a list of words with aspell.
-        Return list of bools representing whether each word is misspelled or not.
+        Spellcheck unique words with aspell in one line.
+        Return dict of word: misspelled, or None if aspell failed.
         """
+        # "^" prefix makes aspell check whole line, even if it starts with command character
+        line = "^" + " ".join(words).replace("\n", " ").replace("\r", " ")
+        timeout = ASPELL_TIMEOUT + ASPELL_WORD_TIMEOUT * len(words)
+        misspelled = set()
+        try:
+            self.proc.sendline(line)
+            # aspell outputs one line for each checked word, and empty line at the end
+            while True:
+                self.proc.expect(r"\r?\n", timeout=timeout)
+                result = self.proc.before.strip()
+                if not result:
+                    break
+                if result[0] in "&#":   # "& word count offset: suggestions" or "# word offset"
+                    misspelled.add(result.split(" ", 2)[1])
+        except pexpect.exceptions.TIMEOUT:
+            logger.debug(f"Aspell timed out checking {len(words)} words")
+            self.restart_aspell()
+            return None
+        except pexpect.exceptions.EOF:
+            self.restart_aspell()
+            return None
+        return {word: any(part in misspelled for part in match_word_separator.split(word)) for word in words}
+
+
+    def check_batch(self, words):
+        """
+        Spellcheck unique words with aspell, in lines of up to ASPELL_LINE_WORDS words, and cache verdicts after each line.
+        So if aspell fails, words from already checked lines are not checked again.
+        Return number of checked words.
+        """
+        checked = 0
+        with self.lock:
+            for start in range(0, len(words), ASPELL_LINE_WORDS):
+                verdicts = self.check_line(words[start:start + ASPELL_LINE_WORDS])
+                if not verdicts:
+                    break
+                self.store(verdicts)
+                checked += len(verdicts)
+        return checked
+
+
+    def get_missing(self, words):
+        """Get unique words that are not cached and should be checked"""
+        with self.cache_lock:
+            return list({word: None for word in words if word and not word.isdigit() and word not in self.cache})
+
+
+    def get_cached(self, words):
+        """Get list of cached verdicts for words, unknown words are treated as correct"""
         misspelled = []
-        if self.enable:
+        with self.cache_lock:
             for word in words:
-                if word == "":
+                verdict = self.cache.get(word)
+                if verdict is None:
                     misspelled.append(False)
                 else:
-                    misspelled.append(self.check_word_pexpect(word))
-        else:
-            return [False] * len(words)
+                    self.cache.move_to_end(word)
+                    misspelled.append(verdict)
         return misspelled
 
 
+    def store(self, verdicts):
+        """Add verdicts to cache, removing least recently used ones over the limit"""
+        with self.cache_lock:
+            self.cache.update(verdicts)
+            while len(self.cache) > SPELLCHECK_CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+
+    def worker(self):
+        """Spellcheck words sent by check_list_async, should be run in a thread"""
+        while self.enable:
+            words = self.queue.get()
+            while not self.queue.empty():   # only newest words are needed
+                words = self.queue.get()
+            missing = self.get_missing(words)
+            if not missing:
+                continue
+            if self.check_batch(missing) and self.callback:
+                self.callback()
+
+
+    def check_list(self, words):
+        """
+        Spellcheck a list of words with aspell.
+        Return list of bools representing whether each word is misspelled or not.
+        """
+        if not self.enable:
+            return [False] * len(words)
+        missing = self.get_missing(words)
+        if missing:
+            self.check_batch(missing)
+        return self.get_cached(words)
+
+
+    def check_list_async(self, words):
+        """
+        Same as check_list, but words that are not cached are returned as correct and checked in a thread.
+        callback is called when they are checked, so check_list_async can be called again.
+        """
+        if not self.enable:
+            return [False] * len(words)
+        if self.get_missing(words):
+            self.queue.put(words)
+        return self.get_cached(words)
+
+
 class Recorder():
     """Sound recorder"""
 
@@ -539,6 +539,22 @@ class Window:
         self.insstr(y, x, ch, color_id)
 
 
+    def scrollok(self, flag):
+        """curses.scrollok clone using pygame"""
+        pass
+
+
+    def scroll(self, lines=1):
+        """curses.scroll clone using pygame, positive lines scroll up"""
+        with self.dirty_lock:
+            blank = [[(" ", 0) for _ in range(self.ncols)] for _ in range(min(abs(lines), self.nlines))]
+            if lines > 0:
+                self.buffer = self.buffer[lines:] + blank
+            elif lines < 0:
+                self.buffer = blank + self.buffer[:lines]
+            self.dirty_lines.update(range(self.nlines))
+
+
     def addstr(self, y, x, text, color_id=0):
         """curses.addstr clone using pygame, takes color id"""
         self.insstr(y, x, text, color_id)
@@ -4,23 +4,25 @@ import re
 
 import emoji
 
+SEARCH_CHUNK = 2000   # number of candidates scored between checks for cancellation and streaming
+STATIC_INDEXES = ("emoji_standard", "emoji_standard_safe")   # indexes that dont depend on client data
 COMMAND_OPT_TYPE = ("subcommand", "group", "string", "integer", "True/False", "user ID", "channel ID", "role ID", "mentionable ID", "number", "attachment")
 
 
-def fuzzy_match_score_single(query, candidate):
+def fuzzy_match_score_lower(query, candidate):
     """
     Calculates score for fuzzy matching of single query word.
+    Both query and candidate must be lowercase.
     Consecutive matches will have larger score.
     Matches closer to the start of the candidate string will have larger score.
     Score is not limited.
     """
-    query_lower, candidate_lower = query.lower(), candidate.lower()
     qlen, clen = len(query), len(candidate)
     qpos, cpos = 0, 0
     score = 0
     last_match_pos = -1
     while qpos < qlen and cpos < clen:
-        if query_lower[qpos] == candidate_lower[cpos]:
+        if query[qpos] == candidate[cpos]:
             if last_match_pos == cpos - 1:
                 score += 10   # consecutive match adds more score
             else:
@@ -35,6 +37,16 @@ def fuzzy_match_score_single(query, candidate):
     return 0
 
 
+def fuzzy_match_score_single(query, candidate):
+    """
+    Calculates score for fuzzy matching of single query word.
+    Consecutive matches will have larger score.
+    Matches closer to the start of the candidate string will have larger score.
+    Score is not limited.
+    """
+    return fuzzy_match_score_lower(query.lower(), candidate.lower())
+
+
 def fuzzy_match_score(query, candidate):
     """
     Calculate score for fuzzy matching of query containing one or multiple words.
@@ -51,9 +63,131 @@ def fuzzy_match_score(query, candidate):
     return total_score
 
 
+def fuzzy_match_score_words(words, candidate):
+    """Same as fuzzy_match_score, but query is already split into words, and words and candidate are lowercase"""
+    total_score = 0
+    for word in words:
+        score = fuzzy_match_score_lower(word, candidate)
+        if score == 0:
+            return 0
+        total_score += score
+    return total_score
+
+
 # use cython if available, ~6.7 times faster
 if importlib.util.find_spec("endcord_cython") and importlib.util.find_spec("endcord_cython.search"):
-    from endcord_cython.search import fuzzy_match_score
+    from endcord_cython.search import fuzzy_match_score, fuzzy_match_score_words
+
+
+class SearchIndex:
+    """
+    Prebuilt candidates for fuzzy search, with lowercase keys and index of characters they contain.
+    Only candidates containing all query characters are scored.
+    When query is extended, only candidates matched by previous query are scored,
+    because fuzzy match of longer query is always also match of its prefix.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries   # [(key, formatted, value, score_multiplier), ...]
+        self.keys = [entry[0].lower() for entry in entries]
+        self.chars = {}   # character: set of indexes of keys containing it, built when character is first searched
+        self.last_query = None
+        self.last_matched = None
+
+
+    def __len__(self):
+        """Number of candidates"""
+        return len(self.entries)
+
+
+    def get_char(self, char):
+        """Get set of indexes of keys containing this character"""
+        char_set = self.chars.get(char)
+        if char_set is None:
+            char_set = {num for num, key in enumerate(self.keys) if char in key}
+            self.chars[char] = char_set
+        return char_set
+
+
+    def candidates(self, query):
+        """Get indexes of candidates that can match lowercase query, in original order"""
+        chars = set(query)
+        chars.discard(" ")
+        if not chars:
+            return range(len(self.entries))
+        if self.last_query and query.startswith(self.last_query):
+            # narrow previous matches, checking only new characters
+            sets = [self.get_char(char) for char in chars.difference(self.last_query)]
+            return [num for num in self.last_matched if all(num in char_set for char_set in sets)]
+        sets = sorted((self.get_char(char) for char in chars), key=len)
+        return sorted(sets[0].intersection(*sets[1:]))
+
+
+    def search(self, query, results, worst_score, limit, show_all=False, cancel=None, stream=None):
+        """
+        Push matched candidates as (formatted, value, score) into results heap, same as search functions.
+        Return new worst score.
+        If show_all, all candidates are added for empty query.
+        cancel is threading.Event that stops search when set, checked every SEARCH_CHUNK candidates.
+        stream is called once with results heap when its full and its worst score has not changed for whole chunk.
+        """
+        query = query.lower()
+        words = query.split()
+        if not words:
+            if show_all:
+                for _, formatted, value, _ in self.entries:
+                    heapq.heappush(results, (formatted, value, 0))
+                    if len(results) > limit:
+                        heapq.heappop(results)
+                        worst_score = results[0][2]
+            return worst_score
+        keys = self.keys
+        entries = self.entries
+        matched = []
+        candidates = self.candidates(query)
+        for start in range(0, len(candidates), SEARCH_CHUNK):
+            if cancel is not None and cancel.is_set():
+                return worst_score   # matches are incomplete so they are not kept
+            chunk_worst_score = worst_score
+            for num in candidates[start:start + SEARCH_CHUNK]:
+                score = fuzzy_match_score_words(words, keys[num])
+                if not score:
+                    continue
+                matched.append(num)
+                _, formatted, value, multiplier = entries[num]
+                score *= multiplier
+                if score < worst_score:
+                    continue
+                heapq.heappush(results, (formatted, value, score))
+                if len(results) > limit:
+                    heapq.heappop(results)
+                    worst_score = results[0][2]
+            if stream and start and worst_score == chunk_worst_score and len(results) >= limit:
+                stream(results)
+                stream = None
+        self.last_query = query
+        self.last_matched = matched
+        return worst_score
+
+
+indexes = {}   # name: (signature, index), index is reused while signature of its candidates is same
+
+
+def get_index(name, signature, make_entries, *args):
+    """Get cached search index, or build new one with make_entries(*args) if signature of its candidates has changed"""
+    cached = indexes.get(name)
+    if cached and cached[0] == signature:
+        return cached[1]
+    index = SearchIndex(make_entries(*args))
+    indexes[name] = (signature, index)
+    return index
+
+
+def clear_indexes():
+    """Remove indexes built from client data, so changed names and permissions are picked up in next search"""
+    for name in list(indexes):
+        if name not in STATIC_INDEXES:
+            del indexes[name]
 
 
 def search_options(options, query, prompt, limit=50, score_cutoff=15):
@@ -73,11 +207,9 @@ def search_options(options, query, prompt, limit=50, score_cutoff=15):
     return sorted(results, key=lambda x: x[2], reverse=True)
 
 
-def search_channels_guild(channels, query, limit=50, score_cutoff=15):
-    """Search for channels in one guild"""
-    results = []
-    worst_score = score_cutoff
-
+def channels_guild_entries(channels):
+    """Make search index entries for channels in one guild"""
+    entries = []
     for channel in channels:
         # skip categories (type 4)
         if channel["permitted"] and channel["type"] != 4:
@@ -89,46 +221,29 @@ def search_channels_guild(channels, query, limit=50, score_cutoff=15):
                 formatted = f"{channel["name"]} - forum"
             else:
                 formatted = channel["name"]
+            entries.append((formatted, formatted, channel["id"], 1))
+    return entries
 
-            score = fuzzy_match_score(query, formatted)
-            if score < worst_score:
-                continue
-            heapq.heappush(results, (formatted, channel["id"], score))
-            if len(results) > limit:
-                heapq.heappop(results)
-                worst_score = results[0][2]
 
+def search_channels_guild(channels, query, limit=50, score_cutoff=15, cancel=None, stream=None):
+    """Search for channels in one guild, see SearchIndex.search for cancel and stream"""
+    results = []
+    index = get_index("channels_guild", (id(channels), len(channels)), channels_guild_entries, channels)
+    index.search(query, results, score_cutoff, limit, cancel=cancel, stream=stream)
     return sorted(results, key=lambda x: x[2], reverse=True)
 
 
-def search_channels_all(guilds, dms, query, full_input, limit=50, score_cutoff=15):
-    """Search for guilds/categories/channels/DMs"""
-    results = []
-    worst_score = score_cutoff
-
+def channels_all_entries(guilds, dms, full):
+    """Make search index entries for guilds/categories/channels/DMs"""
+    entries = []
     for dm in dms:
         formatted = f"{dm["name"]} (DM)"
-        score = fuzzy_match_score(query, formatted) * 4   # dms get more score so they are on top
-        if score < worst_score:
-            continue
-        heapq.heappush(results, (formatted, dm["id"], score))
-        if len(results) > limit:
-            heapq.heappop(results)
-            worst_score = results[0][2]
+        entries.append((formatted, formatted, dm["id"], 4))   # dms get more score so they are on top
 
-    if full_input.startswith("toggle_mute") or full_input.startswith("mark_as_read") or full_input.startswith("goto"):
-        full = True   # include guilds and categories
-    else:
-        full = False
     for guild in guilds:
         if full:
             formatted = f"{guild["name"]} - server"
-            score = fuzzy_match_score(query, formatted) * 2   # guilds get more score so they are on top
-            if score >= worst_score:
-                heapq.heappush(results, (formatted, guild["guild_id"], score))
-                if len(results) > limit:
-                    heapq.heappop(results)
-                    worst_score = results[0][2]
+            entries.append((formatted, formatted, guild["guild_id"], 2))   # guilds get more score so they are on top
 
         for channel in guild["channels"]:
             if channel["permitted"]:
@@ -142,32 +257,39 @@ def search_channels_all(guilds, dms, query, full_input, limit=50, score_cutoff=1
                     formatted = f"{channel["name"]} - forum ({guild["name"]})"
                 else:
                     formatted = f"{channel["name"]} ({guild["name"]})"
-                score = fuzzy_match_score(query, formatted)
-                if score < worst_score:
-                    continue
-                heapq.heappush(results, (formatted, channel["id"], score))
-                if len(results) > limit:
-                    heapq.heappop(results)
-                    worst_score = results[0][2]
+                entries.append((formatted, formatted, channel["id"], 1))
+    return entries
+
 
+def search_channels_all(guilds, dms, query, full_input, limit=50, score_cutoff=15, cancel=None, stream=None):
+    """Search for guilds/categories/channels/DMs, see SearchIndex.search for cancel and stream"""
+    results = []
+    if full_input.startswith("toggle_mute") or full_input.startswith("mark_as_read") or full_input.startswith("goto"):
+        full = True   # include guilds and categories
+    else:
+        full = False
+    signature = (full, id(dms), len(dms), id(guilds), tuple((id(guild["channels"]), len(guild["channels"])) for guild in guilds))
+    index = get_index("channels_all", signature, channels_all_entries, guilds, dms, full)
+    index.search(query, results, score_cutoff, limit, cancel=cancel, stream=stream)
     return sorted(results, key=lambda x: x[2], reverse=True)
 
 
+def roles_entries(roles):
+    """Make search index entries for roles"""
+    entries = []
+    for role in roles:
+        formatted = f"{role["name"]} - role"
+        entries.append((formatted, formatted, f"&{role["id"]}", 1))
+    return entries
+
+
 def search_usernames_roles(roles, query_results, guild_id, gateway, query, presences=[], limit=50, score_cutoff=15):
     """Search for usernames and roles"""
     results = []
-    worst_score = score_cutoff
 
     # roles first
-    for role in roles:
-        formatted = f"{role["name"]} - role"
-        score = fuzzy_match_score(query, formatted)
-        if score < worst_score:
-            continue
-        heapq.heappush(results, (formatted, f"&{role["id"]}", score))
-        if len(results) > limit:
-            heapq.heappop(results)
-            worst_score = results[0][2]
+    index = get_index("roles", (id(roles), len(roles)), roles_entries, roles)
+    worst_score = index.search(query, results, score_cutoff, limit)
 
     if query_results:
         for member in query_results:
@@ -200,10 +322,36 @@ def search_usernames_roles(roles, query_results, guild_id, gateway, query, prese
     return sorted(results, key=lambda x: x[2], reverse=True)
 
 
-def search_emojis(all_emojis, premium, guild_id, query, safe_emoji=False, limit=50, score_cutoff=15):
-    """Search for emoji"""
+def guild_emojis_entries(emojis):
+    """Make search index entries for guild emojis"""
+    entries = []
+    for guild in emojis:
+        guild_name = guild["guild_name"]
+        for guild_emoji in guild["emojis"]:
+            formatted = f"{guild_emoji["name"]} ({guild_name})"
+            entries.append((formatted, formatted, f"<:{guild_emoji["name"]}:{guild_emoji["id"]}>", 1))
+    return entries
+
+
+def standard_emojis_entries(safe_emoji):
+    """Make search index entries for standard emojis"""
+    entries = []
+    for key, item in emoji.EMOJI_DATA.items():
+        if item["status"] > 2:   # skip unqualified and minimally qualified emoji
+            continue
+        # emoji.EMOJI_DATA = {emoji: {"en": ":emoji_name:", "status": 2, "E": 3}...}
+        # using only qualified emojis (status: 2)
+        if safe_emoji:
+            formatted = item["en"]
+        else:
+            formatted = f"{item["en"]} - {key}"
+        entries.append((formatted, formatted, item["en"], 1))
+    return entries
+
+
+def search_emojis(all_emojis, premium, guild_id, query, safe_emoji=False, limit=50, score_cutoff=15, cancel=None, stream=None):
+    """Search for emoji, see SearchIndex.search for cancel and stream"""
     results = []
-    worst_score = score_cutoff
 
     # guild emoji
     if premium:
@@ -215,37 +363,17 @@ def search_emojis(all_emojis, premium, guild_id, query, safe_emoji=False, limit=
                 break
         else:
             emojis = []
-
-    for guild in emojis:
-        guild_name = guild["guild_name"]
-        for guild_emoji in guild["emojis"]:
-            formatted = f"{guild_emoji["name"]} ({guild_name})"
-            score = fuzzy_match_score(query, formatted)
-            if score < worst_score:
-                continue
-            heapq.heappush(results, (formatted, f"<:{guild_emoji["name"]}:{guild_emoji["id"]}>", score))
-            if len(results) > limit:
-                heapq.heappop(results)
-                worst_score = results[0][2]
+    signature = tuple((guild["guild_id"], id(guild["emojis"]), len(guild["emojis"])) for guild in emojis)
+    index = get_index("emoji_guild", signature, guild_emojis_entries, emojis)
+    worst_score = index.search(query, results, score_cutoff, limit, cancel=cancel, stream=stream)
 
     # standard emoji
     if len(results) < limit:
-        for key, item in emoji.EMOJI_DATA.items():
-            if item["status"] > 2:   # skip unqualified and minimally qualified emoji
-                continue
-            # emoji.EMOJI_DATA = {emoji: {"en": ":emoji_name:", "status": 2, "E": 3}...}
-            # using only qualified emojis (status: 2)
-            if safe_emoji:
-                formatted = item["en"]
-            else:
-                formatted = f"{item["en"]} - {key}"
-            score = fuzzy_match_score(query, formatted)
-            if score < worst_score:
-                continue
-            heapq.heappush(results, (formatted, item["en"], score))
-            if len(results) > limit:
-                heapq.heappop(results)
-                worst_score = results[0][2]
+        if safe_emoji:
+            index = get_index("emoji_standard_safe", None, standard_emojis_entries, True)
+        else:
+            index = get_index("emoji_standard", None, standard_emojis_entries, False)
+        index.search(query, results, worst_score, limit, cancel=cancel)
 
     return sorted(results, key=lambda x: x[2], reverse=True)
 
@@ -453,6 +581,43 @@ def search_tabs(tabs, query, limit=50, score_cutoff=15):
     return sorted(results, key=lambda x: x[2], reverse=True)
 
 
+def apps_entries(guild_apps, my_apps):
+    """Make search index entries for guild and user apps"""
+    entries = []
+    for app in guild_apps:
+        clean_name = app["name"].lower().replace(" ", "_")
+        entries.append((app["name"], f"{clean_name} - guild app", f"/{clean_name}", 1))
+    for app in my_apps:
+        clean_name = app["name"].lower().replace(" ", "_")
+        entries.append((app["name"], f"{clean_name} - user app", f"/{clean_name}", 1))
+    return entries
+
+
+def commands_entries(commands, commands_permitted, assist_app_name, dm, assist_skip_app_command):
+    """
+    Make search index entries for commands of one app, or all commands if assist_skip_app_command.
+    commands_permitted is used for guild commands, and dm for user commands.
+    """
+    entries = []
+    for num, command in enumerate(commands):
+        if commands_permitted is None:
+            permitted = (not dm) or command.get("dm")
+        else:
+            permitted = commands_permitted[num]
+        if (command["app_name"].lower().replace(" ", "_") == assist_app_name or assist_skip_app_command) and permitted:
+            command_name = command["name"].lower()
+            if assist_skip_app_command:
+                name = f"{command_name.replace(" ", "_")} ({command["app_name"]})"
+                value = f"{command["app_name"].lower().replace(" ", "_")} {command_name.replace(" ", "_")}"
+            else:
+                name = command_name.replace(" ", "_")
+                value = command_name.replace(" ", "_")
+            if command.get("description"):
+                name += f" - {command["description"]}"
+            entries.append((command_name, name, value, 1))
+    return entries
+
+
 def search_app_commands(guild_apps, guild_commands, my_apps, my_commands, depth, guild_commands_permitted, dm, assist_skip_app_command, match_command_arguments, query, limit=50, score_cutoff=15):
     """Search for app commands"""
     results = []
@@ -464,25 +629,10 @@ def search_app_commands(guild_apps, guild_commands, my_apps, my_commands, depth,
 
     if depth == 1:   # app
         assist_app = query_words[0].replace("_", " ")
-        # list apps
-        for app in guild_apps:
-            score = fuzzy_match_score(assist_app, app["name"])
-            if score < worst_score and assist_app:   # show all if no text is typed
-                continue
-            clean_name = app["name"].lower().replace(" ", "_")
-            heapq.heappush(results, (f"{clean_name} - guild app", f"/{clean_name}", score))
-            if len(results) > limit:
-                heapq.heappop(results)
-                worst_score = results[0][2]
-        for app in my_apps:
-            score = fuzzy_match_score(assist_app, app["name"])
-            if score < worst_score and assist_app:
-                continue
-            clean_name = app["name"].lower().replace(" ", "_")
-            heapq.heappush(results, (f"{clean_name} - user app", f"/{clean_name}", score))
-            if len(results) > limit:
-                heapq.heappop(results)
-                worst_score = results[0][2]
+        # list apps, show all if no text is typed
+        signature = (id(guild_apps), len(guild_apps), id(my_apps), len(my_apps))
+        index = get_index("apps", signature, apps_entries, guild_apps, my_apps)
+        index.search(assist_app, results, worst_score, limit, show_all=True)
 
     elif depth == 2:   # command
         if assist_skip_app_command:
@@ -492,45 +642,13 @@ def search_app_commands(guild_apps, guild_commands, my_apps, my_commands, depth,
             assist_app_name = query_words[0].lower()
             assist_command = query_words[1].replace("_", " ")
         # list commands
-        found = False
-        for num, command in enumerate(guild_commands):
-            if (command["app_name"].lower().replace(" ", "_") == assist_app_name or assist_skip_app_command) and guild_commands_permitted[num]:
-                command_name = command["name"].lower()
-                score = fuzzy_match_score(assist_command, command_name)
-                if score < worst_score and assist_command:
-                    continue
-                if assist_skip_app_command:
-                    name = f"{command_name.replace(" ", "_")} ({command["app_name"]})"
-                    value = f"{command["app_name"].lower().replace(" ", "_")} {command_name.replace(" ", "_")}"
-                else:
-                    name = command_name.replace(" ", "_")
-                    value = command_name.replace(" ", "_")
-                if command.get("description"):
-                    name += f" - {command["description"]}"
-                heapq.heappush(results, (name, value, score))
-                if len(results) > limit:
-                    heapq.heappop(results)
-                    worst_score = results[0][2]
-                found = True
-        if not found:    # skip my commands if found in guild commands
-            for command in my_commands:
-                if (command["app_name"].lower().replace(" ", "_") == assist_app_name or assist_skip_app_command) and ((not dm) or command.get("dm")):
-                    command_name = command["name"].lower()
-                    score = fuzzy_match_score(assist_command, command_name)
-                    if score < worst_score and assist_command:
-                        continue
-                    if assist_skip_app_command:
-                        name = f"{command_name.replace(" ", "_")} ({command["app_name"]})"
-                        value = f"{command["app_name"].lower().replace(" ", "_")} {command_name.replace(" ", "_")}"
-                    else:
-                        name = command_name.replace(" ", "_")
-                        value = command_name.replace(" ", "_")
-                    if command.get("description"):
-                        name += f" - {command["description"]}"
-                    heapq.heappush(results, (name, value, score))
-                    if len(results) > limit:
-                        heapq.heappop(results)
-                        worst_score = results[0][2]
+        signature = (assist_app_name, assist_skip_app_command, id(guild_commands), len(guild_commands), tuple(guild_commands_permitted))
+        index = get_index("guild_commands", signature, commands_entries, guild_commands, guild_commands_permitted, assist_app_name, dm, assist_skip_app_command)
+        index.search(assist_command, results, worst_score, limit, show_all=True)
+        if not results:    # skip my commands if found in guild commands
+            signature = (assist_app_name, assist_skip_app_command, id(my_commands), len(my_commands), dm)
+            index = get_index("my_commands", signature, commands_entries, my_commands, None, assist_app_name, dm, assist_skip_app_command)
+            index.search(assist_command, results, worst_score, limit, show_all=True)
 
     elif depth == 3:   # group/subcommand/option
         results.append(("EXECUTE", None, 10000))
@@ -142,6 +142,45 @@ def get_key(screen):
         return first
 
 
+def line_spans(line_len, line_format, attrib_map, color_default):
+    """
+    Convert line format to list of [start, end, attribute] spans covering whole line.
+    Line format should be normalized by formatter, otherwise it is normalized here.
+    """
+    default_color_id = line_format[0][0]
+    default_color = curses.color_pair(default_color_id) | attrib_map[default_color_id]
+    spans = []
+    pos = 0
+    for format_part in line_format[1:]:
+        start = format_part[1]
+        end = min(format_part[2], line_len)
+        if start < pos or start < 0:
+            return line_spans(
+                line_len,
+                formatter.normalize_format(line_format),
+                attrib_map,
+                color_default,
+            )
+        if start >= end:
+            continue
+        if start > pos:
+            spans.append([pos, start, default_color])
+        color = format_part[0]
+        # assuming never to have id > 65536, if value is that large its definitely attribute
+        if color >= 0x00010000:
+            # using base color because it is in message content anyway
+            color_ready = curses.color_pair(default_color_id) | color
+        else:
+            if color > 255:  # set all colors after 255 to default color
+                color = color_default
+            color_ready = curses.color_pair(color) | attrib_map[color]
+        spans.append([start, end, color_ready])
+        pos = end
+    if pos < line_len:
+        spans.append([pos, line_len, default_color])
+    return spans
+
+
 def draw_chat(
     win_chat,
     h,
@@ -152,62 +191,57 @@ def draw_chat(
     chat_selected,
     attrib_map,
     color_default,
+    drawn=None,
 ):
-    """Draw chat with applied color formatting"""
+    """
+    Draw chat with applied color formatting.
+    drawn is list of what is on each screen row, rows that did not change are skipped, and it is updated.
+    """
     y = h
+    track = drawn is not None and len(drawn) == h
     # drawing from down to up
-    chat_format = chat_format[chat_index:]
     for num in range(len(chat_buffer) - chat_index):
         line_idx = chat_index + num
-        if line_idx >= len(chat_buffer):
-            break
         y = h - (num + 1)
-        if y < 0 or y >= h:
+        if y < 0:
             break
 
         line = chat_buffer[line_idx]
         if num == chat_selected - chat_index:
+            row = (line, None)
+            if track and drawn[y] == row:
+                continue
             fill_len = w - len(line)
             win_chat.insstr(y, 0, line + (" " * fill_len) + "\n", curses.color_pair(16))
         else:
-            line_format = chat_format[num]
-            default_color_id = line_format[0][0]
+            line_format = chat_format[line_idx]
+            row = (line, line_format)
+            if track and drawn[y] == row:
+                continue
             # filled with spaces so background is drawn all the way
-            default_color = (
-                curses.color_pair(default_color_id) | attrib_map[default_color_id]
-            )
-            win_chat.insstr(y, 0, " " * w + "\n", curses.color_pair(default_color_id))
-
-            for pos in range(min(len(line), w)):
-                character = line[pos]
-                char_width = formatter.len_wch(character)
-                # handle wide characters for alignment
-                for format_part in line_format[1:]:
-                    color = format_part[0]
-                    start = format_part[1]
-                    end = format_part[2]
-                    if start <= pos < end:
-                        # assuming never to have id > 65536, if value is that large its definitely attribute
-                        if color >= 0x00010000:
-                            # using base color because it is in message content anyway
-                            color_ready = curses.color_pair(default_color_id) | color
-                        else:
-                            if color > 255:  # set all colors after 255 to default color
-                                color = color_default
-                            color_ready = curses.color_pair(color) | attrib_map[color]
-                        safe_insch(win_chat, y, pos, character, color_ready)
-                        if char_width > 1:
-                            win_chat.addstr(y, pos + 1, " ")
-                        break
-                else:
-                    safe_insch(win_chat, y, pos, character, default_color)
-                    if char_width > 1:
-                        win_chat.addstr(y, pos + 1, " ")
+            win_chat.insstr(y, 0, " " * w + "\n", curses.color_pair(line_format[0][0]))
+            # wide characters take 2 cells, so following spans are moved
+            shift = 0
+            wide = not uses_pgcurses and not line.isascii()
+            for start, end, color in line_spans(
+                min(len(line), w), line_format, attrib_map, color_default
+            ):
+                if start + shift >= w:
+                    break
+                text = line[start:end]
+                win_chat.insstr(y, start + shift, text, color)
+                if wide:
+                    shift += formatter.len_wch(text) - len(text)
+        if track:
+            drawn[y] = row
 
     # fill empty lines with spaces so background is drawn all the way
     y -= 1
     while y >= 0:
-        win_chat.insstr(y, 0, "\n", curses.color_pair(0))
+        if not track or drawn[y] != "":
+            win_chat.insstr(y, 0, "\n", curses.color_pair(0))
+            if track:
+                drawn[y] = ""
         y -= 1
 
 
@@ -225,6 +259,7 @@ class TUI:
         self.spellchecker = peripherals.SpellCheck(
             config["aspell_mode"], config["aspell_lang"]
         )
+        self.spellchecker.callback = self.spellcheck_done
         acs_map = acs.get_map()
         curses.use_default_colors()
         curses.curs_set(0)  # using custom cursor
@@ -270,6 +305,7 @@ class TUI:
         self.command_bindings = command_bindings
         self.screen = screen
         self.extensions = []
+        self.wakeup = None
 
         # load config
         self.bordered = not (config["compact"])
@@ -342,6 +378,10 @@ class TUI:
         self.dont_hide_chat_selection = False
         self.tree_selected_abs = -1
         self.chat_index = 0  # chat scroll index
+        self.chat_drawn = []  # what is drawn on each chat row
+        self.chat_drawn_win = None
+        self.chat_drawn_index = 0
+        self.chat_drawn_scrollbar = False
         self.tree_index = 0
         self.chat_scrolled_top = False
         self.tree_format_changed = False
@@ -430,6 +470,10 @@ class TUI:
                     logger.warn(f"Invalid keybinding: {binding}")
                 self.chainable.append(split_binding[0])
 
+    def set_wakeup(self, wakeup):
+        """Set function that is called with "state" argument on each received key, to wake up main loop"""
+        self.wakeup = wakeup
+
     def load_extensions(self, extensions):
         """Load already initialized extensions from app class"""
         self.extensions = extensions
@@ -488,6 +532,7 @@ class TUI:
         """Resize screen area and redraw ui"""
         if self.disable_drawing:
             return
+        self.chat_drawn = []
 
         # re-init areas
         if not redraw_only:
@@ -1549,6 +1594,19 @@ class TUI:
         """Draw chat with applied color formatting"""
         with self.lock:
             try:
+                h = self.chat_hw[0]
+                scrollbar = len(self.chat_buffer) > h
+                if (
+                    self.chat_drawn_win is not self.win_chat
+                    or len(self.chat_drawn) != h
+                    or scrollbar != self.chat_drawn_scrollbar
+                ):
+                    self.chat_drawn = [None] * h
+                    self.chat_drawn_win = self.win_chat
+                    self.chat_drawn_scrollbar = scrollbar
+                elif self.chat_index != self.chat_drawn_index:
+                    self.scroll_chat_drawn(self.chat_index - self.chat_drawn_index)
+                self.chat_drawn_index = self.chat_index
                 draw_chat(
                     self.win_chat,
                     self.chat_hw[0],
@@ -1559,6 +1617,7 @@ class TUI:
                     self.chat_selected,
                     self.attrib_map,
                     self.default_color,
+                    self.chat_drawn,
                 )
 
                 # Scrollbar
@@ -1598,6 +1657,20 @@ class TUI:
                 # exception will happen when window is resized to smaller w dimensions
                 self.resize()
 
+    def scroll_chat_drawn(self, lines):
+        """Scroll chat window content by number of lines, positive is up in history, so only new rows are drawn"""
+        h = self.chat_hw[0]
+        if abs(lines) >= h:
+            self.chat_drawn = [None] * h
+            return
+        self.win_chat.scrollok(True)
+        self.win_chat.scroll(-lines)
+        self.win_chat.scrollok(False)
+        if lines > 0:
+            self.chat_drawn = [None] * lines + self.chat_drawn[:-lines]
+        else:
+            self.chat_drawn = self.chat_drawn[-lines:] + [None] * -lines
+
     def set_wide_map(self, wide_map):
         """Update wide characters map"""
         self.wide_map = wide_map
@@ -1614,6 +1687,8 @@ class TUI:
             if chat_y > h:
                 break
             self.win_chat.insstr(h - chat_y, 0, " " * w, curses.color_pair(1))
+            if len(self.chat_drawn) == h:
+                self.chat_drawn[h - chat_y] = None
         self.win_chat.noutrefresh()
         self.need_update.set()
         time.sleep(self.screen_update_delay / 2)
@@ -2433,7 +2508,9 @@ class TUI:
             words_on_screen = resplit(
                 self.input_buffer[range_word_start:range_word_end]
             )
-            misspelled_words_on_screen = self.spellchecker.check_list(words_on_screen)
+            misspelled_words_on_screen = self.spellchecker.check_list_async(
+                words_on_screen
+            )
             misspelled_words_on_screen.append(False)
             # loop over all words visible on screen
             self.misspelled = []
@@ -2448,6 +2525,15 @@ class TUI:
             # self.misspelled format: [start_index_on_screen, word_len] for all misspelled words on screen
         self.spelling_range = spelling_range
 
+    def spellcheck_done(self):
+        """Spellcheck visible words again and redraw input line, called from spellchecker thread when words are checked"""
+        if self.disable_drawing:
+            return
+        with self.lock:
+            self.spelling_range = [0, 0]
+            self.spellcheck()
+            self.draw_input_line()
+
     def add_to_delta_store(self, key, character=None):
         """Add input line delta to delta_store"""
         if key not in ("BACKSPACE", "DELETE", " ", "UNDO", "REDO"):
@@ -2771,6 +2857,8 @@ class TUI:
                 key = get_key(self.screen)
             if key == -1:
                 continue
+            if self.wakeup:
+                self.wakeup("state")
 
             if self.mouse and key == curses.KEY_MOUSE:
                 code = self.mouse_events(key)
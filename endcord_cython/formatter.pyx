@@ -1,29 +1,8 @@
 # cython: boundscheck=False, wraparound=False
 
-cdef inline int binary_search(int codepoint, tuple ranges):
-    cdef Py_ssize_t low = 0
-    cdef Py_ssize_t high = len(ranges) - 1
-    cdef Py_ssize_t mid
-    cdef int start, end
-
-    if codepoint < ranges[0][0] or codepoint > ranges[high][1]:
-        return 0
-
-    while low <= high:
-        mid = (low + high) >> 1
-        start, end = ranges[mid]
-
-        if codepoint > end:
-            low = mid + 1
-        elif codepoint < start:
-            high = mid - 1
-        else:
-            return 1
-
-    return 0
-
-
-cpdef limit_width_wch(str text, int max_width, tuple ranges):
+cpdef limit_width_wch(str text, int max_width, bytes wide_index, bytes wide_pages):
+    cdef const unsigned char* index = wide_index
+    cdef const unsigned char* pages = wide_pages
     cdef int total_width = 0
     cdef int character, char_width
     cdef Py_ssize_t i, n = len(text)
@@ -33,7 +12,7 @@ cpdef limit_width_wch(str text, int max_width, tuple ranges):
         if 32 <= character < 0x7f:
             char_width = 1
         else:
-            char_width = 1 + binary_search(character, ranges)
+            char_width = 1 + pages[index[character >> 8] << 8 | (character & 0xFF)]
         if total_width + char_width > max_width:
             return text[:i], total_width
         total_width += char_width
@@ -41,7 +20,9 @@ cpdef limit_width_wch(str text, int max_width, tuple ranges):
     return text, total_width
 
 
-cpdef len_wch(str text, tuple ranges):
+cpdef len_wch(str text, bytes wide_index, bytes wide_pages):
+    cdef const unsigned char* index = wide_index
+    cdef const unsigned char* pages = wide_pages
     cdef int total_width = 0
     cdef int character
     cdef Py_ssize_t i, n = len(text)
@@ -51,6 +32,6 @@ cpdef len_wch(str text, tuple ranges):
         if 32 <= character < 0x7f:
             total_width += 1
         else:
-            total_width += 1 + binary_search(character, ranges)
+            total_width += 1 + pages[index[character >> 8] << 8 | (character & 0xFF)]
 
     return total_width
@@ -51,3 +51,43 @@ cpdef int fuzzy_match_score(str query, str candidate):
             return 0
         total_score += score
     return total_score
+
+
+cdef inline int fuzzy_match_score_lower(str query, str candidate):
+    """Same as fuzzy_match_score_single, but query and candidate are already lowercase"""
+    cdef int qlen = len(query)
+    cdef int clen = len(candidate)
+    cdef int qpos = 0, cpos = 0
+    cdef int score = 0
+    cdef int last_match_pos = -1
+
+    while qpos < qlen and cpos < clen:
+        if query[qpos] == candidate[cpos]:
+            if cpos == last_match_pos + 1:
+                score += 10   # consecutive match adds more score
+            else:
+                score += 1   # match after some gap
+            last_match_pos = cpos
+            qpos += 1
+        cpos += 1
+
+    if qpos == qlen:
+        # bonus for match starting early in candidate
+        score += max(0, 10 - last_match_pos)
+        return score
+    return 0
+
+
+cpdef int fuzzy_match_score_words(list words, str candidate):
+    """Same as fuzzy_match_score, but query is already split into words, and words and candidate are lowercase"""
+    cdef str word
+    cdef int score
+
+    cdef int total_score = 0
+
+    for word in words:
+        score = fuzzy_match_score_lower(word, candidate)
+        if score == 0:
+            return 0
+        total_score += score
+    return total_score
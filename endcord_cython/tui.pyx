@@ -4,16 +4,47 @@ import curses
 import threading
 cimport cython
 
+from endcord.formatter import len_wch, normalize_format
 
-cdef void safe_insch(object win_chat, int y, int x, unicode ch, unsigned int attr):
+cdef bint uses_pgcurses = hasattr(curses, "PGCURSES")
+
+
+cpdef list line_spans(int line_len, list line_format, list attrib_map, int color_default):
     """
-    Writes a character safely to the curses window.
-    Uses insstr for emoji/multibyte characters, insch for ASCII-safe ones.
+    Convert line format to list of [start, end, attribute] spans covering whole line.
+    Line format should be normalized by formatter, otherwise it is normalized here.
     """
-    if ord(ch) > 127:   # for some reason insch wont draw 2-byte chars is cython
-        win_chat.insstr(y, x, ch, attr)
-    else:
-        win_chat.insch(y, x, ch, attr)
+    cdef int default_color_id = line_format[0][0]
+    cdef unsigned int default_color = (<unsigned int>curses.color_pair(default_color_id)) | (<unsigned int>attrib_map[default_color_id])
+    cdef unsigned int color, color_ready
+    cdef int pos = 0
+    cdef int start, end
+    cdef object format_part
+    cdef list spans = []
+
+    for format_part in line_format[1:]:
+        start = format_part[1]
+        end = min(<int>format_part[2], line_len)
+        if start < pos or start < 0:
+            return line_spans(line_len, normalize_format(line_format), attrib_map, color_default)
+        if start >= end:
+            continue
+        if start > pos:
+            spans.append([pos, start, default_color])
+        color = format_part[0]
+        # assuming never to have id > 65536, if value is that large its definitely attribute
+        if color >= 0x00010000:
+            # using base color because it is in message content anyway
+            color_ready = (<unsigned int>curses.color_pair(default_color_id)) | color
+        else:
+            if color > 255:   # set all colors after 255 to default color
+                color = color_default
+            color_ready = (<unsigned int>curses.color_pair(color)) | (<unsigned int>attrib_map[color])
+        spans.append([start, end, color_ready])
+        pos = end
+    if pos < line_len:
+        spans.append([pos, line_len, default_color])
+    return spans
 
 
 cpdef void draw_chat(
@@ -25,61 +56,60 @@ cpdef void draw_chat(
     int chat_selected,
     list attrib_map,
     int color_default,
+    list drawn=None,
 ):
-    cdef int num, pos
+    cdef int num
     cdef int line_idx
-    cdef object line, line_format, format_part
-    cdef int default_color_id
-    cdef unsigned int color, color_ready
-    cdef object character, format_slice
+    cdef object line, line_format, row, span
+    cdef str text
     cdef int start, end
-    cdef int fill_len
+    cdef int fill_len, shift
+    cdef bint wide
+    cdef bint track = drawn is not None and len(drawn) == h
 
     cdef int y = h
 
     # drawing from down to up
-    chat_format = chat_format[chat_index:]
     for num in range(len(chat_buffer) - chat_index):
         line_idx = chat_index + num
-        if line_idx >= len(chat_buffer):
-            break
         y = h - (num + 1)
-        if y < 0 or y >= h:
+        if y < 0:
             break
 
         line = chat_buffer[line_idx]
         if num == chat_selected - chat_index:
+            row = (line, None)
+            if track and drawn[y] == row:
+                continue
             fill_len = w - len(line)
             win_chat.insstr(y, 0, line + (" " * fill_len) + "\n", curses.color_pair(16))
         else:
-            line_format = chat_format[num]
-            default_color_id = line_format[0][0]
+            line_format = chat_format[line_idx]
+            row = (line, line_format)
+            if track and drawn[y] == row:
+                continue
             # filled with spaces so background is drawn all the way
-            default_color = curses.color_pair(default_color_id) | attrib_map[default_color_id]
-            win_chat.insstr(y, 0, " " * w + "\n", curses.color_pair(default_color_id))
-
-            for pos in range(min(len(line), w)):
-                character = line[pos]
-                for format_part in line_format[1:]:
-                    color = format_part[0]
-                    start = format_part[1]
-                    end = format_part[2]
-                    if start <= pos < end:
-                        # assuming never to have id > 65536, if value is that large its definitely attribute
-                        if color >= 0x00010000:
-                            # using base color because it is in message content anyway
-                            color_ready = curses.color_pair(default_color_id) | color
-                        else:
-                            if color > 255:   # set all colors after 255 to default color
-                                color = color_default
-                            color_ready = (<unsigned int>curses.color_pair(color)) | (<unsigned int>attrib_map[color])
-                        safe_insch(win_chat, y, pos, character, color_ready)
-                        break
-                else:
-                    safe_insch(win_chat, y, pos, character, default_color)
+            win_chat.insstr(y, 0, " " * w + "\n", curses.color_pair(line_format[0][0]))
+            # wide characters take 2 cells, so following spans are moved
+            shift = 0
+            wide = not uses_pgcurses and not line.isascii()
+            for span in line_spans(min(len(line), w), line_format, attrib_map, color_default):
+                start = span[0]
+                end = span[1]
+                if start + shift >= w:
+                    break
+                text = line[start:end]
+                win_chat.insstr(y, start + shift, text, span[2])
+                if wide:
+                    shift += len_wch(text) - len(text)
+        if track:
+            drawn[y] = row
 
     # fill empty lines with spaces so background is drawn all the way
     y -= 1
     while y >= 0:
-        win_chat.insstr(y, 0, "\n", curses.color_pair(0))
+        if not track or drawn[y] != "":
+            win_chat.insstr(y, 0, "\n", curses.color_pair(0))
+            if track:
+                drawn[y] = ""
         y -= 1
@@ -10,6 +10,8 @@ header = f"""# {utc_date}
 # http://www.unicode.org/Public/latest/ucd/extracted/DerivedGeneralCategory.txt
 # http://www.unicode.org/Public/latest/ucd/EastAsianWidth.txt
 """
+PAGE_SIZE = 256   # number of codepoints in one lookup table page
+TABLE_LINE_BYTES = 64
 
 
 def http_get_with_redirect(host, path):
@@ -118,6 +120,50 @@ def merge_codepoints_to_ranges(values):
     return ranges
 
 
+def build_lookup_table(wide):
+    """
+    Build two-level lookup table of wide codepoints.
+    Index has page number for each PAGE_SIZE codepoints, and pages have 1 for each wide codepoint.
+    Identical pages are stored once, most of them are all 0 or all 1.
+    """
+    pages = {}
+    index = bytearray()
+    for page_start in range(0, 0x110000, PAGE_SIZE):
+        page = bytes(int(cp in wide) for cp in range(page_start, page_start + PAGE_SIZE))
+        if page not in pages:
+            pages[page] = len(pages)
+        index.append(pages[page])
+    if len(pages) > 256:
+        raise ValueError("Too many unique pages for one byte index")
+    return bytes(index), b"".join(pages)
+
+
+def write_bytes(f, name, data):
+    """Write bytes as hex string literal split into multiple lines"""
+    f.write(f"{name} = bytes.fromhex(\n")
+    for num in range(0, len(data), TABLE_LINE_BYTES):
+        f.write(f'    "{data[num:num + TABLE_LINE_BYTES].hex()}"\n')
+    f.write(")\n")
+
+
+def save_wide_ranges(wide, path):
+    """Save ranges and lookup table of wide characters as python file"""
+    ranges = merge_codepoints_to_ranges(wide)
+    index, pages = build_lookup_table(wide)
+    with open(path, "w") as f:
+        f.write(header)
+        f.write("\n")
+        f.write("# [start, end) ranges of wide characters\n")
+        f.write("WIDE_RANGES = (\n")
+        for line in ranges:
+            f.write(f"    {str(line)},\n")
+        f.write(")\n\n")
+        f.write("# lookup table, character is wide if: WIDE_PAGES[WIDE_INDEX[codepoint >> 8] << 8 | (codepoint & 0xFF)] == 1\n")
+        write_bytes(f, "WIDE_INDEX", index)
+        f.write("\n")
+        write_bytes(f, "WIDE_PAGES", pages)
+
+
 def update_wide_ranged():
     """Download latest unicode data and build list of ranges of wide characters as python file"""
     # download lists
@@ -166,18 +212,9 @@ def update_wide_ranged():
                 general_wide.add(cp)
     wide |= general_wide
 
-    # convert set to merged ranges
-    ranges = merge_codepoints_to_ranges(wide)
-
     # build py file
     path = os.path.expanduser("./endcord/wide_ranges.py")
-    with open(path, "w") as f:
-        f.write(header)
-        f.write("\n")
-        f.write("WIDE_RANGES = (\n")
-        for line in ranges:
-            f.write(f"    {str(line)},\n")
-        f.write(")\n")
+    save_wide_ranges(wide, path)
 
     print(f"Wide unicode characters ranges saved to {path}")
 